@@ -1,3 +1,3 @@
-from app.agent.agent import AutonomousAgent, Context
+from app.agent.agent import AutonomousAgent, Context, RunRejectedError
 
-__all__ = ['AutonomousAgent', 'Context']
+__all__ = ['AutonomousAgent', 'Context', 'RunRejectedError']
\ No newline at end of file
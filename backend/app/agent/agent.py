@@ -1,6 +1,8 @@
+import asyncio
 import uuid
 import traceback
 import json
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import Dict, Any, Optional, AsyncGenerator
 
@@ -11,12 +13,20 @@ from langchain_openai import ChatOpenAI
 from app.models.models import AgentResponse
 from app.middleware.logger_middleware import LoggerMiddleware
 from app.middleware.memory_middleware import MemoryMiddleware
+from app.middleware.tool_result_middleware import ToolResultShapingMiddleware
+from app.tools.result_shaping import start_loading_token_encoding
 from app.skills import skill_registry
 from app.tools.registry import ToolRegistry
 from app.utils.logger import get_logger
+from app.utils.http_client import close_http_client
 from app.config.settings import settings
 from app.agent import storage
-from app.agent import stream_processor
+from app.agent.constants import PREFERENCES_NAMESPACE
+from app.agent.stream_protocol import StreamProtocol, create_stream_encoder, negotiate_protocol
+from app.agent.maintenance import StorageMaintenance
+from app.agent.stream_guard import StreamGuard
+from app.agent.resumable_stream import ResumableStreams, StreamRun
+from app.agent.run_manager import RunManager
 
 logger = get_logger(__name__)
 
@@ -27,14 +37,27 @@ class Context:
     thread_id: str
 
 
+class RunRejectedError(Exception):
+    """并发运行数已达上限且排队超时"""
+
+
 class AutonomousAgent:
     def __init__(self):
         """初始化自主决策Agent"""
         self.llm = self._initialize_llm()
         self.agent = None
+        self.storage_backend = None
+        self.maintenance = None
         self.checkpoint_saver = None
-        self.sqlite_store = None
+        self.store = None
         self.tool_registry = None
+        # 限制同一进程内并发执行的Agent运行数
+        self._run_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_RUNS)
+        # 流式响应的背压、心跳和断开取消
+        self.stream_guard = StreamGuard()
+        # 与HTTP连接解耦、可按Last-Event-ID恢复的流式运行
+        self.streams = ResumableStreams(self.stream_guard.metrics)
+        self.runs = None
 
     def _initialize_llm(self) -> ChatOpenAI:
         """初始化LLM模型"""
@@ -90,10 +113,18 @@ class AutonomousAgent:
 
     async def start_up(self) -> None:
         """初始化Agent"""
-        self.checkpoint_saver = await storage.initialize_checkpoint_saver()
-        self.sqlite_store = await storage.initialize_sqlite_store()
+        self.storage_backend = await storage.initialize_storage_backend()
+        self.checkpoint_saver = self.storage_backend.checkpointer
+        self.store = self.storage_backend.store
         
-        await storage.initialize_user_preferences(self.sqlite_store)
+        await storage.initialize_user_preferences(self.store)
+        # 多进程部署(app.serve)时只有0号工作进程执行维护和恢复上一次服务遗留的运行，避免重复执行
+        primary = settings.SERVE_WORKER_INDEX == 0
+        # 后台执行保留策略并回收空间
+        self.maintenance = StorageMaintenance(self.storage_backend)
+        if primary:
+            self.maintenance.start()
+        await self.streams.open()
         # load tools
         self.tool_registry = ToolRegistry()
         await self.tool_registry.load_tools()
@@ -104,8 +135,13 @@ class AutonomousAgent:
 
         middleware_list = [
             LoggerMiddleware(),
-            MemoryMiddleware(self.sqlite_store)
+            MemoryMiddleware(self.storage_backend)
         ]
+        # 精简天气、搜索等工具结果后再放入上下文，减少后续每一步的token数
+        if settings.TOOL_RESULT_SHAPING:
+            middleware_list.append(ToolResultShapingMiddleware(PREFERENCES_NAMESPACE))
+            # tiktoken可能需要下载编码文件，在后台线程中加载，加载前按字符数估算token
+            start_loading_token_encoding()
 
         self.agent = create_deep_agent(
             name="autonomous-agent",
@@ -116,41 +152,95 @@ class AutonomousAgent:
             response_format=AgentResponse,
             middleware=middleware_list,
             backend=self.create_backend,
-            store= self.sqlite_store,
+            store= self.store,
             checkpointer= self.checkpoint_saver,
             context_schema=Context
         )
+        # 后台运行：恢复重启前未完成的运行，重启的工作进程只恢复自己遗留的运行
+        self.runs = RunManager(self, self.store, self.streams)
+        await self.runs.start(recover=primary)
     
     async def shutdown(self) -> None:
         """关闭Agent并清理资源"""
         logger.info("Shutting down agent resources...")
-        # 清理SQLite连接
-        if hasattr(self, 'sqlite_store') and self.sqlite_store:
+        # 停止后台运行的工作者，执行中的运行保留running状态以便重启后继续
+        if self.runs:
+            await self.runs.stop()
+        # 取消仍在后台执行的流式运行
+        await self.streams.close()
+        if self.maintenance:
+            await self.maintenance.stop()
+        # 关闭MCP服务器会话
+        if self.tool_registry:
+            await self.tool_registry.close()
+        # 关闭工具共享的HTTP连接池
+        await close_http_client()
+        # 清理存储后端连接
+        if hasattr(self, 'storage_backend') and self.storage_backend:
             try:
-                # 关闭检查点保存器连接
-                if hasattr(self.checkpoint_saver, 'conn') and self.checkpoint_saver.conn:
-                    await self.checkpoint_saver.conn.close()
-                # 关闭SQLite存储连接
-                if hasattr(self.sqlite_store, 'conn') and self.sqlite_store.conn:
-                    await self.sqlite_store.conn.close()
-                logger.info("SQLite connections are closed.")
+                # 提交检查点保存器中尚未提交的写入并关闭连接
+                await self.storage_backend.close()
+                logger.info("Storage connections are closed.")
             except Exception as e:
-                logger.error(f"Error closing SQLite connections: {e}")
+                logger.error(f"Error closing storage connections: {e}")
 
 
     def run(self, goal: str, session_id: Optional[str] = None, user_id: str = "user1") -> Dict[str, Any]:
-        """同步运行Agent(非流式模式)"""
-        import asyncio
-        return asyncio.run(self.arun(goal, session_id, user_id))
+        """同步运行Agent(非流式模式)，仅用于没有事件循环的脚本环境"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.arun(goal, session_id, user_id))
+        raise RuntimeError("run() cannot be called from a running event loop, use 'await arun()' instead")
+
+    @asynccontextmanager
+    async def run_slot(self, queue_timeout: Optional[float] = None):
+        """占用一个运行槽位，超过并发上限时最多排队queue_timeout秒"""
+        if queue_timeout is None:
+            queue_timeout = settings.RUN_QUEUE_TIMEOUT
+        try:
+            await asyncio.wait_for(self._run_slots.acquire(), timeout=queue_timeout)
+        except asyncio.TimeoutError:
+            raise RunRejectedError(
+                f"Too many concurrent runs (limit {settings.MAX_CONCURRENT_RUNS}), try again later"
+            )
+        try:
+            yield
+        finally:
+            self._run_slots.release()
+
+    async def arun(
+        self,
+        goal: str,
+        session_id: Optional[str] = None,
+        user_id: str = "user1",
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """异步运行Agent(非流式模式)
 
-    async def arun(self, goal: str, session_id: Optional[str] = None, user_id: str = "user1") -> Dict[str, Any]:
-        """异步运行Agent(非流式模式)"""
+        timeout为整个请求的截止时间(秒)，包括排队等待时间，超时抛出asyncio.TimeoutError。
+        """
         thread_id = self._get_thread_id(session_id)
-        return await self.agent.ainvoke(
-            {"messages": [{"role": "user", "content": goal}]},
-            config={"configurable": {"thread_id": thread_id, "user_id": user_id}},
-            context={"user_id": user_id, "thread_id": thread_id}
-        )
+        if timeout is None:
+            timeout = settings.RUN_TIMEOUT
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        async with self.run_slot(queue_timeout=min(settings.RUN_QUEUE_TIMEOUT, timeout)):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                return await asyncio.wait_for(
+                    self.agent.ainvoke(
+                        {"messages": [{"role": "user", "content": goal}]},
+                        config={"configurable": {"thread_id": thread_id, "user_id": user_id}},
+                        context={"user_id": user_id, "thread_id": thread_id}
+                    ),
+                    timeout=remaining
+                )
+            finally:
+                await self._release_mcp_sessions(thread_id)
 
     async def run_async(
         self,
@@ -158,112 +248,77 @@ class AutonomousAgent:
         stream_mode: str = "updates",
         subgraphs: bool = True,
         session_id: Optional[str] = None,
-        user_id: str = "user1"
+        user_id: str = "user1",
+        protocol: Optional[str] = None,
+        resume: bool = False
     ) -> AsyncGenerator[str, None]:
-        """异步运行Agent(流式输出)"""
+        """异步运行Agent(流式输出)
+
+        Args:
+            protocol: 输出协议，legacy或compact，见stream_protocol
+            resume: 从线程最近的检查点继续执行被中断的运行，不再发送goal
+        """
+        encoder = create_stream_encoder(negotiate_protocol(protocol))
+        thread_id = self._get_thread_id(session_id)
         try:
-            thread_id = self._get_thread_id(session_id)
+            for event in encoder.start(thread_id):
+                yield event
 
-            logger.info(f"Calling agent.astream() with stream_mode: {stream_mode}")
+            logger.info(f"Calling agent.astream() with stream_mode: {stream_mode}, protocol: {encoder.protocol.value}")
             stream_result = self.agent.astream(
-                {"messages": [{"role": "user", "content": goal}]},
+                None if resume else {"messages": [{"role": "user", "content": goal}]},
                 stream_mode=stream_mode,
                 subgraphs=subgraphs,
                 config={"configurable": {"thread_id": thread_id, "user_id": user_id}},
                 context={"user_id": user_id, "thread_id": thread_id}
             )
 
-            # 跟踪已发送的消息ID
-            sent_message_ids = set()
-            accumulated_content = ""
-            chunk_count = 0
-
-            async for namespace, chunk in stream_result:
-                chunk_count += 1
-                logger.debug(f"Got chunk: namespace={namespace}, type={type(chunk)}, value={chunk}")
-
-                # 处理不同类型的chunk
-                if stream_mode == "messages":
-                    async for result in stream_processor.process_message_chunk(namespace, chunk):
-                        # 确保result可以被JSON序列化
-                        result = stream_processor.ensure_serializable(result)
-                        
-                        # 1. 保持原有格式输出（向后兼容）
-                        yield f"data: {json.dumps(result)}\n\n"
-                        
-                        # 2. 处理新的结构化事件格式
-                        if isinstance(result, dict):
-                            # 处理ai类型的结果（消息内容）
-                            if result.get('type') == 'ai' and result.get('content'):
-                                content = result['content']
-                                msg_id = str(id(result))  # 生成消息ID
-                                
-                                # 跳过已发送的消息
-                                if msg_id in sent_message_ids:
-                                    logger.debug(f"[Stream] Skipping duplicate message id={msg_id}")
-                                    continue
-                                
-                                # 累积内容
-                                accumulated_content += content
-                                
-                                # 发送message_delta事件
-                                yield stream_processor.create_message_delta_event(
-                                    msg_id,
-                                    content,
-                                    accumulated_content
-                                )
-                                
-                                # 标记为已发送
-                                sent_message_ids.add(msg_id)
-                elif stream_mode == "updates":
-                    result = stream_processor.process_update_chunk(namespace, chunk)
-                    # 确保result可以被JSON序列化
-                    result = stream_processor.ensure_serializable(result)
-                    
-                    # 保持原有格式输出（向后兼容）
-                    yield f"data: {json.dumps(result)}\n\n"
-                elif stream_mode == "custom":
-                    result = stream_processor.process_custom_chunk(namespace, chunk)
-                    # 确保result可以被JSON序列化
-                    result = stream_processor.ensure_serializable(result)
-                    
-                    # 保持原有格式输出（向后兼容）
-                    yield f"data: {json.dumps(result)}\n\n"
-                else:
-                    result = stream_processor.process_unknown_chunk(namespace, chunk)
-                    # 确保result可以被JSON序列化
-                    result = stream_processor.ensure_serializable(result)
-                    
-                    # 保持原有格式输出（向后兼容）
-                    yield f"data: {json.dumps(result)}\n\n"
-
-            # 3. 流结束时发送message_complete事件
-            if accumulated_content:
-                yield stream_processor.create_message_complete_event(
-                    accumulated_content,
-                    chunk_count
-                )
-            
-            # 4. 发送完成标记
-            logger.debug(f"[SSE→Client] [DONE] - Stream completed, total chunks: {chunk_count}")
-            yield "data: [DONE]\n\n"
+            try:
+                async for namespace, chunk in stream_result:
+                    logger.debug(f"Got chunk: namespace={namespace}, type={type(chunk)}, value={chunk}")
+                    for event in await encoder.encode(stream_mode, namespace, chunk):
+                        yield event
+            finally:
+                # 调用方提前关闭或取消时停止astream中仍在执行的任务
+                await stream_result.aclose()
+
+            for event in encoder.finish():
+                yield event
 
         except Exception as e:
             logger.error(f"Error in run_async: {str(e)}")
             traceback.print_exc()
             
-            # 发送错误事件
-            yield stream_processor.create_error_event(e)
-            # 发送完成标记
-            logger.debug(f"[SSE→Client] [DONE] - Stream completed with error")
-            yield "data: [DONE]\n\n"
+            # 发送错误事件和完成标记
+            for event in encoder.error(e):
+                yield event
             raise
+        finally:
+            await self._release_mcp_sessions(thread_id)
+
+    async def _release_mcp_sessions(self, thread_id: str) -> None:
+        """归还运行期间固定给该线程的MCP会话，有状态的服务器(浏览器等)在运行内保持同一会话"""
+        if self.tool_registry:
+            await self.tool_registry.release_mcp_sessions(thread_id)
+
+    def start_stream(
+        self,
+        goal: str,
+        stream_mode: str = "updates",
+        session_id: Optional[str] = None,
+        user_id: str = "user1",
+        protocol: Optional[str] = None
+    ) -> StreamRun:
+        """在后台执行run_async，返回可订阅、可按事件ID恢复的运行"""
+        thread_id = self._get_thread_id(session_id)
+        source = self.run_async(goal, stream_mode=stream_mode, session_id=thread_id, user_id=user_id, protocol=protocol)
+        return self.streams.start(source, user_id, thread_id)
 
     async def invoke(self, goal: str) -> AsyncGenerator[Dict[str, Any], None]:
         """异步运行Agent(流式输出)- 兼容api.py中的调用"""
         # 注意：此方法已过时，建议直接使用run_async获取SSE格式的输出
         # 为了向后兼容，这里仍然返回字典格式
-        async for sse_message in self.run_async(goal):
+        async for sse_message in self.run_async(goal, protocol=StreamProtocol.LEGACY.value):
             # 解析SSE消息，提取数据部分
             if sse_message.startswith('data: '):
                 data_part = sse_message[6:].strip()
@@ -274,14 +329,43 @@ class AutonomousAgent:
                     except json.JSONDecodeError:
                         logger.error(f"Failed to parse SSE message: {data_part}")
 
-    async def get_conversation_history(self, user_id: str):
-        """获取用户的所有对话线程"""
-        return await storage.get_conversation_history(self.sqlite_store, user_id)
+    async def get_conversation_history(self, user_id: str, limit: int = 50, cursor: Optional[str] = None):
+        """获取用户的对话线程摘要列表(按更新时间倒序分页)"""
+        return await storage.get_conversation_history(self.storage_backend, user_id, limit, cursor)
 
     async def get_thread_history(self, user_id: str, thread_id: str):
         """获取用户的特定对话线程"""
-        return await storage.get_thread_history(self.sqlite_store, user_id, thread_id)
+        return await storage.get_thread_history(self.storage_backend, user_id, thread_id)
 
     async def delete_thread(self, user_id: str, thread_id: str) -> bool:
         """删除用户的特定对话线程"""
-        return await storage.delete_thread(self.sqlite_store, user_id, thread_id)
+        return await storage.delete_thread(self.storage_backend, user_id, thread_id)
+
+    async def run_storage_maintenance(self) -> Dict[str, Any]:
+        """立即执行一次存储维护"""
+        return await self.maintenance.run_once()
+
+    def get_storage_maintenance_stats(self) -> Dict[str, Any]:
+        """获取存储维护的累计统计"""
+        return self.maintenance.stats.to_dict()
+
+    def get_mcp_status(self) -> Dict[str, Any]:
+        """获取MCP服务器的健康状态、重启次数和启动耗时"""
+        if self.tool_registry is None:
+            return {"servers": {}}
+        return self.tool_registry.get_mcp_status()
+
+    def get_tool_stats(self) -> Dict[str, Any]:
+        """获取工具结果精简前后的token数，以及搜索和天气缓存的统计"""
+        from app.tools.result_shaping import get_shaping_stats
+        from app.tools.search.search_service import search_service
+        from app.tools.weather_tool import weather_client
+        return {
+            "shaping": get_shaping_stats(),
+            "search": search_service.stats(),
+            "weather": weather_client.stats()
+        }
+
+    def get_stream_metrics(self) -> Dict[str, Any]:
+        """获取流式响应的累计统计(取消、背压、心跳)"""
+        return self.stream_guard.metrics.to_dict()
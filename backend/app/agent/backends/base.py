@@ -0,0 +1,134 @@
+"""
+存储后端抽象
+
+每个后端提供LangGraph检查点保存器(checkpointer)、长期记忆存储(store)，
+以及对话消息日志的读写。storage模块只依赖这里定义的接口。
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+# 线程标题取第一条用户消息的前若干字符
+THREAD_TITLE_LENGTH = 100
+
+# 线程列表单页的最大条数
+MAX_PAGE_SIZE = 500
+
+
+def thread_title(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """从第一条用户消息生成线程标题"""
+    for message in messages:
+        if message.get('type') == 'human' and isinstance(message.get('content'), str):
+            title = message['content'].strip()
+            if title:
+                return title[:THREAD_TITLE_LENGTH]
+    return None
+
+
+def clamp_page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(thread: Dict[str, Any]) -> str:
+    """线程列表分页游标：updated_at|thread_id"""
+    return f"{thread['updated_at']}|{thread['thread_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    updated_at, _, thread_id = cursor.partition('|')
+    return updated_at, thread_id
+
+
+class StorageBackend(ABC):
+    """存储后端抽象基类"""
+
+    name = "base"
+
+    def __init__(self):
+        # open()之后可用
+        self.checkpointer: Any = None
+        self.store: Any = None
+
+    @abstractmethod
+    async def open(self) -> None:
+        """建立连接并准备表结构"""
+        pass
+
+    @abstractmethod
+    async def close(self) -> None:
+        """释放连接"""
+        pass
+
+    @abstractmethod
+    async def get_thread_cursor(self, user_id: str, thread_id: str) -> Tuple[int, Optional[str]]:
+        """获取线程已持久化的消息数和最后一条消息ID"""
+        pass
+
+    @abstractmethod
+    async def append_thread_messages(self, user_id: str, thread_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """追加新消息到线程的消息日志，并更新线程元数据
+
+        Returns:
+            线程是否为新创建
+        """
+        pass
+
+    @abstractmethod
+    async def get_thread(self, user_id: str, thread_id: str) -> Optional[Dict[str, Any]]:
+        """获取线程及其全部消息
+
+        Returns:
+            {'thread_id', 'date', 'messages', 'updated_at'}，线程不存在时为None
+        """
+        pass
+
+    @abstractmethod
+    async def list_thread_summaries(
+        self,
+        user_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """按更新时间倒序列出用户的线程摘要
+
+        Returns:
+            {'threads': [...], 'next_cursor': str | None}
+        """
+        pass
+
+    @abstractmethod
+    async def delete_thread(self, user_id: str, thread_id: str) -> bool:
+        """删除线程的消息日志和元数据
+
+        Returns:
+            线程是否存在
+        """
+        pass
+
+    @abstractmethod
+    async def list_expired_threads(self, updated_before: str, limit: int = 500) -> List[Tuple[str, str]]:
+        """列出最后更新时间早于updated_before(ISO格式)的线程
+
+        Returns:
+            [(user_id, thread_id), ...]
+        """
+        pass
+
+    @abstractmethod
+    async def prune_checkpoints(self, keep_last: int) -> int:
+        """每个线程只保留最新的keep_last个检查点，同时删除被删检查点的中间写入
+
+        Returns:
+            删除的检查点数
+        """
+        pass
+
+    @abstractmethod
+    async def compact(self) -> None:
+        """回收已删除数据占用的空间"""
+        pass
+
+    @abstractmethod
+    async def storage_size(self) -> int:
+        """当前占用的存储空间(字节)，无法统计时为0"""
+        pass
@@ -0,0 +1,138 @@
+"""
+内存存储后端
+
+所有数据保存在进程内存中，进程退出即丢失。用于测试和本地调试。
+"""
+
+import copy
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.store.memory import InMemoryStore
+
+from app.agent.compact_checkpoint import create_checkpoint_serde
+from app.agent.backends.base import (
+    StorageBackend,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+    thread_title
+)
+
+
+class MemoryBackend(StorageBackend):
+    """进程内存存储后端"""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        # (user_id, thread_id) -> 线程元数据 / 消息列表
+        self._threads: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._messages: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+
+    async def open(self) -> None:
+        self.checkpointer = InMemorySaver(serde=create_checkpoint_serde())
+        self.store = InMemoryStore()
+
+    async def close(self) -> None:
+        self._threads.clear()
+        self._messages.clear()
+
+    async def get_thread_cursor(self, user_id: str, thread_id: str) -> Tuple[int, Optional[str]]:
+        meta = self._threads.get((user_id, thread_id))
+        return (meta['message_count'], meta['last_message_id']) if meta else (0, None)
+
+    async def append_thread_messages(self, user_id: str, thread_id: str, messages: List[Dict[str, Any]]) -> bool:
+        key = (user_id, thread_id)
+        now = datetime.now()
+        meta = self._threads.get(key)
+        created = meta is None
+        if created:
+            meta = self._threads[key] = {
+                'thread_id': thread_id,
+                'title': None,
+                'created_at': now.isoformat(),
+                'message_count': 0,
+                'last_message_id': None
+            }
+            self._messages[key] = []
+
+        self._messages[key].extend(copy.deepcopy(messages))
+        meta['title'] = meta['title'] or thread_title(messages)
+        meta['date'] = now.strftime('%Y-%m-%d')
+        meta['updated_at'] = now.isoformat()
+        meta['message_count'] += len(messages)
+        if messages and messages[-1].get('id'):
+            meta['last_message_id'] = messages[-1]['id']
+        return created
+
+    async def get_thread(self, user_id: str, thread_id: str) -> Optional[Dict[str, Any]]:
+        meta = self._threads.get((user_id, thread_id))
+        if not meta:
+            return None
+        return {
+            'thread_id': thread_id,
+            'date': meta['date'],
+            'messages': copy.deepcopy(self._messages[(user_id, thread_id)]),
+            'updated_at': meta['updated_at']
+        }
+
+    async def list_thread_summaries(
+        self,
+        user_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        limit = clamp_page_size(limit)
+        threads = sorted(
+            (meta for (owner, _), meta in self._threads.items() if owner == user_id),
+            key=lambda meta: (meta['updated_at'], meta['thread_id']),
+            reverse=True
+        )
+        if cursor:
+            position = decode_cursor(cursor)
+            threads = [meta for meta in threads if (meta['updated_at'], meta['thread_id']) < position]
+
+        page = [
+            {key: meta[key] for key in ('thread_id', 'title', 'message_count', 'date', 'updated_at')}
+            for meta in threads[:limit]
+        ]
+        next_cursor = encode_cursor(page[-1]) if len(threads) > limit else None
+        return {'threads': page, 'next_cursor': next_cursor}
+
+    async def delete_thread(self, user_id: str, thread_id: str) -> bool:
+        self._messages.pop((user_id, thread_id), None)
+        return self._threads.pop((user_id, thread_id), None) is not None
+
+    async def list_expired_threads(self, updated_before: str, limit: int = 500) -> List[Tuple[str, str]]:
+        expired = [key for key, meta in self._threads.items() if meta['updated_at'] < updated_before]
+        return expired[:limit]
+
+    async def prune_checkpoints(self, keep_last: int) -> int:
+        saver = self.checkpointer
+        removed = 0
+        for thread_id, namespaces in saver.storage.items():
+            for checkpoint_ns, checkpoints in namespaces.items():
+                for checkpoint_id in sorted(checkpoints, reverse=True)[max(1, keep_last):]:
+                    del checkpoints[checkpoint_id]
+                    saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                    removed += 1
+
+        # 删除不再被任何检查点引用的通道值
+        referenced = set()
+        for thread_id, namespaces in saver.storage.items():
+            for checkpoint_ns, checkpoints in namespaces.items():
+                for checkpoint, _, _ in checkpoints.values():
+                    versions = saver.serde.loads_typed(checkpoint)['channel_versions']
+                    referenced.update((thread_id, checkpoint_ns, channel, version) for channel, version in versions.items())
+        for key in [key for key in saver.blobs if key not in referenced]:
+            del saver.blobs[key]
+        return removed
+
+    async def compact(self) -> None:
+        pass
+
+    async def storage_size(self) -> int:
+        return 0
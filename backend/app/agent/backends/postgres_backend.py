@@ -0,0 +1,289 @@
+"""
+Postgres存储后端
+
+检查点、记忆和对话消息日志保存在同一个Postgres数据库中，多个API工作进程
+可以共享同一份数据。需要安装可选依赖：
+
+    pip install langgraph-checkpoint-postgres "psycopg[binary,pool]"
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.agent.backends.base import (
+    StorageBackend,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+    thread_title
+)
+from app.agent.compact_checkpoint import create_checkpoint_serde
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CONVERSATION_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS conversation_threads (
+        user_id TEXT NOT NULL,
+        thread_id TEXT NOT NULL,
+        title TEXT,
+        date TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        last_message_id TEXT,
+        PRIMARY KEY (user_id, thread_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS conversation_messages (
+        user_id TEXT NOT NULL,
+        thread_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        message_id TEXT,
+        message JSONB NOT NULL,
+        PRIMARY KEY (user_id, thread_id, seq)
+    )""",
+    """CREATE INDEX IF NOT EXISTS conversation_threads_updated_idx
+        ON conversation_threads (user_id, updated_at DESC, thread_id DESC)""",
+]
+
+# 每个(thread_id, checkpoint_ns)只保留最新的若干检查点，随后删除不再被引用的中间写入和通道值
+PRUNE_CHECKPOINTS_SQL = """
+    DELETE FROM checkpoints c
+    USING (
+        SELECT thread_id, checkpoint_ns, checkpoint_id, ROW_NUMBER() OVER (
+            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+        ) AS position
+        FROM checkpoints
+    ) ranked
+    WHERE c.thread_id = ranked.thread_id
+      AND c.checkpoint_ns = ranked.checkpoint_ns
+      AND c.checkpoint_id = ranked.checkpoint_id
+      AND ranked.position > %s
+"""
+
+DELETE_ORPHAN_WRITES_SQL = """
+    DELETE FROM checkpoint_writes w WHERE NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = w.thread_id
+          AND c.checkpoint_ns = w.checkpoint_ns
+          AND c.checkpoint_id = w.checkpoint_id
+    )
+"""
+
+DELETE_ORPHAN_BLOBS_SQL = """
+    DELETE FROM checkpoint_blobs b WHERE NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = b.thread_id
+          AND c.checkpoint_ns = b.checkpoint_ns
+          AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+    )
+"""
+
+MAINTAINED_TABLES = [
+    "checkpoints", "checkpoint_blobs", "checkpoint_writes",
+    "store", "conversation_threads", "conversation_messages",
+]
+
+
+class PostgresBackend(StorageBackend):
+    """基于Postgres连接池的存储后端"""
+
+    name = "postgres"
+
+    def __init__(self, database_url: Optional[str] = None, pool_size: Optional[int] = None):
+        super().__init__()
+        self.database_url = database_url or settings.DATABASE_URL
+        if not self.database_url:
+            raise ValueError("DATABASE_URL is not set in settings")
+        self.pool_size = pool_size or settings.POSTGRES_POOL_SIZE
+
+        # 尝试导入Postgres相关库
+        try:
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+            from langgraph.store.postgres.aio import AsyncPostgresStore
+            from psycopg.rows import dict_row
+            from psycopg.types.json import Jsonb
+            from psycopg_pool import AsyncConnectionPool
+        except ImportError:
+            raise ImportError(
+                "Postgres storage backend dependencies are not installed. "
+                "Please run 'pip install langgraph-checkpoint-postgres \"psycopg[binary,pool]\"'"
+            )
+        self.AsyncPostgresSaver = AsyncPostgresSaver
+        self.AsyncPostgresStore = AsyncPostgresStore
+        self.AsyncConnectionPool = AsyncConnectionPool
+        self.Jsonb = Jsonb
+        self.dict_row = dict_row
+        self.pool = None
+
+    async def open(self) -> None:
+        # LangGraph的Postgres实现要求自动提交、禁用预处理语句并返回字典行
+        self.pool = self.AsyncConnectionPool(
+            self.database_url,
+            min_size=1,
+            max_size=self.pool_size,
+            kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": self.dict_row},
+            open=False
+        )
+        await self.pool.open()
+
+        # Postgres按通道版本保存通道值，本身就是增量的，这里只启用压缩
+        self.checkpointer = self.AsyncPostgresSaver(self.pool, serde=create_checkpoint_serde())
+        self.store = self.AsyncPostgresStore(self.pool)
+        if settings.RUN_MIGRATIONS_ON_STARTUP:
+            await self.checkpointer.setup()
+            await self.store.setup()
+            async with self.pool.connection() as conn:
+                async with conn.transaction():
+                    for statement in CONVERSATION_SCHEMA:
+                        await conn.execute(statement)
+        logger.info("Initialized Postgres storage backend")
+
+    async def close(self) -> None:
+        if self.pool:
+            await self.pool.close()
+
+    async def get_thread_cursor(self, user_id: str, thread_id: str) -> Tuple[int, Optional[str]]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT message_count, last_message_id FROM conversation_threads WHERE user_id = %s AND thread_id = %s",
+                (user_id, thread_id)
+            )
+            row = await cur.fetchone()
+        return (row['message_count'], row['last_message_id']) if row else (0, None)
+
+    async def append_thread_messages(self, user_id: str, thread_id: str, messages: List[Dict[str, Any]]) -> bool:
+        now = datetime.now()
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                # 先插入空线程再加行锁，多个工作进程并发追加同一线程时按顺序分配seq
+                cur = await conn.execute(
+                    """INSERT INTO conversation_threads
+                       (user_id, thread_id, title, date, created_at, updated_at, message_count)
+                       VALUES (%s, %s, %s, %s, %s, %s, 0)
+                       ON CONFLICT (user_id, thread_id) DO NOTHING""",
+                    (user_id, thread_id, thread_title(messages), now.strftime('%Y-%m-%d'),
+                     now.isoformat(), now.isoformat())
+                )
+                created = cur.rowcount == 1
+                cur = await conn.execute(
+                    "SELECT message_count FROM conversation_threads WHERE user_id = %s AND thread_id = %s FOR UPDATE",
+                    (user_id, thread_id)
+                )
+                seq = (await cur.fetchone())['message_count']
+
+                if messages:
+                    async with conn.cursor() as cur:
+                        await cur.executemany(
+                            """INSERT INTO conversation_messages (user_id, thread_id, seq, message_id, message)
+                               VALUES (%s, %s, %s, %s, %s)""",
+                            [
+                                (user_id, thread_id, seq + i, message.get('id'), self.Jsonb(message))
+                                for i, message in enumerate(messages)
+                            ]
+                        )
+                last_message_id = messages[-1].get('id') if messages else None
+                await conn.execute(
+                    """UPDATE conversation_threads
+                       SET title = COALESCE(title, %s), date = %s, updated_at = %s, message_count = message_count + %s,
+                           last_message_id = COALESCE(%s, last_message_id)
+                       WHERE user_id = %s AND thread_id = %s""",
+                    (thread_title(messages), now.strftime('%Y-%m-%d'), now.isoformat(), len(messages),
+                     last_message_id, user_id, thread_id)
+                )
+        return created
+
+    async def get_thread(self, user_id: str, thread_id: str) -> Optional[Dict[str, Any]]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT date, updated_at FROM conversation_threads WHERE user_id = %s AND thread_id = %s",
+                (user_id, thread_id)
+            )
+            meta = await cur.fetchone()
+            if not meta:
+                return None
+            cur = await conn.execute(
+                "SELECT message FROM conversation_messages WHERE user_id = %s AND thread_id = %s ORDER BY seq",
+                (user_id, thread_id)
+            )
+            rows = await cur.fetchall()
+        return {
+            'thread_id': thread_id,
+            'date': meta['date'],
+            'messages': [row['message'] for row in rows],
+            'updated_at': meta['updated_at']
+        }
+
+    async def list_thread_summaries(
+        self,
+        user_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        limit = clamp_page_size(limit)
+        params: List[Any] = [user_id]
+        where = "user_id = %s"
+        if cursor:
+            where += " AND (updated_at, thread_id) < (%s, %s)"
+            params += list(decode_cursor(cursor))
+
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                f"""SELECT thread_id, title, message_count, date, updated_at
+                    FROM conversation_threads
+                    WHERE {where}
+                    ORDER BY updated_at DESC, thread_id DESC
+                    LIMIT %s""",
+                (*params, limit + 1)
+            )
+            rows = await cur.fetchall()
+
+        threads = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(threads[-1]) if len(rows) > limit else None
+        return {'threads': threads, 'next_cursor': next_cursor}
+
+    async def delete_thread(self, user_id: str, thread_id: str) -> bool:
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "DELETE FROM conversation_messages WHERE user_id = %s AND thread_id = %s",
+                    (user_id, thread_id)
+                )
+                cur = await conn.execute(
+                    "DELETE FROM conversation_threads WHERE user_id = %s AND thread_id = %s",
+                    (user_id, thread_id)
+                )
+        return cur.rowcount > 0
+
+    async def list_expired_threads(self, updated_before: str, limit: int = 500) -> List[Tuple[str, str]]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT user_id, thread_id FROM conversation_threads WHERE updated_at < %s LIMIT %s",
+                (updated_before, limit)
+            )
+            return [(row['user_id'], row['thread_id']) for row in await cur.fetchall()]
+
+    async def prune_checkpoints(self, keep_last: int) -> int:
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                cur = await conn.execute(PRUNE_CHECKPOINTS_SQL, (max(1, keep_last),))
+                removed = cur.rowcount
+                await conn.execute(DELETE_ORPHAN_WRITES_SQL)
+                await conn.execute(DELETE_ORPHAN_BLOBS_SQL)
+        return removed
+
+    async def compact(self) -> None:
+        # 普通VACUUM不锁表，释放的空间由表自身复用
+        async with self.pool.connection() as conn:
+            for table in MAINTAINED_TABLES:
+                await conn.execute(f"VACUUM (ANALYZE) {table}")
+
+    async def storage_size(self) -> int:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                """SELECT COALESCE(SUM(pg_total_relation_size(oid)), 0) AS size
+                   FROM pg_class WHERE relkind = 'r' AND relname = ANY(%s)""",
+                (MAINTAINED_TABLES,)
+            )
+            return int((await cur.fetchone())['size'])
@@ -0,0 +1,285 @@
+"""
+SQLite存储后端
+
+检查点和记忆分别保存在两个本地数据库文件中，使用调优的连接层
+(sqlite_connection)和版本化迁移(migrations)。适合单进程部署。
+"""
+
+import json
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from app.agent import migrations
+from app.agent.backends.base import (
+    StorageBackend,
+    clamp_page_size,
+    decode_cursor,
+    encode_cursor,
+    thread_title
+)
+from app.agent.compact_checkpoint import CompactSqliteSaver, create_checkpoint_serde
+from app.agent.sqlite_connection import (
+    SqliteConfig,
+    SqliteReadPool,
+    TunedSqliteStore,
+    connect
+)
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _file_size(path: str) -> int:
+    """数据库文件及其WAL文件的大小"""
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+async def compact_connection(conn: aiosqlite.Connection, lock, min_free_bytes: int) -> None:
+    """空闲页超过min_free_bytes时执行VACUUM，并截断WAL文件"""
+    async with lock:
+        if conn.in_transaction:
+            await conn.commit()
+        async with conn.execute("PRAGMA freelist_count") as cur:
+            free_pages = (await cur.fetchone())[0]
+        async with conn.execute("PRAGMA page_size") as cur:
+            page_size = (await cur.fetchone())[0]
+        if free_pages * page_size >= min_free_bytes:
+            await conn.execute("VACUUM")
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def ensure_schema(conn: aiosqlite.Connection, migration_list: list, migrate, path: str) -> None:
+    """启动时执行未完成的迁移；关闭自动迁移时只检查版本，请求处理中不再做迁移检查"""
+    if settings.RUN_MIGRATIONS_ON_STARTUP:
+        await migrate(conn)
+        return
+    if conn.in_transaction:
+        await conn.commit()
+    version = await migrations.get_schema_version(conn)
+    latest = migration_list[-1].version
+    if version < latest:
+        logger.warning(
+            f"{path} is at schema version {version}, latest is {latest}. "
+            f"Run 'python -m app.agent.migrations' before serving requests."
+        )
+
+
+class SqliteBackend(StorageBackend):
+    """基于本地SQLite文件的存储后端"""
+
+    name = "sqlite"
+
+    def __init__(self, checkpoints_path: Optional[str] = None, memories_path: Optional[str] = None):
+        super().__init__()
+        self.checkpoints_path = checkpoints_path or settings.CHECKPOINTS_PATH
+        self.memories_path = memories_path or settings.MEMORIES_PATH
+        self.config = SqliteConfig.from_settings()
+
+    async def open(self) -> None:
+        self.checkpointer = await self._open_checkpointer()
+        self.store = await self._open_store()
+
+    async def _open_checkpointer(self) -> CompactSqliteSaver:
+        os.makedirs(os.path.dirname(self.checkpoints_path), exist_ok=True)
+        # 检查点连接使用隐式事务，以便按步骤分组提交
+        conn = await connect(self.checkpoints_path, self.config, isolation_level="DEFERRED")
+        saver = CompactSqliteSaver(
+            conn,
+            config=self.config,
+            delta_encoding=settings.CHECKPOINT_DELTA_ENCODING,
+            keep_last=settings.CHECKPOINT_KEEP_LAST if settings.CHECKPOINT_PRUNE_ON_WRITE else 0,
+            prune_interval=settings.CHECKPOINT_PRUNE_INTERVAL,
+            serde=create_checkpoint_serde()
+        )
+        await ensure_schema(conn, migrations.CHECKPOINT_MIGRATIONS, migrations.migrate_checkpoints, self.checkpoints_path)
+        logger.info(f"Initialized SQLite checkpoints store at: {self.checkpoints_path}")
+        return saver
+
+    async def _open_store(self) -> TunedSqliteStore:
+        os.makedirs(os.path.dirname(self.memories_path), exist_ok=True)
+        conn = await connect(self.memories_path, self.config)
+        read_pool = SqliteReadPool(self.memories_path, self.config)
+        store = TunedSqliteStore(conn, read_pool=read_pool)
+        await store.setup()
+        await ensure_schema(conn, migrations.MEMORY_MIGRATIONS, migrations.migrate_memories, self.memories_path)
+        await read_pool.open()
+        logger.info(f"Initialized SQLite store at: {self.memories_path}")
+        return store
+
+    async def close(self) -> None:
+        if self.checkpointer:
+            await self.checkpointer.aclose()
+        if self.store:
+            await self.store.aclose()
+
+    @asynccontextmanager
+    async def read_connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """获取读连接：优先使用只读连接池，否则在存储锁内使用写连接"""
+        read_pool = getattr(self.store, 'read_pool', None)
+        if read_pool:
+            async with read_pool.connection() as conn:
+                yield conn
+        else:
+            async with self.store.lock:
+                yield self.store.conn
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Cursor]:
+        """在存储锁内开启一个事务，与AsyncSqliteStore自身的事务互斥"""
+        async with self.store.lock:
+            conn = self.store.conn
+            if conn.in_transaction:
+                await conn.commit()
+            await conn.execute("BEGIN")
+            try:
+                async with conn.cursor() as cur:
+                    yield cur
+            except BaseException:
+                await conn.rollback()
+                raise
+            await conn.commit()
+
+    async def get_thread_cursor(self, user_id: str, thread_id: str) -> Tuple[int, Optional[str]]:
+        async with self.read_connection() as conn:
+            async with conn.execute(
+                "SELECT message_count, last_message_id FROM conversation_threads WHERE user_id = ? AND thread_id = ?",
+                (user_id, thread_id)
+            ) as cur:
+                row = await cur.fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    async def append_thread_messages(self, user_id: str, thread_id: str, messages: List[Dict[str, Any]]) -> bool:
+        now = datetime.now()
+        async with self.transaction() as cur:
+            await cur.execute(
+                "SELECT message_count FROM conversation_threads WHERE user_id = ? AND thread_id = ?",
+                (user_id, thread_id)
+            )
+            row = await cur.fetchone()
+            created = row is None
+            seq = 0 if created else row[0]
+
+            if messages:
+                await cur.executemany(
+                    "INSERT INTO conversation_messages (user_id, thread_id, seq, message_id, message) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (user_id, thread_id, seq + i, message.get('id'), json.dumps(message, ensure_ascii=False))
+                        for i, message in enumerate(messages)
+                    ]
+                )
+            last_message_id = messages[-1].get('id') if messages else None
+
+            if created:
+                await cur.execute(
+                    """INSERT INTO conversation_threads
+                       (user_id, thread_id, title, date, created_at, updated_at, message_count, last_message_id)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (user_id, thread_id, thread_title(messages), now.strftime('%Y-%m-%d'), now.isoformat(),
+                     now.isoformat(), len(messages), last_message_id)
+                )
+            else:
+                await cur.execute(
+                    """UPDATE conversation_threads
+                       SET title = COALESCE(title, ?), date = ?, updated_at = ?, message_count = message_count + ?,
+                           last_message_id = COALESCE(?, last_message_id)
+                       WHERE user_id = ? AND thread_id = ?""",
+                    (thread_title(messages), now.strftime('%Y-%m-%d'), now.isoformat(), len(messages),
+                     last_message_id, user_id, thread_id)
+                )
+        return created
+
+    async def get_thread(self, user_id: str, thread_id: str) -> Optional[Dict[str, Any]]:
+        async with self.read_connection() as conn:
+            async with conn.execute(
+                "SELECT date, updated_at FROM conversation_threads WHERE user_id = ? AND thread_id = ?",
+                (user_id, thread_id)
+            ) as cur:
+                meta = await cur.fetchone()
+            if not meta:
+                return None
+            async with conn.execute(
+                "SELECT message FROM conversation_messages WHERE user_id = ? AND thread_id = ? ORDER BY seq",
+                (user_id, thread_id)
+            ) as cur:
+                rows = await cur.fetchall()
+        return {
+            'thread_id': thread_id,
+            'date': meta[0],
+            'messages': [json.loads(row[0]) for row in rows],
+            'updated_at': meta[1]
+        }
+
+    async def list_thread_summaries(
+        self,
+        user_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        limit = clamp_page_size(limit)
+        params: List[Any] = [user_id]
+        where = "user_id = ?"
+        if cursor:
+            cursor_updated_at, cursor_thread_id = decode_cursor(cursor)
+            where += " AND (updated_at < ? OR (updated_at = ? AND thread_id < ?))"
+            params += [cursor_updated_at, cursor_updated_at, cursor_thread_id]
+
+        async with self.read_connection() as conn:
+            async with conn.execute(
+                f"""SELECT thread_id, title, message_count, date, updated_at
+                    FROM conversation_threads
+                    WHERE {where}
+                    ORDER BY updated_at DESC, thread_id DESC
+                    LIMIT ?""",
+                (*params, limit + 1)
+            ) as cur:
+                rows = await cur.fetchall()
+
+        threads = [
+            {
+                'thread_id': row[0],
+                'title': row[1],
+                'message_count': row[2],
+                'date': row[3],
+                'updated_at': row[4]
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = encode_cursor(threads[-1]) if len(rows) > limit else None
+        return {'threads': threads, 'next_cursor': next_cursor}
+
+    async def delete_thread(self, user_id: str, thread_id: str) -> bool:
+        async with self.transaction() as cur:
+            await cur.execute(
+                "DELETE FROM conversation_messages WHERE user_id = ? AND thread_id = ?",
+                (user_id, thread_id)
+            )
+            await cur.execute(
+                "DELETE FROM conversation_threads WHERE user_id = ? AND thread_id = ?",
+                (user_id, thread_id)
+            )
+            return cur.rowcount > 0
+
+    async def list_expired_threads(self, updated_before: str, limit: int = 500) -> List[Tuple[str, str]]:
+        async with self.read_connection() as conn:
+            async with conn.execute(
+                "SELECT user_id, thread_id FROM conversation_threads WHERE updated_at < ? LIMIT ?",
+                (updated_before, limit)
+            ) as cur:
+                return [(row[0], row[1]) for row in await cur.fetchall()]
+
+    async def prune_checkpoints(self, keep_last: int) -> int:
+        return await self.checkpointer.aprune(keep_last)
+
+    async def compact(self) -> None:
+        min_free_bytes = settings.STORAGE_VACUUM_MIN_FREE_BYTES
+        await self.checkpointer.aflush()
+        await compact_connection(self.checkpointer.conn, self.checkpointer.lock, min_free_bytes)
+        await compact_connection(self.store.conn, self.store.lock, min_free_bytes)
+
+    async def storage_size(self) -> int:
+        return _file_size(self.checkpoints_path) + _file_size(self.memories_path)
@@ -0,0 +1,310 @@
+"""
+紧凑检查点
+
+在TunedSqliteSaver之上减少长线程的检查点体积：
+- 压缩：序列化结果超过阈值时用zlib或zstd压缩，类型标记加上"+zlib"/"+zstd"
+  后缀，未压缩的旧数据照常读取
+- 增量编码：通道值按(channel, version)单独保存在checkpoint_blobs表中，检查点
+  本身只保存通道版本；每一步只写入版本发生变化的通道
+- 保留最新N个：写入检查点时删除同一线程中更早的检查点、中间写入和不再被引用的
+  通道值，使磁盘占用和恢复延迟不随线程长度增长
+"""
+
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import aiosqlite
+from langgraph.checkpoint.base import CheckpointTuple
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from app.agent.sqlite_connection import SqliteConfig, TunedSqliteSaver
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+COMPRESSION_ALGORITHMS = ("zlib", "zstd")
+
+CHECKPOINT_BLOBS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        channel TEXT NOT NULL,
+        version TEXT NOT NULL,
+        type TEXT NOT NULL,
+        blob BLOB,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+    )
+"""
+
+# 每个(thread_id, checkpoint_ns)只保留最新的若干检查点，checkpoint_id按时间递增
+PRUNE_CHECKPOINTS_SQL = """
+    DELETE FROM checkpoints WHERE rowid IN (
+        SELECT rowid FROM (
+            SELECT rowid, ROW_NUMBER() OVER (
+                PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+            ) AS position
+            FROM checkpoints
+        ) WHERE position > ?
+    )
+"""
+
+DELETE_ORPHAN_WRITES_SQL = """
+    DELETE FROM writes WHERE NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = writes.thread_id
+          AND c.checkpoint_ns = writes.checkpoint_ns
+          AND c.checkpoint_id = writes.checkpoint_id
+    )
+"""
+
+
+class CompressedSerializer(SerializerProtocol):
+    """为序列化结果增加压缩的序列化器"""
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        algorithm: Optional[str] = "zlib",
+        min_size: int = 1024,
+        level: Optional[int] = None
+    ):
+        self.serde = serde or JsonPlusSerializer()
+        self.algorithm = algorithm if algorithm in COMPRESSION_ALGORITHMS else None
+        self.min_size = min_size
+        self.level = level
+        self._zstd = None
+        if self.algorithm == "zstd":
+            self._zstd = self._import_zstd()
+
+    @staticmethod
+    def _import_zstd():
+        # 尝试导入zstandard库
+        try:
+            import zstandard
+            return zstandard
+        except ImportError:
+            raise ImportError("zstandard library is not installed. Please run 'pip install zstandard'")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.algorithm == "zstd":
+            return self._zstd.ZstdCompressor(level=self.level or 3).compress(data)
+        return zlib.compress(data, self.level if self.level is not None else 6)
+
+    def _decompress(self, algorithm: str, data: bytes) -> bytes:
+        if algorithm == "zstd":
+            if self._zstd is None:
+                self._zstd = self._import_zstd()
+            return self._zstd.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if self.algorithm and data and len(data) >= self.min_size:
+            compressed = self._compress(data)
+            if len(compressed) < len(data):
+                return f"{type_}+{self.algorithm}", compressed
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        base, _, algorithm = type_.rpartition("+")
+        if base and algorithm in COMPRESSION_ALGORITHMS:
+            return self.serde.loads_typed((base, self._decompress(algorithm, payload)))
+        return self.serde.loads_typed(data)
+
+
+def create_checkpoint_serde() -> Optional[SerializerProtocol]:
+    """根据配置创建检查点序列化器，未启用压缩时返回None(使用默认序列化器)"""
+    algorithm = settings.CHECKPOINT_COMPRESSION.lower()
+    if algorithm in ("", "none"):
+        return None
+    if algorithm not in COMPRESSION_ALGORITHMS:
+        raise ValueError(f"Unsupported checkpoint compression: {algorithm}")
+    return CompressedSerializer(algorithm=algorithm, min_size=settings.CHECKPOINT_COMPRESSION_MIN_BYTES)
+
+
+class CompactSqliteSaver(TunedSqliteSaver):
+    """支持增量编码和保留最新N个检查点的SQLite检查点保存器"""
+
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        config: Optional[SqliteConfig] = None,
+        delta_encoding: bool = False,
+        keep_last: int = 0,
+        prune_interval: int = 1,
+        **kwargs: Any
+    ):
+        super().__init__(conn, config=config, **kwargs)
+        self.delta_encoding = delta_encoding
+        # 0表示保留全部检查点
+        self.keep_last = keep_last
+        # 每个线程每写入prune_interval个检查点清理一次，线程中最多多保留prune_interval-1个
+        self.prune_interval = max(1, prune_interval)
+        # (thread_id, checkpoint_ns) -> 上次清理后写入的检查点数
+        self._unpruned: Dict[Tuple[str, str], int] = {}
+
+    async def setup(self) -> None:
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            await self.conn.execute(CHECKPOINT_BLOBS_SCHEMA)
+            await self.conn.commit()
+
+    async def aput(self, config: Any, checkpoint: Any, metadata: Any, new_versions: Any) -> Any:
+        await self.setup()
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        if self.delta_encoding:
+            async with self.lock, self.conn.cursor() as cur:
+                await self._write_channel_blobs(cur, thread_id, checkpoint_ns, checkpoint, new_versions)
+            checkpoint = {**checkpoint, "channel_values": {}}
+        if self.keep_last > 0 and self._due_for_pruning(thread_id, checkpoint_ns):
+            async with self.lock, self.conn.cursor() as cur:
+                await self._prune_thread(cur, thread_id, checkpoint_ns, checkpoint)
+        # 父类写入检查点后提交，通道值和清理一并提交
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    def _due_for_pruning(self, thread_id: str, checkpoint_ns: str) -> bool:
+        """清理会读取线程的全部检查点，按写入次数分摊"""
+        key = (thread_id, checkpoint_ns)
+        count = self._unpruned.get(key, 0) + 1
+        if count < self.prune_interval:
+            self._unpruned[key] = count
+            return False
+        self._unpruned.pop(key, None)
+        return True
+
+    async def _write_channel_blobs(
+        self,
+        cur: aiosqlite.Cursor,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint: Dict[str, Any],
+        new_versions: Dict[str, Any]
+    ) -> None:
+        """写入版本变化的通道值；未变化的通道只在缺少对应版本时补写(例如刚启用增量编码)"""
+        values = checkpoint["channel_values"]
+        versions = checkpoint["channel_versions"]
+        unchanged = [channel for channel in values if channel not in new_versions]
+        existing: Set[Tuple[str, str]] = set()
+        if unchanged:
+            await cur.execute(
+                f"""SELECT channel, version FROM checkpoint_blobs
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND channel IN ({','.join('?' * len(unchanged))})""",
+                (thread_id, checkpoint_ns, *unchanged)
+            )
+            existing = set(await cur.fetchall())
+        rows = [
+            (thread_id, checkpoint_ns, channel, str(versions[channel]), *self.serde.dumps_typed(value))
+            for channel, value in values.items()
+            if channel in new_versions or (channel, str(versions[channel])) not in existing
+        ]
+        if rows:
+            await cur.executemany(
+                "INSERT OR REPLACE INTO checkpoint_blobs (thread_id, checkpoint_ns, channel, version, type, blob) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    async def _prune_thread(self, cur: aiosqlite.Cursor, thread_id: str, checkpoint_ns: str, checkpoint: Dict[str, Any]) -> None:
+        """为即将写入的检查点腾出位置，线程中只保留最新的keep_last个"""
+        await cur.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?",
+            (thread_id, checkpoint_ns, max(0, self.keep_last - 1))
+        )
+        row = await cur.fetchone()
+        if not row:
+            return
+        params = (thread_id, checkpoint_ns, row[0])
+        await cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <= ?", params)
+        await cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <= ?", params)
+        await self._delete_unreferenced_blobs(cur, thread_id, checkpoint_ns, extra_versions=checkpoint["channel_versions"])
+
+    async def _delete_unreferenced_blobs(
+        self,
+        cur: aiosqlite.Cursor,
+        thread_id: str,
+        checkpoint_ns: str,
+        extra_versions: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """删除线程中不再被任何检查点引用的通道值"""
+        await cur.execute(
+            "SELECT channel, version FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns)
+        )
+        stored = await cur.fetchall()
+        if not stored:
+            return
+        referenced = {(channel, str(version)) for channel, version in (extra_versions or {}).items()}
+        await cur.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns)
+        )
+        for type_, data in await cur.fetchall():
+            versions = self.serde.loads_typed((type_, data))["channel_versions"]
+            referenced.update((channel, str(version)) for channel, version in versions.items())
+        unreferenced = [(thread_id, checkpoint_ns, channel, version) for channel, version in stored if (channel, version) not in referenced]
+        if unreferenced:
+            await cur.executemany(
+                "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                unreferenced
+            )
+
+    async def _load_channel_values(self, cur: aiosqlite.Cursor, result: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        """从checkpoint_blobs补全增量编码检查点的通道值"""
+        if result is None:
+            return None
+        checkpoint = result.checkpoint
+        values = checkpoint["channel_values"]
+        missing = [(channel, str(version)) for channel, version in checkpoint["channel_versions"].items() if channel not in values]
+        if not missing:
+            return result
+        configurable = result.config["configurable"]
+        await cur.execute(
+            f"""SELECT channel, type, blob FROM checkpoint_blobs
+                WHERE thread_id = ? AND checkpoint_ns = ? AND ({' OR '.join(['(channel = ? AND version = ?)'] * len(missing))})""",
+            (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""), *[item for pair in missing for item in pair])
+        )
+        for channel, type_, blob in await cur.fetchall():
+            if type_ != "empty":
+                values[channel] = self.serde.loads_typed((type_, blob))
+        return result
+
+    async def aget_tuple(self, config: Any) -> Optional[CheckpointTuple]:
+        result = await super().aget_tuple(config)
+        async with self.lock, self.conn.cursor() as cur:
+            return await self._load_channel_values(cur, result)
+
+    async def alist(self, config: Any, *, filter: Any = None, before: Any = None, limit: Any = None) -> AsyncIterator[CheckpointTuple]:
+        # 父类在迭代期间持有锁，这里直接使用连接
+        async for result in super().alist(config, filter=filter, before=before, limit=limit):
+            async with self.conn.cursor() as cur:
+                yield await self._load_channel_values(cur, result)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.setup()
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self.conn.execute("DELETE FROM checkpoint_blobs WHERE thread_id = ?", (str(thread_id),))
+            await self.conn.commit()
+
+    async def aprune(self, keep_last: int) -> int:
+        """所有线程只保留最新的keep_last个检查点
+
+        Returns:
+            删除的检查点数
+        """
+        await self.setup()
+        await self.aflush()
+        async with self.lock, self.conn.cursor() as cur:
+            await cur.execute(PRUNE_CHECKPOINTS_SQL, (max(1, keep_last),))
+            removed = cur.rowcount
+            await cur.execute(DELETE_ORPHAN_WRITES_SQL)
+            await cur.execute("SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoint_blobs")
+            for thread_id, checkpoint_ns in await cur.fetchall():
+                await self._delete_unreferenced_blobs(cur, thread_id, checkpoint_ns)
+            await self.conn.commit()
+        return removed
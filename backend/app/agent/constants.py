@@ -1,4 +1,7 @@
-CHECKPOINTS_PATH = "./persistence/checkpoints/checkpoints.db"
-MEMORIES_PATH = "./persistence/memory/memories.db"
+from app.config.settings import settings
+
+CHECKPOINTS_PATH = settings.CHECKPOINTS_PATH
+MEMORIES_PATH = settings.MEMORIES_PATH
 CONVERSATIONS_NAMESPACE = ("memories", "conversations")
 PREFERENCES_NAMESPACE = ("memories", "preferences")
+RUNS_NAMESPACE = ("runs",)
@@ -0,0 +1,141 @@
+"""
+存储维护
+
+后台定期执行保留策略并回收空间：
+- 删除超过THREAD_RETENTION_DAYS天未更新的线程(连同检查点)
+- 每个线程只保留最新的CHECKPOINT_KEEP_LAST个检查点
+- 压缩数据库(SQLite执行VACUUM并截断WAL，Postgres执行VACUUM)
+
+每次执行记录删除的线程数、检查点数和回收的字节数。
+"""
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from app.agent import storage
+from app.agent.backends.base import StorageBackend
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 每批删除的过期线程数
+EXPIRE_BATCH_SIZE = 500
+
+
+@dataclass
+class MaintenanceStats:
+    """维护统计(累计值及最近一次执行)"""
+    runs: int = 0
+    threads_expired: int = 0
+    checkpoints_pruned: int = 0
+    bytes_reclaimed: int = 0
+    last_run_at: Optional[str] = None
+    last_duration: float = 0.0
+    last_bytes_reclaimed: int = 0
+    last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class StorageMaintenance:
+    """存储维护任务"""
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        interval: Optional[float] = None,
+        keep_last: Optional[int] = None,
+        retention_days: Optional[int] = None
+    ):
+        self.backend = backend
+        self.interval = settings.STORAGE_MAINTENANCE_INTERVAL if interval is None else interval
+        self.keep_last = settings.CHECKPOINT_KEEP_LAST if keep_last is None else keep_last
+        self.retention_days = settings.THREAD_RETENTION_DAYS if retention_days is None else retention_days
+        self.stats = MaintenanceStats()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def expire_threads(self) -> int:
+        """删除超过保留天数未更新的线程"""
+        if self.retention_days <= 0:
+            return 0
+        updated_before = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        expired = 0
+        while True:
+            threads = await self.backend.list_expired_threads(updated_before, EXPIRE_BATCH_SIZE)
+            if not threads:
+                return expired
+            deleted = 0
+            for user_id, thread_id in threads:
+                if await storage.delete_thread(self.backend, user_id, thread_id):
+                    deleted += 1
+            expired += deleted
+            if len(threads) < EXPIRE_BATCH_SIZE:
+                return expired
+            # 删除失败的线程会被再次列出，一整批都失败时停止，留到下次维护重试
+            if deleted == 0:
+                logger.warning(f"Failed to delete {len(threads)} expired threads, retrying in the next maintenance run")
+                return expired
+
+    async def run_once(self) -> Dict[str, Any]:
+        """执行一次维护
+
+        Returns:
+            本次执行的统计
+        """
+        async with self._lock:
+            start = time.perf_counter()
+            size_before = await self.backend.storage_size()
+            threads_expired = await self.expire_threads()
+            checkpoints_pruned = await self.backend.prune_checkpoints(self.keep_last) if self.keep_last > 0 else 0
+            await self.backend.compact()
+            bytes_reclaimed = max(0, size_before - await self.backend.storage_size())
+            duration = time.perf_counter() - start
+
+            self.stats.runs += 1
+            self.stats.threads_expired += threads_expired
+            self.stats.checkpoints_pruned += checkpoints_pruned
+            self.stats.bytes_reclaimed += bytes_reclaimed
+            self.stats.last_run_at = datetime.now().isoformat()
+            self.stats.last_duration = duration
+            self.stats.last_bytes_reclaimed = bytes_reclaimed
+            self.stats.last_error = None
+
+        logger.info(
+            f"Storage maintenance: expired {threads_expired} threads, pruned {checkpoints_pruned} checkpoints, "
+            f"reclaimed {bytes_reclaimed} bytes in {duration:.2f}s"
+        )
+        return {
+            'threads_expired': threads_expired,
+            'checkpoints_pruned': checkpoints_pruned,
+            'bytes_reclaimed': bytes_reclaimed,
+            'duration': duration
+        }
+
+    def start(self) -> None:
+        """启动后台维护任务，interval为0时不启动"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats.last_error = str(e)
+                logger.error(f"Storage maintenance failed: {e}", exc_info=True)
@@ -0,0 +1,292 @@
+"""
+数据库结构迁移
+
+为memories.db和checkpoints.db维护版本化的迁移。已执行的版本记录在
+schema_migrations表中，每个迁移在独立事务中执行；导入旧格式对话数据的
+迁移按批次提交，中断后可以安全地重新执行。
+
+迁移在启动时执行(settings.RUN_MIGRATIONS_ON_STARTUP)，也可以离线执行：
+
+    cd backend
+    python -m app.agent.migrations            # 执行所有未执行的迁移
+    python -m app.agent.migrations --status   # 查看当前版本
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import aiosqlite
+
+from app.agent.constants import CHECKPOINTS_PATH, MEMORIES_PATH, CONVERSATIONS_NAMESPACE
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+# 导入旧格式对话数据时每个事务处理的线程数
+LEGACY_IMPORT_BATCH_SIZE = 500
+
+
+@dataclass
+class Migration:
+    """单个迁移
+
+    transactional为False的迁移自行管理事务(例如按批次提交)，必须可以重复执行。
+    """
+    version: int
+    description: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+    transactional: bool = True
+
+
+async def _create_conversation_tables(conn: aiosqlite.Connection) -> None:
+    # 不使用executescript，它会先提交当前事务
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_threads (
+            user_id TEXT NOT NULL,
+            thread_id TEXT NOT NULL,
+            date TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_message_id TEXT,
+            PRIMARY KEY (user_id, thread_id)
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_messages (
+            user_id TEXT NOT NULL,
+            thread_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            message_id TEXT,
+            message TEXT NOT NULL,
+            PRIMARY KEY (user_id, thread_id, seq)
+        )
+    """)
+
+
+async def _add_thread_summary_index(conn: aiosqlite.Connection) -> None:
+    async with conn.execute("PRAGMA table_info(conversation_threads)") as cur:
+        columns = [row[1] for row in await cur.fetchall()]
+    # 早期版本在建表时已包含title列
+    if 'title' not in columns:
+        await conn.execute("ALTER TABLE conversation_threads ADD COLUMN title TEXT")
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS conversation_threads_updated_idx
+            ON conversation_threads (user_id, updated_at DESC, thread_id DESC)
+    """)
+
+
+async def _import_legacy_conversations(conn: aiosqlite.Connection) -> None:
+    """将store表中旧格式的对话(整体保存或按索引逐线程保存)导入消息日志表"""
+    from app.agent.backends.base import thread_title
+
+    async with conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'store'"
+    ) as cur:
+        if not await cur.fetchone():
+            return
+
+    prefix = ".".join(CONVERSATIONS_NAMESPACE)
+    async with conn.execute("SELECT key, value FROM store WHERE prefix = ?", (prefix,)) as cur:
+        rows = await cur.fetchall()
+    if not rows:
+        return
+
+    # (user_id, thread) 列表，以及导入后需要删除的旧键
+    threads = []
+    legacy_keys = []
+    values = {key: json.loads(value) for key, value in rows}
+    for key, value in values.items():
+        if key.endswith(":index") and isinstance(value, list):
+            user_id = key[:-len(":index")]
+            legacy_keys.append(key)
+            for thread_id in value:
+                thread_key = f"{user_id}:{thread_id}"
+                if isinstance(values.get(thread_key), dict):
+                    threads.append((user_id, values[thread_key]))
+                    legacy_keys.append(thread_key)
+        elif isinstance(value, dict) and 'threads' in value:
+            legacy_keys.append(key)
+            threads.extend((key, thread) for thread in value['threads'] or [])
+
+    # 已经写入消息日志的线程以新数据为准
+    async with conn.execute("SELECT user_id, thread_id FROM conversation_threads") as cur:
+        existing = set(await cur.fetchall())
+    # 同一线程可能出现多次(整体保存与按索引保存的记录并存，或索引中重复列出)，保留最后更新的一份
+    unique = {}
+    for user_id, thread in threads:
+        if not thread.get('thread_id') or (user_id, thread['thread_id']) in existing:
+            continue
+        key = (user_id, thread['thread_id'])
+        if key not in unique or (thread.get('updated_at') or '') > (unique[key].get('updated_at') or ''):
+            unique[key] = thread
+    threads = [(user_id, thread) for (user_id, _), thread in unique.items()]
+
+    now = datetime.now().isoformat()
+    for start in range(0, len(threads), LEGACY_IMPORT_BATCH_SIZE):
+        batch = threads[start:start + LEGACY_IMPORT_BATCH_SIZE]
+        message_rows = []
+        thread_rows = []
+        for user_id, thread in batch:
+            messages = thread.get('messages') or []
+            updated_at = thread.get('updated_at') or now
+            message_rows.extend(
+                (user_id, thread['thread_id'], seq, message.get('id'), json.dumps(message, ensure_ascii=False))
+                for seq, message in enumerate(messages)
+            )
+            thread_rows.append((
+                user_id, thread['thread_id'], thread_title(messages), thread.get('date') or updated_at[:10],
+                updated_at, updated_at, len(messages), messages[-1].get('id') if messages else None
+            ))
+
+        await conn.execute("BEGIN")
+        try:
+            await conn.executemany(
+                "INSERT INTO conversation_messages (user_id, thread_id, seq, message_id, message) VALUES (?, ?, ?, ?, ?)",
+                message_rows
+            )
+            await conn.executemany(
+                """INSERT INTO conversation_threads
+                   (user_id, thread_id, title, date, created_at, updated_at, message_count, last_message_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                thread_rows
+            )
+        except BaseException:
+            # 失败的批次整体回滚，下次启动时从该批次重新导入
+            await conn.rollback()
+            raise
+        await conn.commit()
+
+    await conn.execute("BEGIN")
+    await conn.executemany(
+        "DELETE FROM store WHERE prefix = ? AND key = ?",
+        [(prefix, key) for key in legacy_keys]
+    )
+    await conn.commit()
+    logger.info(f"Imported {len(threads)} legacy conversation threads")
+
+
+async def _create_checkpoint_tables(conn: aiosqlite.Connection) -> None:
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    await AsyncSqliteSaver(conn).setup()
+
+
+MEMORY_MIGRATIONS: List[Migration] = [
+    Migration(1, "create conversation message log tables", _create_conversation_tables),
+    Migration(2, "add thread title and summary index", _add_thread_summary_index),
+    Migration(3, "import legacy key-value conversations", _import_legacy_conversations, transactional=False),
+]
+
+async def _create_checkpoint_blobs_table(conn: aiosqlite.Connection) -> None:
+    from app.agent.compact_checkpoint import CHECKPOINT_BLOBS_SCHEMA
+    await conn.execute(CHECKPOINT_BLOBS_SCHEMA)
+
+
+CHECKPOINT_MIGRATIONS: List[Migration] = [
+    Migration(1, "create checkpoint tables", _create_checkpoint_tables, transactional=False),
+    Migration(2, "create delta-encoded channel blobs table", _create_checkpoint_blobs_table),
+]
+
+
+async def get_schema_version(conn: aiosqlite.Connection) -> int:
+    """获取数据库当前的迁移版本"""
+    await conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )"""
+    )
+    await conn.commit()
+    async with conn.execute(f"SELECT MAX(version) FROM {MIGRATIONS_TABLE}") as cur:
+        row = await cur.fetchone()
+    return row[0] or 0
+
+
+async def run_migrations(conn: aiosqlite.Connection, migrations: List[Migration], name: str = "database") -> int:
+    """执行所有未执行的迁移
+
+    Returns:
+        迁移后的版本号
+    """
+    if conn.in_transaction:
+        await conn.commit()
+    version = await get_schema_version(conn)
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+        logger.info(f"Applying {name} migration {migration.version}: {migration.description}")
+        if migration.transactional:
+            await conn.execute("BEGIN")
+            try:
+                await migration.apply(conn)
+            except BaseException:
+                await conn.rollback()
+                raise
+        else:
+            await migration.apply(conn)
+            await conn.execute("BEGIN")
+        await conn.execute(
+            f"INSERT INTO {MIGRATIONS_TABLE} (version, description, applied_at) VALUES (?, ?, ?)",
+            (migration.version, migration.description, datetime.now().isoformat())
+        )
+        await conn.commit()
+        version = migration.version
+    return version
+
+
+async def migrate_memories(conn: aiosqlite.Connection) -> int:
+    """迁移memories.db"""
+    return await run_migrations(conn, MEMORY_MIGRATIONS, "memories")
+
+
+async def migrate_checkpoints(conn: aiosqlite.Connection) -> int:
+    """迁移checkpoints.db"""
+    return await run_migrations(conn, CHECKPOINT_MIGRATIONS, "checkpoints")
+
+
+async def _migrate_file(path: str, migrate: Callable, setup: Optional[Callable] = None) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    async with aiosqlite.connect(path) as conn:
+        if setup:
+            await setup(conn)
+        return await migrate(conn)
+
+
+async def _status_file(path: str, migrations: List[Migration]) -> Dict[str, int]:
+    if not os.path.exists(path):
+        return {"current": 0, "latest": migrations[-1].version}
+    async with aiosqlite.connect(path) as conn:
+        return {"current": await get_schema_version(conn), "latest": migrations[-1].version}
+
+
+async def _setup_store(conn: aiosqlite.Connection) -> None:
+    from langgraph.store.sqlite.aio import AsyncSqliteStore
+    await AsyncSqliteStore(conn).setup()
+    await conn.commit()
+
+
+async def main(status_only: bool = False) -> None:
+    if status_only:
+        for path, migrations in ((MEMORIES_PATH, MEMORY_MIGRATIONS), (CHECKPOINTS_PATH, CHECKPOINT_MIGRATIONS)):
+            status = await _status_file(path, migrations)
+            print(f"{path}: version {status['current']} (latest {status['latest']})")
+        return
+    memories_version = await _migrate_file(MEMORIES_PATH, migrate_memories, setup=_setup_store)
+    checkpoints_version = await _migrate_file(CHECKPOINTS_PATH, migrate_checkpoints)
+    print(f"{MEMORIES_PATH}: version {memories_version}")
+    print(f"{CHECKPOINTS_PATH}: version {checkpoints_version}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--status", action="store_true", help="show current schema versions only")
+    args = parser.parse_args()
+    asyncio.run(main(status_only=args.status))
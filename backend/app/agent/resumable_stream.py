@@ -0,0 +1,336 @@
+"""
+可恢复的流式运行
+
+run_async在后台任务中执行，与HTTP连接解耦。每个事件分配单调递增的ID
+（compact协议事件已带有的ID保持不变），保存在每个运行的有界环形缓冲区中；
+配置了STREAM_SPILL_PATH时，从缓冲区淘汰的事件分批写入SQLite，重连时仍可回放。
+
+客户端断开后运行继续执行，带Last-Event-ID重连时从该ID之后回放并继续订阅。
+没有订阅者超过STREAM_RESUME_TIMEOUT秒的运行会被取消，结束的运行在
+STREAM_RETENTION秒后清除。
+"""
+
+import asyncio
+import os
+import re
+import uuid
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from app.agent.sqlite_connection import SqliteConfig, connect
+from app.agent.stream_guard import StreamMetrics
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SPILL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stream_events (
+    run_id TEXT NOT NULL,
+    event_id INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    PRIMARY KEY (run_id, event_id)
+) WITHOUT ROWID
+"""
+
+# 淘汰的事件累积到该数量后写入SQLite
+SPILL_BATCH_SIZE = 64
+
+_EVENT_ID = re.compile(r"id: (\d+)\n")
+
+
+def event_id_of(event: str) -> Optional[int]:
+    """读取事件开头的SSE id"""
+    match = _EVENT_ID.match(event)
+    return int(match.group(1)) if match else None
+
+
+class EventSpill:
+    """保存从环形缓冲区淘汰的事件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[aiosqlite.Connection] = None
+        # 所有运行共用一个连接，事务不能交错
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        config = SqliteConfig.from_settings()
+        # 溢出的事件可以在崩溃时丢失
+        config.synchronous = "OFF"
+        self.conn = await connect(self.path, config)
+        await self.conn.execute(SPILL_SCHEMA)
+        # 上一个进程的运行已无法恢复
+        await self.conn.execute("DELETE FROM stream_events")
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
+
+    async def write(self, run_id: str, events: List[Tuple[int, str]]) -> None:
+        async with self._lock:
+            await self.conn.execute("BEGIN")
+            try:
+                await self.conn.executemany(
+                    "INSERT OR REPLACE INTO stream_events (run_id, event_id, event) VALUES (?, ?, ?)",
+                    [(run_id, event_id, event) for event_id, event in events]
+                )
+                await self.conn.execute("COMMIT")
+            except Exception:
+                await self.conn.execute("ROLLBACK")
+                raise
+
+    async def read(self, run_id: str, after_id: int) -> List[Tuple[int, str]]:
+        # 不读取其他运行未提交的写入
+        async with self._lock:
+            async with self.conn.execute(
+                "SELECT event_id, event FROM stream_events WHERE run_id = ? AND event_id > ? ORDER BY event_id",
+                (run_id, after_id)
+            ) as cur:
+                return [(row[0], row[1]) for row in await cur.fetchall()]
+
+    async def delete(self, run_id: str) -> None:
+        async with self._lock:
+            await self.conn.execute("DELETE FROM stream_events WHERE run_id = ?", (run_id,))
+
+
+class EventLog:
+    """单个运行的事件日志：有界环形缓冲区，可选溢出到SQLite"""
+
+    def __init__(self, run_id: str, capacity: int, spill: Optional[EventSpill] = None):
+        self.run_id = run_id
+        self.events: Deque[Tuple[int, str]] = deque()
+        self.capacity = max(capacity, 1)
+        self.spill = spill
+        # 已淘汰、尚未写入SQLite的事件
+        self._pending: List[Tuple[int, str]] = []
+        self.last_id = -1
+        self.finished = False
+        self.evicted = 0
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def append(self, event: str) -> int:
+        """追加事件并返回其ID"""
+        event_id = event_id_of(event)
+        if event_id is None or event_id <= self.last_id:
+            event_id = self.last_id + 1
+            event = f"id: {event_id}\n{event}"
+        if len(self.events) >= self.capacity:
+            evicted = self.events.popleft()
+            self.evicted += 1
+            if self.spill is not None:
+                self._pending.append(evicted)
+        self.events.append((event_id, event))
+        self.last_id = event_id
+        self._notify()
+        if len(self._pending) >= SPILL_BATCH_SIZE:
+            await self.flush()
+        return event_id
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        # 写入完成前保留在_pending中，保证读取时不会遗漏
+        batch = list(self._pending)
+        await self.spill.write(self.run_id, batch)
+        del self._pending[:len(batch)]
+
+    def finish(self) -> None:
+        self.finished = True
+        self._notify()
+
+    async def read_after(self, after_id: int) -> List[Tuple[int, str]]:
+        """返回ID大于after_id的事件，已被淘汰且未溢出的事件会缺失"""
+        # 先同步获取内存中的快照，再读取SQLite，按ID合并去重
+        events = [item for item in self.events if item[0] > after_id]
+        oldest = events[0][0] if events else self.last_id + 1
+        if after_id + 1 >= oldest or self.spill is None:
+            return events
+        older = {event_id: event for event_id, event in self._pending if event_id > after_id}
+        for event_id, event in await self.spill.read(self.run_id, after_id):
+            older.setdefault(event_id, event)
+        return sorted(item for item in older.items() if item[0] < oldest) + events
+
+    async def wait(self, after_id: int) -> None:
+        """等待ID大于after_id的事件或日志结束"""
+        while self.last_id <= after_id and not self.finished:
+            await self._changed.wait()
+
+
+class StreamRun:
+    """在后台执行、可重新订阅的流式运行"""
+
+    def __init__(self, run_id: str, user_id: str, thread_id: str, log: EventLog, abandonable: bool = True):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.log = log
+        # 没有订阅者超时后是否取消
+        self.abandonable = abandonable
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self.started_at = asyncio.get_running_loop().time()
+        # 结束方式：succeeded、failed或cancelled
+        self.outcome: Optional[str] = None
+        self.error: Optional[str] = None
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+
+class ResumableStreams:
+    """管理后台流式运行及其事件日志"""
+
+    def __init__(
+        self,
+        metrics: Optional[StreamMetrics] = None,
+        capacity: Optional[int] = None,
+        resume_timeout: Optional[float] = None,
+        retention: Optional[float] = None,
+        spill_path: Optional[str] = None
+    ):
+        self.metrics = metrics or StreamMetrics()
+        self.capacity = settings.STREAM_REPLAY_BUFFER_SIZE if capacity is None else capacity
+        self.resume_timeout = settings.STREAM_RESUME_TIMEOUT if resume_timeout is None else resume_timeout
+        self.retention = settings.STREAM_RETENTION if retention is None else retention
+        self.spill_path = settings.STREAM_SPILL_PATH if spill_path is None else spill_path
+        self.spill: Optional[EventSpill] = None
+        self.runs: Dict[str, StreamRun] = {}
+        # (user_id, thread_id) -> 该线程最近一次运行的run_id
+        self._thread_runs: Dict[Tuple[str, str], str] = {}
+
+    async def open(self) -> None:
+        if self.spill_path:
+            self.spill = EventSpill(self.spill_path)
+            await self.spill.open()
+            logger.info(f"Stream events spill to {self.spill_path}")
+
+    async def close(self) -> None:
+        tasks = [run.task for run in self.runs.values() if run.task and not run.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.runs.clear()
+        self._thread_runs.clear()
+        if self.spill is not None:
+            await self.spill.close()
+            self.spill = None
+
+    def create(self, user_id: str, thread_id: str, run_id: Optional[str] = None, abandonable: bool = True) -> StreamRun:
+        """创建尚未执行的运行，订阅者可以先订阅、等待事件"""
+        run_id = run_id or str(uuid.uuid4())
+        run = StreamRun(run_id, user_id, thread_id, EventLog(run_id, self.capacity, self.spill), abandonable)
+        self.runs[run_id] = run
+        self._thread_runs[(user_id, thread_id)] = run_id
+        return run
+
+    def start(self, source: AsyncGenerator[str, None], user_id: str, thread_id: str) -> StreamRun:
+        """在后台执行source，返回可订阅的运行"""
+        run = self.create(user_id, thread_id)
+        run.task = asyncio.create_task(self.pump(run, source))
+        # 创建后立即订阅前没有订阅者，同样适用恢复超时
+        self._schedule_abandon(run)
+        return run
+
+    def get(self, run_id: str) -> Optional[StreamRun]:
+        return self.runs.get(run_id)
+
+    def find(self, user_id: str, thread_id: str) -> Optional[StreamRun]:
+        """查找线程最近一次仍可恢复的运行"""
+        run_id = self._thread_runs.get((user_id, thread_id))
+        return self.runs.get(run_id) if run_id else None
+
+    async def pump(self, run: StreamRun, source: AsyncGenerator[str, None]) -> None:
+        """把source的事件写入运行的事件日志，直到结束、失败或被取消"""
+        try:
+            async for event in source:
+                await run.log.append(event)
+            run.outcome = "succeeded"
+        except asyncio.CancelledError:
+            run.outcome = "cancelled"
+            logger.info(f"Stream run {run.run_id} cancelled")
+        except Exception as e:
+            # run_async已输出错误事件
+            run.outcome = "failed"
+            run.error = str(e)
+            logger.error(f"Stream run {run.run_id} failed: {e}")
+        finally:
+            await source.aclose()
+            self.finish(run)
+
+    def finish(self, run: StreamRun) -> None:
+        """结束运行的事件日志，保留STREAM_RETENTION秒供回放"""
+        if run.outcome is None:
+            run.outcome = "cancelled"
+        run.log.finish()
+        if run._abandon_handle is not None:
+            run._abandon_handle.cancel()
+            run._abandon_handle = None
+        asyncio.get_running_loop().call_later(self.retention, self._expire, run.run_id)
+
+    async def subscribe(self, run: StreamRun, after_id: int = -1) -> AsyncGenerator[str, None]:
+        """回放ID大于after_id的事件并继续订阅新事件，直到运行结束"""
+        run.subscribers += 1
+        if run._abandon_handle is not None:
+            run._abandon_handle.cancel()
+            run._abandon_handle = None
+        resumed = after_id >= 0
+        if resumed:
+            self.metrics.streams_resumed += 1
+        last_id = after_id
+        try:
+            while True:
+                events = await run.log.read_after(last_id)
+                if events and events[0][0] > last_id + 1:
+                    self.metrics.replay_gaps += 1
+                    logger.warning(f"Stream run {run.run_id}: events {last_id + 1}-{events[0][0] - 1} are no longer available")
+                if resumed:
+                    self.metrics.events_replayed += len(events)
+                    resumed = False
+                for event_id, event in events:
+                    last_id = event_id
+                    yield event
+                if run.log.finished and last_id >= run.log.last_id:
+                    return
+                await run.log.wait(last_id)
+        finally:
+            run.subscribers -= 1
+            if run.subscribers == 0 and not run.log.finished:
+                self.metrics.runs_detached += 1
+                self._schedule_abandon(run)
+
+    def _schedule_abandon(self, run: StreamRun) -> None:
+        if self.resume_timeout > 0 and run.abandonable:
+            run._abandon_handle = asyncio.get_running_loop().call_later(self.resume_timeout, self._abandon, run)
+
+    def _abandon(self, run: StreamRun) -> None:
+        """没有客户端重连，取消运行以节省模型和工具调用"""
+        run._abandon_handle = None
+        if run.subscribers or run.log.finished or run.task is None:
+            return
+        logger.info(f"No subscriber reconnected to stream run {run.run_id}, cancelling")
+        self.metrics.runs_stopped += 1
+        self.metrics.stopped_run_seconds += asyncio.get_running_loop().time() - run.started_at
+        run.task.cancel()
+
+    def _expire(self, run_id: str) -> None:
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            return
+        key = (run.user_id, run.thread_id)
+        if self._thread_runs.get(key) == run_id:
+            del self._thread_runs[key]
+        if self.spill is not None and run.log.evicted:
+            asyncio.get_running_loop().create_task(self.spill.delete(run_id))
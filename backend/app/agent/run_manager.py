@@ -0,0 +1,373 @@
+"""
+后台运行管理
+
+RunManager接收goal并立即返回run_id，运行在有界的asyncio工作池中执行：
+- 公平调度：每个用户一个FIFO队列，工作者在有排队运行的用户之间轮转取任务，
+  一个用户提交大量运行不会让其他用户长时间等待
+- 排队上限：总排队数超过RUN_QUEUE_LIMIT或单个用户超过RUN_USER_QUEUE_LIMIT时拒绝提交
+- 事件：每个运行的事件写入ResumableStreams的事件日志，可被多个订阅者同时订阅和回放
+
+运行状态保存在store的RUNS_NAMESPACE中。进程重启后，上次排队中的运行重新排队；
+执行中断的运行如果检查点还有待执行的节点，则从检查点继续执行，否则标记为interrupted。
+每个运行记录所属的服务实例和工作进程编号(owner)，多进程部署时重启的工作进程只恢复
+自己遗留的运行，不会重新排队其他工作进程正在执行的运行。
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional
+
+from langgraph.store.base import BaseStore
+
+from app.agent.constants import RUNS_NAMESPACE
+from app.agent.resumable_stream import ResumableStreams, StreamRun
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RunStatus(Enum):
+    """运行状态枚举"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    INTERRUPTED = "interrupted"  # 进程退出时仍在执行，且无法从检查点继续
+
+
+FINISHED_STATUSES = (RunStatus.SUCCEEDED.value, RunStatus.FAILED.value, RunStatus.CANCELLED.value, RunStatus.INTERRUPTED.value)
+
+
+class RunQueueFullError(Exception):
+    """排队的运行数已达上限"""
+
+
+class RunNotOwnedError(Exception):
+    """运行在其他工作进程中排队或执行，无法在本进程取消"""
+
+
+@dataclass
+class RunRecord:
+    """持久化的运行状态"""
+    run_id: str
+    user_id: str
+    thread_id: str
+    goal: str
+    stream_mode: str = "updates"
+    protocol: Optional[str] = None
+    status: str = RunStatus.QUEUED.value
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+    # 从检查点继续执行的次数
+    resumes: int = 0
+    # 下一次执行是否从检查点继续
+    resume: bool = False
+    # 排队或执行运行的"服务实例:工作进程编号"
+    owner: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunRecord":
+        fields = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+
+class RunManager:
+    """在工作池中执行后台运行"""
+
+    def __init__(
+        self,
+        agent: Any,
+        store: BaseStore,
+        streams: ResumableStreams,
+        workers: Optional[int] = None,
+        queue_limit: Optional[int] = None,
+        user_queue_limit: Optional[int] = None
+    ):
+        self.agent = agent
+        self.store = store
+        self.streams = streams
+        self.workers = settings.RUN_WORKERS if workers is None else workers
+        self.queue_limit = settings.RUN_QUEUE_LIMIT if queue_limit is None else queue_limit
+        self.user_queue_limit = settings.RUN_USER_QUEUE_LIMIT if user_queue_limit is None else user_queue_limit
+        # app.serve的工作进程共享同一个实例ID，单进程运行时每次启动都是新实例
+        self.instance = settings.SERVE_INSTANCE or uuid.uuid4().hex
+        self.owner = f"{self.instance}:{settings.SERVE_WORKER_INDEX}"
+        # 活动(排队中或执行中)的运行
+        self.records: Dict[str, RunRecord] = {}
+        # user_id -> 该用户排队中的run_id，按轮转顺序排列
+        self._queues: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._queued = 0
+        # 每排队一个运行释放一次
+        self._available = asyncio.Semaphore(0)
+        self._worker_tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self, recover: bool = True) -> None:
+        """恢复遗留的运行并启动工作者
+
+        本工作进程异常退出前遗留的运行总是恢复。
+
+        Args:
+            recover: 是否同时恢复上一次服务遗留的运行；多个进程共享存储时只应由一个进程恢复
+        """
+        self._stopping = False
+        await self.recover(previous=recover)
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Run manager started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """停止工作者，执行中的运行保留为running状态，重启后从检查点继续"""
+        self._stopping = True
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def recover(self, previous: bool = True) -> None:
+        """重新排队遗留的排队或执行中的运行
+
+        Args:
+            previous: 是否包括上一次服务遗留的运行；为False时只恢复本工作进程遗留的运行
+        """
+        for status in (RunStatus.RUNNING.value, RunStatus.QUEUED.value):
+            items = await self.store.asearch(RUNS_NAMESPACE, filter={"status": status}, limit=10000)
+            for item in sorted(items, key=lambda i: i.value.get("created_at") or ""):
+                record = RunRecord.from_dict(item.value)
+                if not self._recoverable(record, previous):
+                    continue
+                if status == RunStatus.RUNNING.value:
+                    if not settings.RUN_RESUME_ON_STARTUP or not await self._has_pending_work(record):
+                        record.status = RunStatus.INTERRUPTED.value
+                        record.finished_at = datetime.now().isoformat()
+                        await self._save(record)
+                        logger.info(f"Run {record.run_id} was interrupted by a restart")
+                        continue
+                    record.resume = True
+                    record.status = RunStatus.QUEUED.value
+                elif not settings.RUN_RESUME_ON_STARTUP:
+                    record.status = RunStatus.INTERRUPTED.value
+                    record.finished_at = datetime.now().isoformat()
+                    await self._save(record)
+                    continue
+                self._enqueue(record)
+                await self._save(record)
+                logger.info(f"Run {record.run_id} re-queued after restart (resume={record.resume})")
+
+    def _recoverable(self, record: RunRecord, previous: bool) -> bool:
+        """运行是否由本工作进程上次异常退出时遗留，或属于上一次服务"""
+        if record.owner == self.owner:
+            return True
+        # 没有owner的运行由添加owner之前的版本创建
+        instance = (record.owner or "").rpartition(":")[0]
+        return previous and instance != self.instance
+
+    async def _has_pending_work(self, record: RunRecord) -> bool:
+        """线程最近的检查点是否还有待执行的节点"""
+        config = {"configurable": {"thread_id": record.thread_id, "user_id": record.user_id}}
+        try:
+            state = await self.agent.agent.aget_state(config)
+        except Exception as e:
+            logger.warning(f"Failed to load checkpoint of run {record.run_id}: {e}")
+            return False
+        return bool(state.next)
+
+    async def submit(
+        self,
+        goal: str,
+        user_id: str = "user1",
+        session_id: Optional[str] = None,
+        stream_mode: str = "updates",
+        protocol: Optional[str] = None
+    ) -> RunRecord:
+        """提交运行，排队已满时抛出RunQueueFullError"""
+        if self._queued >= self.queue_limit:
+            raise RunQueueFullError(f"Run queue is full ({self.queue_limit} queued runs), try again later")
+        if len(self._queues.get(user_id, ())) >= self.user_queue_limit:
+            raise RunQueueFullError(f"User {user_id} already has {self.user_queue_limit} queued runs")
+        record = RunRecord(
+            run_id=str(uuid.uuid4()),
+            user_id=user_id,
+            thread_id=session_id or str(uuid.uuid4()),
+            goal=goal,
+            stream_mode=stream_mode,
+            protocol=protocol,
+            created_at=datetime.now().isoformat(),
+            owner=self.owner
+        )
+        await self._save(record)
+        self._enqueue(record)
+        return record
+
+    def _enqueue(self, record: RunRecord) -> None:
+        record.owner = self.owner
+        self.records[record.run_id] = record
+        # 订阅者可以在运行开始前订阅
+        if self.streams.get(record.run_id) is None:
+            self.streams.create(record.user_id, record.thread_id, run_id=record.run_id, abandonable=False)
+        self._queues.setdefault(record.user_id, deque()).append(record.run_id)
+        self._queued += 1
+        self._available.release()
+
+    def _dequeue(self, record: RunRecord) -> None:
+        queue = self._queues.get(record.user_id)
+        if queue is None or record.run_id not in queue:
+            return
+        queue.remove(record.run_id)
+        self._queued -= 1
+        if not queue:
+            del self._queues[record.user_id]
+
+    def _next_run(self) -> Optional[RunRecord]:
+        """轮转地从下一个用户的队列中取出运行"""
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            run_id = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            record = self.records.get(run_id)
+            if record is not None and record.status == RunStatus.QUEUED.value:
+                return record
+        # 对应的运行已在排队时被取消
+        return None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            await self._available.acquire()
+            record = self._next_run()
+            if record is None:
+                continue
+            try:
+                await self._execute(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker {index} failed to execute run {record.run_id}: {e}")
+                await self._fail(record, e)
+
+    async def _fail(self, record: RunRecord, error: Exception) -> None:
+        """执行出错(如存储写入失败)时结束运行，避免状态一直停留在running"""
+        record.status = RunStatus.FAILED.value
+        record.error = str(error) or type(error).__name__
+        stream = self.streams.get(record.run_id)
+        if stream is not None and not stream.log.finished:
+            stream.outcome = "failed"
+            stream.error = record.error
+            self.streams.finish(stream)
+        try:
+            await self._finish(record)
+        except Exception as e:
+            logger.error(f"Failed to save failed run {record.run_id}: {e}")
+        finally:
+            self.records.pop(record.run_id, None)
+
+    async def _execute(self, record: RunRecord) -> None:
+        stream = self.streams.get(record.run_id)
+        record.status = RunStatus.RUNNING.value
+        record.started_at = datetime.now().isoformat()
+        if record.resume:
+            record.resumes += 1
+        await self._save(record)
+
+        source = self.agent.run_async(
+            record.goal,
+            stream_mode=record.stream_mode,
+            session_id=record.thread_id,
+            user_id=record.user_id,
+            protocol=record.protocol,
+            resume=record.resume
+        )
+        stream.task = asyncio.create_task(self.streams.pump(stream, source))
+        try:
+            # 停止工作者时不取消运行本身，由streams.close()取消
+            await asyncio.shield(stream.task)
+        except asyncio.CancelledError:
+            if not stream.task.done():
+                # 进程退出：保持running状态，重启后从检查点继续
+                raise
+
+        if self._stopping and stream.outcome == "cancelled":
+            return
+        record.status = {
+            "succeeded": RunStatus.SUCCEEDED.value,
+            "failed": RunStatus.FAILED.value,
+        }.get(stream.outcome, RunStatus.CANCELLED.value)
+        record.error = stream.error
+        await self._finish(record)
+
+    async def _finish(self, record: RunRecord) -> None:
+        record.resume = False
+        record.finished_at = datetime.now().isoformat()
+        await self._save(record)
+        self.records.pop(record.run_id, None)
+
+    async def _save(self, record: RunRecord) -> None:
+        await self.store.aput(RUNS_NAMESPACE, record.run_id, record.to_dict(), index=False)
+
+    async def get(self, run_id: str) -> Optional[RunRecord]:
+        """获取运行状态，已结束的运行从store读取"""
+        record = self.records.get(run_id)
+        if record is not None:
+            return record
+        item = await self.store.aget(RUNS_NAMESPACE, run_id)
+        return RunRecord.from_dict(item.value) if item else None
+
+    def position(self, record: RunRecord) -> Optional[int]:
+        """排队中的运行在所属用户队列中的位置(从0开始)"""
+        queue = self._queues.get(record.user_id)
+        if record.status != RunStatus.QUEUED.value or not queue:
+            return None
+        try:
+            return list(queue).index(record.run_id)
+        except ValueError:
+            return None
+
+    def events(self, run_id: str) -> Optional[StreamRun]:
+        """获取运行的事件日志，运行结束超过STREAM_RETENTION秒后返回None"""
+        return self.streams.get(run_id)
+
+    async def cancel(self, run_id: str) -> Optional[RunRecord]:
+        """取消排队中或执行中的运行，返回更新后的状态
+
+        Raises:
+            RunNotOwnedError: 运行由其他工作进程排队或执行
+        """
+        record = await self.get(run_id)
+        if record is None or record.status in FINISHED_STATUSES:
+            return record
+        if run_id not in self.records:
+            raise RunNotOwnedError(f"Run {run_id} is queued or running in another worker")
+        stream = self.streams.get(run_id)
+        if record.status == RunStatus.QUEUED.value:
+            record.status = RunStatus.CANCELLED.value
+            self._dequeue(record)
+            if stream is not None:
+                self.streams.finish(stream)
+            await self._finish(record)
+        elif stream is not None and stream.task is not None:
+            # 执行中的运行由工作者在任务结束后保存状态
+            record.status = RunStatus.CANCELLED.value
+            stream.task.cancel()
+            await asyncio.gather(stream.task, return_exceptions=True)
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queued,
+            "running": sum(1 for r in self.records.values() if r.status == RunStatus.RUNNING.value),
+            "queued_users": len(self._queues),
+        }
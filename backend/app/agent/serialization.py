@@ -0,0 +1,157 @@
+"""
+流事件序列化
+
+to_jsonable一次遍历把chunk转换为可JSON序列化的结构，转换规则与早期的
+ensure_serializable一致（对象取__dict__，元组和无法识别的类型转为字符串），
+但每种类型的处理函数只在第一次遇到时解析并缓存，之后按type(obj)直接分派，
+不再对每个对象做hasattr探测。LangChain消息、Pydantic模型和dataclass都有专门的
+处理函数。
+
+dumps在安装了orjson时使用orjson输出，否则使用标准库json，可通过
+STREAM_JSON_BACKEND强制指定。
+"""
+
+import dataclasses
+import json
+from typing import Any, Callable, Dict, Tuple
+
+from pydantic import BaseModel
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JSON_BACKENDS = ("auto", "orjson", "json")
+
+# 类型 -> 处理函数
+_handlers: Dict[type, Callable[[Any], Any]] = {}
+
+# 无需转换的常见类型，在容器内直接跳过分派
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def _identity(obj: Any) -> Any:
+    return obj
+
+
+def _none(obj: Any) -> Any:
+    return None
+
+
+def _convert_dict(obj: dict) -> dict:
+    return {k: v if type(v) in _SCALAR_TYPES else to_jsonable(v) for k, v in obj.items()}
+
+
+def _convert_list(obj: list) -> list:
+    return [item if type(item) in _SCALAR_TYPES else to_jsonable(item) for item in obj]
+
+
+def _convert_attributes(obj: Any) -> Any:
+    # LangChain消息、Pydantic模型和普通对象实例：字段都在__dict__中
+    try:
+        return _convert_dict(obj.__dict__)
+    except Exception:
+        # 如果无法序列化__dict__，转换为字符串
+        return str(obj)
+
+
+def _convert_slots_dataclass(obj: Any) -> Any:
+    # 使用__slots__的dataclass没有__dict__
+    try:
+        return {field.name: to_jsonable(getattr(obj, field.name)) for field in dataclasses.fields(obj)}
+    except Exception:
+        return str(obj)
+
+
+def _convert_dict_method(obj: Any) -> Any:
+    # 提供dict()方法的旧式Pydantic模型
+    try:
+        return to_jsonable(obj.dict())
+    except Exception:
+        return str(obj)
+
+
+def _convert_asdict_method(obj: Any) -> Any:
+    try:
+        return to_jsonable(obj.asdict())
+    except Exception:
+        return str(obj)
+
+
+def _resolve_handler(obj: Any) -> Callable[[Any], Any]:
+    """为对象的类型选择处理函数，顺序与早期ensure_serializable的判断顺序一致"""
+    cls = type(obj)
+    if obj is None:
+        return _none
+    if issubclass(cls, (str, int, float, bool)):
+        return _identity
+    if issubclass(cls, dict):
+        return _convert_dict
+    if issubclass(cls, list):
+        return _convert_list
+    if issubclass(cls, BaseModel) or hasattr(obj, '__dict__'):
+        return _convert_attributes
+    if dataclasses.is_dataclass(cls):
+        return _convert_slots_dataclass
+    if hasattr(obj, 'dict'):
+        return _convert_dict_method
+    if hasattr(obj, 'asdict'):
+        return _convert_asdict_method
+    # 元组等其他类型转换为字符串
+    return str
+
+
+def to_jsonable(obj: Any) -> Any:
+    """把对象转换为可以被JSON序列化的结构"""
+    handler = _handlers.get(type(obj))
+    if handler is None:
+        handler = _resolve_handler(obj)
+        _handlers[type(obj)] = handler
+    return handler(obj)
+
+
+def _json_dumps(obj: Any) -> str:
+    # 与orjson的输出格式保持一致
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _load_backend() -> Tuple[str, Callable[[Any], str]]:
+    backend = settings.STREAM_JSON_BACKEND
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unsupported STREAM_JSON_BACKEND: {backend}. Supported: {', '.join(JSON_BACKENDS)}")
+    if backend == "json":
+        return "json", _json_dumps
+
+    # 尝试导入orjson库
+    try:
+        import orjson
+    except ImportError:
+        if backend == "orjson":
+            raise ImportError("orjson library is not installed. Please run 'pip install orjson'")
+        return "json", _json_dumps
+
+    options = orjson.OPT_NON_STR_KEYS
+
+    def _orjson_dumps(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=options).decode("utf-8")
+        except TypeError:
+            # 超出64位的整数等orjson不支持的值
+            return _json_dumps(obj)
+
+    return "orjson", _orjson_dumps
+
+
+# 实际使用的JSON后端名称和输出函数
+JSON_BACKEND, _dumps = _load_backend()
+
+
+def dumps(obj: Any) -> str:
+    """把可JSON序列化的结构输出为JSON字符串"""
+    return _dumps(obj)
+
+
+def encode(obj: Any) -> str:
+    """转换并输出任意对象"""
+    return _dumps(to_jsonable(obj))
@@ -0,0 +1,206 @@
+"""
+SQLite连接层
+
+为检查点库和记忆库打开经过调优的连接(WAL、synchronous、mmap_size、
+cache_size、busy_timeout)，为记忆库提供与写连接分离的只读连接池，并为
+检查点保存器提供按步骤分组提交。
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+import aiosqlite
+from langgraph.checkpoint.base import WRITES_IDX_MAP
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.store.sqlite.aio import AsyncSqliteStore
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class SqliteConfig:
+    """SQLite连接参数"""
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64 * 1024  # 负数表示KiB
+    busy_timeout: int = 5000  # 毫秒
+    read_pool_size: int = 4
+    group_commit: bool = True
+    group_commit_max_delay: float = 1.0  # 秒
+
+    @classmethod
+    def from_settings(cls) -> "SqliteConfig":
+        return cls(
+            journal_mode=settings.SQLITE_JOURNAL_MODE,
+            synchronous=settings.SQLITE_SYNCHRONOUS,
+            mmap_size=settings.SQLITE_MMAP_SIZE,
+            cache_size=settings.SQLITE_CACHE_SIZE,
+            busy_timeout=settings.SQLITE_BUSY_TIMEOUT,
+            read_pool_size=settings.SQLITE_READ_POOL_SIZE,
+            group_commit=settings.SQLITE_GROUP_COMMIT,
+            group_commit_max_delay=settings.SQLITE_GROUP_COMMIT_MAX_DELAY,
+        )
+
+    def pragmas(self, readonly: bool = False) -> List[str]:
+        statements = [
+            f"PRAGMA busy_timeout = {int(self.busy_timeout)}",
+            f"PRAGMA cache_size = {int(self.cache_size)}",
+            f"PRAGMA mmap_size = {int(self.mmap_size)}",
+        ]
+        if readonly:
+            statements.append("PRAGMA query_only = ON")
+        else:
+            statements.append(f"PRAGMA journal_mode = {self.journal_mode}")
+            statements.append(f"PRAGMA synchronous = {self.synchronous}")
+        return statements
+
+
+async def connect(
+    path: str,
+    config: Optional[SqliteConfig] = None,
+    readonly: bool = False,
+    isolation_level: Optional[str] = None
+) -> aiosqlite.Connection:
+    """打开一个应用了调优参数的连接
+
+    默认使用自动提交模式(isolation_level=None)，事务需显式BEGIN，这是
+    AsyncSqliteStore所要求的模式。
+    """
+    config = config or SqliteConfig.from_settings()
+    if readonly:
+        conn = await aiosqlite.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = await aiosqlite.connect(path, check_same_thread=False, isolation_level=isolation_level)
+    for pragma in config.pragmas(readonly=readonly):
+        await conn.execute(pragma)
+    return conn
+
+
+class SqliteReadPool:
+    """只读连接池
+
+    WAL模式下读连接不会阻塞写连接，也不需要等待写连接上的锁。
+    """
+
+    def __init__(self, path: str, config: Optional[SqliteConfig] = None):
+        self.path = path
+        self.config = config or SqliteConfig.from_settings()
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+
+    async def open(self) -> None:
+        self._idle = asyncio.Queue()
+        for _ in range(max(1, self.config.read_pool_size)):
+            conn = await connect(self.path, self.config, readonly=True)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """借出一个读连接，用完归还"""
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+
+
+class TunedSqliteStore(AsyncSqliteStore):
+    """带只读连接池的AsyncSqliteStore"""
+
+    def __init__(self, conn: aiosqlite.Connection, read_pool: Optional[SqliteReadPool] = None, **kwargs: Any):
+        super().__init__(conn, **kwargs)
+        self.read_pool = read_pool
+
+    async def aclose(self) -> None:
+        if self.read_pool:
+            await self.read_pool.close()
+        await self.conn.close()
+
+
+class TunedSqliteSaver(AsyncSqliteSaver):
+    """按步骤分组提交的AsyncSqliteSaver
+
+    连接使用隐式事务模式。aput_writes写入的中间结果不单独提交，而是与该步骤
+    结束时aput写入的检查点一起提交；最长延迟group_commit_max_delay秒后
+    也会自动提交，避免长时间持有写锁。
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, config: Optional[SqliteConfig] = None, **kwargs: Any):
+        super().__init__(conn, **kwargs)
+        self.config = config or SqliteConfig.from_settings()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def aput_writes(
+        self,
+        config: Any,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if not self.config.group_commit:
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+        query = (
+            "INSERT OR REPLACE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            if all(w[0] in WRITES_IDX_MAP for w in writes)
+            else "INSERT OR IGNORE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        rows = [
+            (
+                str(config["configurable"]["thread_id"]),
+                str(config["configurable"]["checkpoint_ns"]),
+                str(config["configurable"]["checkpoint_id"]),
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        await self.setup()
+        # 与父类相同的写入，但不提交，写入保留在当前事务中
+        async with self.lock, self.conn.cursor() as cur:
+            await cur.executemany(query, rows)
+        self._schedule_flush()
+
+    async def aput(self, config: Any, checkpoint: Any, metadata: Any, new_versions: Any) -> Any:
+        # 父类在写入检查点后提交，一并提交本步骤的中间结果
+        result = await super().aput(config, checkpoint, metadata, new_versions)
+        self._cancel_flush()
+        return result
+
+    async def aflush(self) -> None:
+        """提交尚未提交的中间结果"""
+        self._cancel_flush()
+        async with self.lock:
+            if self.conn.in_transaction:
+                await self.conn.commit()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.config.group_commit_max_delay,
+                lambda: asyncio.ensure_future(self.aflush())
+            )
+
+    def _cancel_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    async def aclose(self) -> None:
+        await self.aflush()
+        await self.conn.close()
@@ -0,0 +1,155 @@
+"""
+流式响应的背压、心跳与断开取消
+
+StreamGuard把run_async生成的事件放入有界缓冲区，由后台生产者任务驱动：
+- 背压：缓冲区满时生产者暂停，不再从astream拉取，Agent在下一次输出时等待
+- 心跳：超过heartbeat_interval没有事件时输出SSE注释，防止代理和浏览器断开空闲连接
+- 取消：检测到客户端断开（或响应被服务器取消）时取消生产者任务，取消会传递到
+  astream中正在执行的模型调用和工具调用
+"""
+
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# SSE注释，客户端会忽略
+HEARTBEAT_EVENT = ": keep-alive\n\n"
+
+# 检测客户端断开连接的轮询间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# 生产者正常结束的标记
+_END = object()
+
+
+class _Failure:
+    """生产者异常结束，携带异常"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+@dataclass
+class StreamMetrics:
+    """流式响应的累计统计"""
+    streams_started: int = 0
+    streams_completed: int = 0
+    streams_failed: int = 0
+    # 客户端在流结束前断开
+    streams_cancelled: int = 0
+    # 断开时Agent仍在运行、被提前停止的次数及这些运行已执行的总时长
+    runs_stopped: int = 0
+    stopped_run_seconds: float = 0.0
+    # 断开时缓冲区中未发送的事件数
+    events_discarded: int = 0
+    events_sent: int = 0
+    heartbeats_sent: int = 0
+    # 缓冲区已满、生产者需要等待的次数
+    backpressure_waits: int = 0
+    active_streams: int = 0
+    # 可恢复流：断开后在后台继续执行的运行、带Last-Event-ID的重连、
+    # 重连时回放的事件数和回放中缺失事件的次数
+    runs_detached: int = 0
+    streams_resumed: int = 0
+    events_replayed: int = 0
+    replay_gaps: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class StreamGuard:
+    """为流式响应提供有界缓冲、心跳和断开取消"""
+
+    def __init__(
+        self,
+        buffer_size: Optional[int] = None,
+        heartbeat_interval: Optional[float] = None,
+        poll_interval: float = DISCONNECT_POLL_INTERVAL
+    ):
+        self.buffer_size = settings.STREAM_BUFFER_SIZE if buffer_size is None else buffer_size
+        self.heartbeat_interval = settings.STREAM_HEARTBEAT_INTERVAL if heartbeat_interval is None else heartbeat_interval
+        self.poll_interval = poll_interval
+        self.metrics = StreamMetrics()
+
+    async def _produce(self, source: AsyncGenerator[str, None], queue: asyncio.Queue) -> None:
+        try:
+            async for event in source:
+                if queue.full():
+                    self.metrics.backpressure_waits += 1
+                await queue.put(event)
+            await queue.put(_END)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        finally:
+            # 被取消时生成器可能停在yield处，关闭它以结束astream
+            await source.aclose()
+
+    async def stream(
+        self,
+        source: AsyncGenerator[str, None],
+        is_disconnected: Callable[[], Awaitable[bool]],
+        stops_run: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """转发source中的事件，客户端断开时停止source
+
+        Args:
+            source: 事件生成器，如agent.run_async(...)
+            is_disconnected: 检测客户端是否已断开，如Request.is_disconnected
+            stops_run: 停止source是否会停止Agent运行；订阅后台运行时为False
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(self.buffer_size, 1))
+        producer = asyncio.create_task(self._produce(source, queue))
+        self.metrics.streams_started += 1
+        self.metrics.active_streams += 1
+        finished = False
+        last_sent = last_checked = started
+        try:
+            while True:
+                now = loop.time()
+                if now - last_checked >= self.poll_interval:
+                    last_checked = now
+                    if await is_disconnected():
+                        logger.info("Client disconnected, cancelling agent stream")
+                        return
+
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    if self.heartbeat_interval and loop.time() - last_sent >= self.heartbeat_interval:
+                        self.metrics.heartbeats_sent += 1
+                        last_sent = loop.time()
+                        yield HEARTBEAT_EVENT
+                    continue
+
+                if item is _END:
+                    finished = True
+                    self.metrics.streams_completed += 1
+                    return
+                if isinstance(item, _Failure):
+                    # run_async已输出错误事件
+                    finished = True
+                    self.metrics.streams_failed += 1
+                    raise item.error
+
+                self.metrics.events_sent += 1
+                last_sent = loop.time()
+                yield item
+        finally:
+            self.metrics.active_streams -= 1
+            if not finished:
+                self.metrics.streams_cancelled += 1
+                self.metrics.events_discarded += queue.qsize()
+            if not producer.done():
+                if stops_run:
+                    self.metrics.runs_stopped += 1
+                    self.metrics.stopped_run_seconds += loop.time() - started
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,255 @@
+"""
+SSE流协议
+
+run_async支持两种输出协议，由客户端通过protocol参数协商：
+
+legacy(默认)：事件结构和字段与早期版本相同，但字节并不完全一致：JSON使用
+紧凑分隔符且不转义非ASCII字符，可恢复流还会在每个事件前加"id:"行，按SSE
+规范解析的客户端不受影响。每个chunk以无名称的"data:"事件输出，
+messages模式下每个token额外输出一个携带accumulated_content的message_delta
+事件，流结束时输出message_complete和"data: [DONE]"。
+
+compact(版本2)：每个事件都带有SSE事件名，SSE id为单调递增的序号：
+
+    event: start             {"v": 2, "thread_id": ..., "snapshot_interval": N}
+    event: delta             {"msg": 消息ID, "text": 增量}   (新消息的第一个增量)
+    event: delta             {"text": 增量}                   (同一消息的后续增量)
+    event: snapshot          {"msg": 消息ID, "content": 截至目前的完整内容}
+    event: message_complete  {"msg": 消息ID, "chunks": 增量数, "length": 内容长度}
+    event: update            {...updates/custom模式下处理后的chunk}
+    event: error             {"error": ..., "message": ...}
+    event: done              {}
+
+delta只携带增量文本，每条消息每snapshot_interval个增量发送一次snapshot，
+客户端发现序号不连续时可据此校正。来自子Agent的增量额外携带"ns"字段。
+"""
+
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from app.agent import serialization, stream_processor
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STREAM_PROTOCOL_VERSION = 2
+
+
+class StreamProtocol(Enum):
+    """流协议枚举"""
+    LEGACY = "legacy"
+    COMPACT = "compact"
+
+
+def negotiate_protocol(requested: Optional[str] = None) -> StreamProtocol:
+    """根据客户端请求选择协议，未指定或无法识别时使用配置的默认协议"""
+    for candidate in (requested, settings.STREAM_PROTOCOL):
+        if candidate:
+            name = candidate.strip().lower()
+            if name in ("2", "v2"):
+                return StreamProtocol.COMPACT
+            try:
+                return StreamProtocol(name)
+            except ValueError:
+                logger.warning(f"Unknown stream protocol requested: {candidate}")
+    return StreamProtocol.LEGACY
+
+
+def token_text(content: Any) -> str:
+    """提取token中的文本，兼容内容块列表"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else block.get("text", "")
+            for block in content
+            if isinstance(block, (str, dict))
+        )
+    return str(content) if content else ""
+
+
+class StreamEncoder(ABC):
+    """流事件编码器抽象基类"""
+
+    protocol: StreamProtocol
+
+    def start(self, thread_id: str) -> List[str]:
+        """流开始时输出的事件"""
+        return []
+
+    @abstractmethod
+    async def encode(self, stream_mode: str, namespace: Any, chunk: Any) -> List[str]:
+        """编码一个astream chunk"""
+        pass
+
+    @abstractmethod
+    def finish(self) -> List[str]:
+        """流正常结束时输出的事件"""
+        pass
+
+    @abstractmethod
+    def error(self, error: Exception) -> List[str]:
+        """流出错时输出的事件"""
+        pass
+
+
+class LegacyStreamEncoder(StreamEncoder):
+    """早期版本的事件结构(JSON编码和SSE id行见模块说明)"""
+
+    protocol = StreamProtocol.LEGACY
+
+    def __init__(self):
+        # 跟踪已发送的消息ID
+        self.sent_message_ids = set()
+        self.accumulated_content = ""
+        self.chunk_count = 0
+
+    async def encode(self, stream_mode: str, namespace: Any, chunk: Any) -> List[str]:
+        self.chunk_count += 1
+        events = []
+        if stream_mode == "messages":
+            async for result in stream_processor.process_message_chunk(namespace, chunk):
+                # 确保result可以被JSON序列化
+                result = serialization.to_jsonable(result)
+
+                # 1. 保持原有格式输出（向后兼容）
+                events.append(f"data: {serialization.dumps(result)}\n\n")
+
+                # 2. 处理新的结构化事件格式
+                if isinstance(result, dict) and result.get('type') == 'ai' and result.get('content'):
+                    content = result['content']
+                    msg_id = str(id(result))  # 生成消息ID
+
+                    # 跳过已发送的消息
+                    if msg_id in self.sent_message_ids:
+                        logger.debug(f"[Stream] Skipping duplicate message id={msg_id}")
+                        continue
+
+                    # 累积内容
+                    self.accumulated_content += content
+
+                    # 发送message_delta事件
+                    events.append(stream_processor.create_message_delta_event(
+                        msg_id,
+                        content,
+                        self.accumulated_content
+                    ))
+
+                    # 标记为已发送
+                    self.sent_message_ids.add(msg_id)
+            return events
+
+        if stream_mode == "updates":
+            result = stream_processor.process_update_chunk(namespace, chunk)
+        elif stream_mode == "custom":
+            result = stream_processor.process_custom_chunk(namespace, chunk)
+        else:
+            result = stream_processor.process_unknown_chunk(namespace, chunk)
+        events.append(f"data: {serialization.encode(result)}\n\n")
+        return events
+
+    def finish(self) -> List[str]:
+        events = []
+        # 流结束时发送message_complete事件
+        if self.accumulated_content:
+            events.append(stream_processor.create_message_complete_event(
+                self.accumulated_content,
+                self.chunk_count
+            ))
+        # 发送完成标记
+        logger.debug(f"[SSE→Client] [DONE] - Stream completed, total chunks: {self.chunk_count}")
+        events.append("data: [DONE]\n\n")
+        return events
+
+    def error(self, error: Exception) -> List[str]:
+        logger.debug(f"[SSE→Client] [DONE] - Stream completed with error")
+        return [stream_processor.create_error_event(error), "data: [DONE]\n\n"]
+
+
+class CompactStreamEncoder(StreamEncoder):
+    """版本2协议：带序号的增量事件和周期性快照"""
+
+    protocol = StreamProtocol.COMPACT
+
+    def __init__(self, snapshot_interval: Optional[int] = None):
+        self.snapshot_interval = settings.STREAM_SNAPSHOT_INTERVAL if snapshot_interval is None else snapshot_interval
+        self.seq = 0
+        # 当前消息的ID、增量片段和增量数
+        self.message_id: Optional[str] = None
+        self.parts: List[str] = []
+        self.length = 0
+        self.anonymous_messages = 0
+
+    def _event(self, name: str, data: Dict[str, Any]) -> str:
+        self.seq += 1
+        payload = serialization.dumps(data)
+        return f"id: {self.seq}\nevent: {name}\ndata: {payload}\n\n"
+
+    def start(self, thread_id: str) -> List[str]:
+        payload = serialization.dumps(
+            {"v": STREAM_PROTOCOL_VERSION, "thread_id": thread_id, "snapshot_interval": self.snapshot_interval}
+        )
+        return [f"id: {self.seq}\nevent: start\ndata: {payload}\n\n"]
+
+    def _complete_message(self) -> List[str]:
+        if self.message_id is None:
+            return []
+        event = self._event("message_complete", {"msg": self.message_id, "chunks": len(self.parts), "length": self.length})
+        self.message_id = None
+        self.parts = []
+        self.length = 0
+        return [event]
+
+    async def encode(self, stream_mode: str, namespace: Any, chunk: Any) -> List[str]:
+        if stream_mode == "messages":
+            token = chunk[0] if isinstance(chunk, (list, tuple)) else chunk
+            text = token_text(getattr(token, "content", token))
+            if not text:
+                return []
+            message_id = getattr(token, "id", None)
+            events = []
+            delta = {"text": text}
+            if message_id is None or message_id != self.message_id:
+                events.extend(self._complete_message())
+                if message_id is None:
+                    self.anonymous_messages += 1
+                    message_id = f"msg-{self.anonymous_messages}"
+                self.message_id = message_id
+                delta["msg"] = message_id
+
+            self.parts.append(text)
+            self.length += len(text)
+            if namespace:
+                delta["ns"] = list(namespace)
+            events.append(self._event("delta", delta))
+            if self.snapshot_interval and len(self.parts) % self.snapshot_interval == 0:
+                events.append(self._event("snapshot", {"msg": message_id, "content": "".join(self.parts)}))
+            return events
+
+        if stream_mode == "updates":
+            result = stream_processor.process_update_chunk(namespace, chunk)
+        elif stream_mode == "custom":
+            result = stream_processor.process_custom_chunk(namespace, chunk)
+        else:
+            result = stream_processor.process_unknown_chunk(namespace, chunk)
+        return [self._event("update", serialization.to_jsonable(result))]
+
+    def finish(self) -> List[str]:
+        events = self._complete_message()
+        events.append(self._event("done", {}))
+        return events
+
+    def error(self, error: Exception) -> List[str]:
+        events = self._complete_message()
+        events.append(self._event("error", {"error": str(error), "message": "An error occurred during streaming"}))
+        events.append(self._event("done", {}))
+        return events
+
+
+def create_stream_encoder(protocol: StreamProtocol) -> StreamEncoder:
+    """根据协议创建编码器"""
+    if protocol == StreamProtocol.COMPACT:
+        return CompactStreamEncoder()
+    return LegacyStreamEncoder()
@@ -1,14 +1,19 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from contextlib import asynccontextmanager
 import json
-from app.agent.agent import AutonomousAgent
+from app.agent.agent import AutonomousAgent, RunRejectedError
+from app.agent.run_manager import RunNotOwnedError, RunQueueFullError
+from app.agent.stream_guard import DISCONNECT_POLL_INTERVAL
+from app.agent.stream_protocol import negotiate_protocol
 import asyncio
 from pydantic import BaseModel
 from typing import Optional
 # 导入自定义日志
 from app.utils.logger import get_logger
+from app.config.settings import settings
 
 
 logger = get_logger(__name__)
@@ -16,6 +21,10 @@ logger = get_logger(__name__)
 # 创建全局Agent实例
 agent = AutonomousAgent()
 
+
+class ClientDisconnectedError(Exception):
+    """客户端在请求完成前断开了连接"""
+
 # 定义生命周期事件处理
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -52,6 +61,15 @@ app.add_middleware(
 class AgentRequest(BaseModel):
     goal: str
     mode: str  # streaming 或 non-streaming
+    timeout: Optional[float] = None  # 请求截止时间（秒），不超过RUN_TIMEOUT
+
+
+class RunRequest(BaseModel):
+    goal: str
+    session_id: Optional[str] = None
+    user_id: str = "user1"
+    stream_mode: str = "updates"
+    protocol: Optional[str] = None
 
 
 class StreamRequest(BaseModel):
@@ -61,46 +79,214 @@ class StreamRequest(BaseModel):
     user_id: str = "user1"
 
 
+async def run_until_disconnected(http_request: Request, coro):
+    """在事件循环上执行协程，客户端断开连接时取消执行"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling agent run")
+                raise ClientDisconnectedError()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @app.post("/run-agent")
-async def run_agent(request: AgentRequest, session_id: str = None, user_id: str = "user1"):
+async def run_agent(request: AgentRequest, http_request: Request, session_id: str = None, user_id: str = "user1"):
     """运行Agent（非流式模式）"""
+    timeout = settings.RUN_TIMEOUT
+    if request.timeout is not None and request.timeout > 0:
+        timeout = min(request.timeout, settings.RUN_TIMEOUT)
     try:
         # 执行Agent
-        state = agent.run(request.goal, session_id=session_id, user_id=user_id)
+        state = await run_until_disconnected(
+            http_request,
+            agent.arun(request.goal, session_id=session_id, user_id=user_id, timeout=timeout)
+        )
         
         return {
             "success": True,
             "data": state
         }
+    except RunRejectedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Agent run exceeded deadline of {timeout}s")
+    except ClientDisconnectedError:
+        # 客户端已断开，响应不会被接收
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_last_event_id(http_request: Request, last_event_id: Optional[str] = None) -> Optional[int]:
+    """读取Last-Event-ID请求头（EventSource重连时自动发送）或同名查询参数"""
+    value = http_request.headers.get("last-event-id") or last_event_id
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def subscribe_response(http_request: Request, run, after_id: int, headers: Optional[dict] = None) -> StreamingResponse:
+    """订阅后台运行，客户端断开只结束订阅，运行继续执行"""
+    events = agent.stream_guard.stream(
+        agent.streams.subscribe(run, after_id),
+        http_request.is_disconnected,
+        stops_run=False
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"X-Run-Id": run.run_id, **(headers or {})},
+        background=BackgroundTask(events.aclose)
+    )
+
+
 @app.get("/run-agent-stream")
-async def run_agent_stream(goal: str, stream_mode: str = "updates", session_id: str = None, user_id: str = "user1"):
-    """运行Agent（流式模式）"""
+async def run_agent_stream(
+    http_request: Request,
+    goal: str,
+    stream_mode: str = "updates",
+    session_id: str = None,
+    user_id: str = "user1",
+    protocol: Optional[str] = None,
+    last_event_id: Optional[str] = None
+):
+    """运行Agent（流式模式）
+
+    protocol为legacy(默认)或compact，实际使用的协议在X-Stream-Protocol响应头中返回。
+    STREAM_RESUMABLE开启时运行在后台执行，X-Run-Id响应头返回运行ID；带Last-Event-ID
+    重连同一session_id时从该事件之后继续，不会重新执行goal。未开启时客户端断开连接
+    会取消Agent运行。
+    """
+    try:
+        selected = negotiate_protocol(protocol)
+        if not settings.STREAM_RESUMABLE:
+            events = agent.stream_guard.stream(
+                agent.run_async(goal, stream_mode=stream_mode, session_id=session_id, user_id=user_id, protocol=selected.value),
+                http_request.is_disconnected
+            )
+            return StreamingResponse(
+                events,
+                media_type="text/event-stream",
+                headers={"X-Stream-Protocol": selected.value},
+                # 断开时响应可能停在发送处，显式关闭生成器以停止Agent运行
+                background=BackgroundTask(events.aclose)
+            )
+
+        after_id = parse_last_event_id(http_request, last_event_id)
+        if after_id is None:
+            run = agent.start_stream(goal, stream_mode=stream_mode, session_id=session_id, user_id=user_id, protocol=selected.value)
+            return subscribe_response(http_request, run, -1, {"X-Stream-Protocol": selected.value})
+
+        run = agent.streams.find(user_id, session_id) if session_id else None
+        if run is None or (run.log.finished and after_id >= run.log.last_id):
+            # 没有可恢复的运行：204让EventSource停止重连
+            return Response(status_code=204)
+        return subscribe_response(http_request, run, after_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/streams/{run_id}")
+async def resume_stream(http_request: Request, run_id: str, user_id: str = "user1", last_event_id: Optional[str] = None):
+    """按运行ID订阅后台流式运行，从Last-Event-ID之后的事件开始回放"""
+    run = agent.streams.get(run_id)
+    if run is None or run.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Stream run not found or expired")
+    after_id = parse_last_event_id(http_request, last_event_id)
+    return subscribe_response(http_request, run, -1 if after_id is None else after_id)
+
+def run_response(record) -> dict:
+    data = record.to_dict()
+    data["queue_position"] = agent.runs.position(record)
+    return {
+        "success": True,
+        "data": data
+    }
+
+
+@app.post("/runs", status_code=202)
+async def submit_run(request: RunRequest):
+    """提交后台运行，立即返回run_id；排队已满时返回429"""
     try:
-        return StreamingResponse(
-            agent.run_async(goal, stream_mode=stream_mode, session_id=session_id, user_id=user_id),
-            media_type="text/event-stream"
+        protocol = negotiate_protocol(request.protocol).value
+        record = await agent.runs.submit(
+            request.goal,
+            user_id=request.user_id,
+            session_id=request.session_id,
+            stream_mode=request.stream_mode,
+            protocol=protocol
         )
+        return run_response(record)
+    except RunQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+async def get_user_run(run_id: str, user_id: str):
+    """获取属于user_id的运行，不存在或属于其他用户时返回404"""
+    record = await agent.runs.get(run_id)
+    if record is None or record.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return record
+
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: str, user_id: str = "user1"):
+    """查询运行状态"""
+    return run_response(await get_user_run(run_id, user_id))
+
+
+@app.get("/runs/{run_id}/events")
+async def get_run_events(http_request: Request, run_id: str, user_id: str = "user1", last_event_id: Optional[str] = None):
+    """订阅运行的事件(SSE)，支持多个订阅者，可通过Last-Event-ID从指定事件之后回放"""
+    await get_user_run(run_id, user_id)
+    stream = agent.runs.events(run_id)
+    if stream is None:
+        raise HTTPException(status_code=410, detail="Run events are no longer available")
+    after_id = parse_last_event_id(http_request, last_event_id)
+    return subscribe_response(http_request, stream, -1 if after_id is None else after_id)
+
+
+@app.delete("/runs/{run_id}")
+async def cancel_run(run_id: str, user_id: str = "user1"):
+    """取消排队中或执行中的运行；运行由其他工作进程执行时返回409"""
+    await get_user_run(run_id, user_id)
+    try:
+        record = await agent.runs.cancel(run_id)
+    except RunNotOwnedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if record is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run_response(record)
+
+
 @app.get("/history/{user_id}")
-async def get_conversation_history(user_id: str):
-    """Get all conversation history for a user.
+async def get_conversation_history(user_id: str, limit: int = 50, cursor: Optional[str] = None):
+    """Get conversation thread summaries for a user, most recently updated first.
     
     Args:
         user_id: The user ID
+        limit: Maximum number of threads to return
+        cursor: The next_cursor value of the previous page
         
     Returns:
-        List of conversation threads
+        List of thread summaries and the cursor of the next page
     """
     try:
-        history = await agent.get_conversation_history(user_id)
+        history = await agent.get_conversation_history(user_id, limit=limit, cursor=cursor)
         return {
             "success": True,
-            "data": history
+            "data": history["threads"],
+            "next_cursor": history["next_cursor"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -158,6 +344,54 @@ async def delete_thread(user_id: str, thread_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/storage/maintenance")
+async def get_storage_maintenance():
+    """Get cumulative storage maintenance metrics (expired threads, pruned checkpoints, reclaimed bytes)."""
+    return {
+        "success": True,
+        "data": agent.get_storage_maintenance_stats()
+    }
+
+
+@app.post("/storage/maintenance")
+async def run_storage_maintenance():
+    """Apply retention policies and compact storage now."""
+    try:
+        return {
+            "success": True,
+            "data": await agent.run_storage_maintenance()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/stream/metrics")
+async def get_stream_metrics():
+    """Get cumulative streaming metrics (cancelled streams, stopped runs, backpressure, heartbeats)."""
+    return {
+        "success": True,
+        "data": agent.get_stream_metrics()
+    }
+
+
+@app.get("/mcp/servers")
+async def get_mcp_servers():
+    """Get MCP server health, restart state and startup timings."""
+    return {
+        "success": True,
+        "data": agent.get_mcp_status()
+    }
+
+
+@app.get("/tools/stats")
+async def get_tool_stats():
+    """Get token counts of tool results before and after shaping, and tool cache statistics."""
+    return {
+        "success": True,
+        "data": agent.get_tool_stats()
+    }
+
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -166,8 +400,14 @@ async def root():
         "endpoints": {
             "/run-agent": "运行Agent(非流式模式)",
             "/run-agent-stream": "运行Agent(流式模式)",
+            "/streams/{run_id}": "按Last-Event-ID恢复后台流式运行",
+            "/runs": "提交后台运行(POST)，按run_id查询、订阅事件或取消",
             "/history/{user_id}": "获取用户的历史对话列表",
-            "/history/{user_id}/{thread_id}": "获取特定对话线程的详细内容"
+            "/history/{user_id}/{thread_id}": "获取特定对话线程的详细内容",
+            "/storage/maintenance": "查看或执行存储维护(保留策略与空间回收)",
+            "/stream/metrics": "查看流式响应统计(断开取消、背压、心跳)",
+            "/mcp/servers": "查看MCP服务器的健康状态、重启次数和启动耗时",
+            "/tools/stats": "查看工具结果精简前后的token数和工具缓存统计"
         }
     }
 
@@ -38,7 +38,123 @@ class Settings:
         self.WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
         
         # Search provider settings
+        # Comma-separated list (e.g. "tavily,serper") queries several providers concurrently
         self.SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "tavily")
+        # Providers whose results are merged per query when several are configured
+        self.SEARCH_FANOUT = int(os.getenv("SEARCH_FANOUT", "1"))
+        self.SEARCH_HEDGE = os.getenv("SEARCH_HEDGE", "true").lower() == "true"
+        self.SEARCH_HEDGE_QUANTILE = float(os.getenv("SEARCH_HEDGE_QUANTILE", "0.95"))
+        # Hedge delay in seconds until a provider has enough latency samples
+        self.SEARCH_HEDGE_DELAY = float(os.getenv("SEARCH_HEDGE_DELAY", "1.0"))
+        self.SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "20"))
+        self.SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+        self.SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+        # websearch_batch: searches running at once and queries accepted per call
+        self.SEARCH_BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "4"))
+        self.SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "10"))
+        
+        # Weather tool settings
+        self.WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "10"))
+        self.WEATHER_CURRENT_TTL = float(os.getenv("WEATHER_CURRENT_TTL", "600"))
+        self.WEATHER_FORECAST_TTL = float(os.getenv("WEATHER_FORECAST_TTL", "3600"))
+        self.WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+        # Requests per second sent to WeatherAPI, 0 disables the limit
+        self.WEATHER_RATE_LIMIT = float(os.getenv("WEATHER_RATE_LIMIT", "5"))
+        self.WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "4"))
+        
+        # Tool result shaping settings
+        self.TOOL_RESULT_SHAPING = os.getenv("TOOL_RESULT_SHAPING", "true").lower() == "true"
+        # Unit system of shaped results when the user preferences set none
+        self.TOOL_RESULT_UNITS = os.getenv("TOOL_RESULT_UNITS", "metric")
+        self.TOOL_RESULT_MAX_CHARS = int(os.getenv("TOOL_RESULT_MAX_CHARS", "4000"))
+        self.TOOL_RESULT_SNIPPET_CHARS = int(os.getenv("TOOL_RESULT_SNIPPET_CHARS", "300"))
+        
+        # Calculator settings
+        self.CALCULATOR_CACHE_SIZE = int(os.getenv("CALCULATOR_CACHE_SIZE", "256"))
+        # Batch evaluation backend: auto (numpy when installed), numpy or python
+        self.CALCULATOR_BACKEND = os.getenv("CALCULATOR_BACKEND", "auto").lower()
+        self.CALCULATOR_BATCH_MAX_SIZE = int(os.getenv("CALCULATOR_BATCH_MAX_SIZE", "10000"))
+        
+        # HTTP client settings (shared connection pool for tools)
+        self.HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+        self.HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        
+        # Agent run settings
+        self.MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "32"))
+        self.RUN_TIMEOUT = float(os.getenv("RUN_TIMEOUT", "600"))
+        self.RUN_QUEUE_TIMEOUT = float(os.getenv("RUN_QUEUE_TIMEOUT", "30"))
+        
+        # Background run manager settings
+        self.RUN_WORKERS = int(os.getenv("RUN_WORKERS", "8"))
+        self.RUN_QUEUE_LIMIT = int(os.getenv("RUN_QUEUE_LIMIT", "100"))
+        self.RUN_USER_QUEUE_LIMIT = int(os.getenv("RUN_USER_QUEUE_LIMIT", "10"))
+        self.RUN_RESUME_ON_STARTUP = os.getenv("RUN_RESUME_ON_STARTUP", "true").lower() == "true"
+        
+        # Streaming settings
+        self.STREAM_PROTOCOL = os.getenv("STREAM_PROTOCOL", "legacy")
+        self.STREAM_SNAPSHOT_INTERVAL = int(os.getenv("STREAM_SNAPSHOT_INTERVAL", "1000"))
+        self.STREAM_JSON_BACKEND = os.getenv("STREAM_JSON_BACKEND", "auto").lower()
+        self.STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "256"))
+        self.STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+        self.STREAM_RESUMABLE = os.getenv("STREAM_RESUMABLE", "true").lower() == "true"
+        self.STREAM_REPLAY_BUFFER_SIZE = int(os.getenv("STREAM_REPLAY_BUFFER_SIZE", "2048"))
+        self.STREAM_RESUME_TIMEOUT = float(os.getenv("STREAM_RESUME_TIMEOUT", "60"))
+        self.STREAM_RETENTION = float(os.getenv("STREAM_RETENTION", "300"))
+        self.STREAM_SPILL_PATH = os.getenv("STREAM_SPILL_PATH", "")
+        
+        # Serving settings (python -m app.serve)
+        self.SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))  # 0 = CPU count
+        self.SERVE_WORKER_INDEX = int(os.getenv("SERVE_WORKER_INDEX", "0"))  # worker 0 runs recovery and maintenance
+        self.SERVE_INSTANCE = os.getenv("SERVE_INSTANCE", "")  # set by app.serve, shared by the workers of one server
+        self.SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", "2048"))
+        
+        # MCP server settings
+        self.MCP_CONFIG_PATH = os.getenv("MCP_CONFIG_PATH", os.path.join(os.path.dirname(__file__), "mcp_servers.yaml"))
+        self.MCP_SERVERS = self._load_mcp_config()
+        self.MCP_STARTUP_MODE = os.getenv("MCP_STARTUP_MODE", "background").lower()  # eager, background or lazy
+        self.MCP_STARTUP_TIMEOUT = float(os.getenv("MCP_STARTUP_TIMEOUT", "60"))
+        self.MCP_MANIFEST_PATH = os.getenv("MCP_MANIFEST_PATH", "./persistence/mcp/manifest.json")
+        self.MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "1"))
+        self.MCP_POOL_MIN_SIZE = int(os.getenv("MCP_POOL_MIN_SIZE", "1"))
+        self.MCP_POOL_IDLE_TIMEOUT = float(os.getenv("MCP_POOL_IDLE_TIMEOUT", "300"))
+        self.MCP_POOL_MAX_LIFETIME = float(os.getenv("MCP_POOL_MAX_LIFETIME", "3600"))
+        self.MCP_POOL_CHECKOUT_TIMEOUT = float(os.getenv("MCP_POOL_CHECKOUT_TIMEOUT", "60"))
+        
+        # MCP gateway settings
+        self.MCP_GATEWAY_SOCKET = os.getenv("MCP_GATEWAY_SOCKET", "")
+        self.MCP_GATEWAY_URL = os.getenv("MCP_GATEWAY_URL", "")
+        self.MCP_GATEWAY_START_TIMEOUT = float(os.getenv("MCP_GATEWAY_START_TIMEOUT", "180"))
+        
+        # Storage settings
+        self.STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+        self.CHECKPOINTS_PATH = os.getenv("CHECKPOINTS_PATH", "./persistence/checkpoints/checkpoints.db")
+        self.MEMORIES_PATH = os.getenv("MEMORIES_PATH", "./persistence/memory/memories.db")
+        self.DATABASE_URL = os.getenv("DATABASE_URL")
+        self.POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+        
+        # Checkpoint encoding settings
+        self.CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "zlib")
+        self.CHECKPOINT_COMPRESSION_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESSION_MIN_BYTES", "1024"))
+        self.CHECKPOINT_DELTA_ENCODING = os.getenv("CHECKPOINT_DELTA_ENCODING", "false").lower() == "true"
+        self.CHECKPOINT_PRUNE_ON_WRITE = os.getenv("CHECKPOINT_PRUNE_ON_WRITE", "true").lower() == "true"
+        # Checkpoint writes per thread between two prunes on write
+        self.CHECKPOINT_PRUNE_INTERVAL = int(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "10"))
+        
+        # Storage maintenance settings
+        self.STORAGE_MAINTENANCE_INTERVAL = float(os.getenv("STORAGE_MAINTENANCE_INTERVAL", "3600"))
+        self.CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))
+        self.THREAD_RETENTION_DAYS = int(os.getenv("THREAD_RETENTION_DAYS", "0"))
+        self.STORAGE_VACUUM_MIN_FREE_BYTES = int(os.getenv("STORAGE_VACUUM_MIN_FREE_BYTES", str(4 * 1024 * 1024)))
+        self.RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower() == "true"
+        self.SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+        self.SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+        self.SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+        self.SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+        self.SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+        self.SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "4"))
+        self.SQLITE_GROUP_COMMIT = os.getenv("SQLITE_GROUP_COMMIT", "true").lower() == "true"
+        self.SQLITE_GROUP_COMMIT_MAX_DELAY = float(os.getenv("SQLITE_GROUP_COMMIT_MAX_DELAY", "1.0"))
     
     def _load_model_config(self) -> Dict[str, Any]:
         """Load model configuration from YAML file
@@ -73,6 +189,21 @@ class Settings:
             # Return empty dict if config can't be loaded
             return {}
 
+    
+    def _load_mcp_config(self) -> Dict[str, Dict[str, Any]]:
+        """Load MCP server definitions from YAML file
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Server name to connection and pool settings
+        """
+        try:
+            with open(self.MCP_CONFIG_PATH, "r", encoding="utf-8") as f:
+                yaml_config = yaml.safe_load(f) or {}
+            return yaml_config.get("servers") or {}
+        except Exception as e:
+            # No MCP servers if config can't be loaded
+            return {}
+
 
 # Create global settings instance
 settings = Settings()
@@ -1,11 +1,12 @@
 import json
-from typing import Any, Dict, Callable
+from typing import Any, Dict, Callable, Optional, Tuple
 from datetime import datetime
 from langchain.agents.middleware.types import AgentMiddleware
 from langchain.agents.middleware import AgentState
 from langgraph.runtime import Runtime
+from langgraph.config import get_config
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-from langgraph.store.sqlite.aio import AsyncSqliteStore
+from app.agent.backends.base import StorageBackend
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -14,77 +15,83 @@ logger = get_logger(__name__)
 class MemoryMiddleware(AgentMiddleware):
     """Middleware that automatically saves conversation history to memory."""
     
-    def __init__(self, sqlite_store: AsyncSqliteStore):
+    def __init__(self, storage_backend: StorageBackend):
         super().__init__()
-        self.sqlite_store = sqlite_store
-        self.current_user_id = 'user1'
-        self.current_thread_id = ''
-        logger.info("MemoryMiddleware initialized with AsyncSqliteStore")
+        # The middleware instance is shared by every concurrent run, so it must
+        # not hold per-run state; identity is resolved from each invocation.
+        self.storage_backend = storage_backend
+        logger.info(f"MemoryMiddleware initialized with {storage_backend.name} storage backend")
     
-    def _capture_config(self, obj: Any, source: str = "unknown"):
-        """Try to capture user_id and thread_id from runtime.context only."""
-        try:
-            # Only get from runtime.context (as specified by user)
-            if hasattr(obj, 'context'):
-                context = obj.context
-                if hasattr(context, 'user_id') and hasattr(context, 'thread_id'):
-                    user_id = context.user_id
-                    thread_id = context.thread_id
-                    if user_id or thread_id:
-                        self.current_user_id = user_id
-                        self.current_thread_id = thread_id
-                        logger.debug(f"Captured from {source} (context) - user_id: {self.current_user_id}, thread_id: {self.current_thread_id}")
-                        return
-            
-        except Exception as e:
-            logger.debug(f"Error capturing config from {source}: {e}")
+    def _resolve_identity(self, runtime: Any) -> Tuple[str, Optional[str]]:
+        """Resolve user_id and thread_id of the current invocation.
+        
+        Prefers runtime.context and falls back to the configurable of the
+        current run, which LangGraph keeps in a context variable per invocation.
+        """
+        user_id, thread_id = None, None
+        context = getattr(runtime, 'context', None)
+        if isinstance(context, dict):
+            user_id, thread_id = context.get('user_id'), context.get('thread_id')
+        elif context is not None:
+            user_id = getattr(context, 'user_id', None)
+            thread_id = getattr(context, 'thread_id', None)
+        
+        if not thread_id:
+            try:
+                configurable = get_config().get('configurable', {})
+                user_id = user_id or configurable.get('user_id')
+                thread_id = configurable.get('thread_id')
+            except RuntimeError:
+                # Called outside of a runnable context
+                pass
+        
+        return user_id or 'user1', thread_id
     
     def wrap_model_call(
         self, request: Any, handler: Callable[[Any], Any]
     ) -> Any:
-        """Wrap model call to capture user_id and thread_id from request."""
+        """Wrap model call without modification."""
         # Execute the model call
         return handler(request)
 
     async def awrap_model_call(
         self, request: Any, handler: Callable[[Any], Any]
     ) -> Any:
-        """Wrap model call to capture user_id and thread_id from request (async)."""
+        """Wrap model call without modification (async)."""
         # Execute the model call
         return await handler(request)
     
     def wrap_tool_call(
         self, request: Any, handler: Callable[[Any], Any]
     ) -> Any:
-        """Wrap tool call to capture user_id and thread_id from request."""
+        """Wrap tool call without modification."""
         # Execute the tool call
         return handler(request)
 
     async def awrap_tool_call(
         self, request: Any, handler: Callable[[Any], Any]
     ) -> Any:
-        """Wrap tool call to capture user_id and thread_id from request (async)."""
+        """Wrap tool call without modification (async)."""
         # Execute the tool call
         return await handler(request)
     
     def before_model(
         self, state: Any, runtime: Runtime
     ) -> Any | None:
-        """Before model execution - capture config from runtime."""
-        self._capture_config(runtime, "before_model")
+        """Before model execution."""
         return None
 
     async def abefore_model(
         self, state: Any, runtime: Runtime
     ) -> Any | None:
-        """Before model execution - capture config from runtime (async)."""
-        self._capture_config(runtime, "abefore_model")
+        """Before model execution (async)."""
         return None
     
     def _serialize_message(self, message: Any) -> dict:
         """Serialize a message to a dictionary."""
         if isinstance(message, HumanMessage):
             return {
+                'id': message.id,
                 'type': 'human',
                 'content': message.content,
                 'timestamp': datetime.now().isoformat()
@@ -93,67 +100,60 @@ class MemoryMiddleware(AgentMiddleware):
             # Use message.content instead of content_blocks to avoid [object Object] in frontend
             content = message.content if hasattr(message, 'content') and message.content else str(message.content_blocks)
             return {
+                'id': message.id,
                 'type': 'ai',
                 'content': content,
                 'timestamp': datetime.now().isoformat()
             }
         elif isinstance(message, ToolMessage):
             return {
+                'id': message.id,
                 'type': 'tool',
                 'content': message.content,
                 'tool_name': message.name,
                 'timestamp': datetime.now().isoformat()
             }
         return {
+            'id': getattr(message, 'id', None),
             'type': 'unknown',
             'content': str(message),
             'timestamp': datetime.now().isoformat()
         }
     
-    async def _save_conversation_history(self, messages: list):
-        """Save conversation history to memory store with thread_id support."""
+    @staticmethod
+    def _new_messages_start(messages: list, persisted_count: int, last_message_id: Optional[str]) -> int:
+        """Return the index of the first message in state that is not yet persisted.
+        
+        State normally only grows, so everything after the persisted count is new.
+        If the history was rewritten (e.g. summarized), resume after the last
+        persisted message id, or persist the whole state if it is gone.
+        """
+        if persisted_count == 0:
+            return 0
+        if persisted_count <= len(messages) and getattr(messages[persisted_count - 1], 'id', None) == last_message_id:
+            return persisted_count
+        for index in range(len(messages) - 1, -1, -1):
+            if getattr(messages[index], 'id', None) == last_message_id:
+                return index + 1
+        return 0
+    
+    async def _save_conversation_history(self, messages: list, user_id: str, thread_id: Optional[str]):
+        """Append the messages added since the last step to the thread's message log."""
         try:
-            user_id = self.current_user_id
-            thread_id = self.current_thread_id
-            date_str = datetime.now().strftime('%Y-%m-%d')
-            
             if not thread_id:
                 logger.debug(f"No thread_id available, skipping save")
                 return
             
-            # Serialize messages
-            serialized_messages = [self._serialize_message(msg) for msg in messages]
-            
-            # Commit any pending transaction
-            try:
-                await self.sqlite_store.conn.commit()
-            except Exception:
-                pass
-            
             # Import storage functions
             from app.agent import storage
             
-            # Get existing thread
-            existing_thread = await storage.get_thread_history(self.sqlite_store, user_id, thread_id)
+            persisted_count, last_message_id = await storage.get_thread_cursor(self.storage_backend, user_id, thread_id)
+            start = self._new_messages_start(messages, persisted_count, last_message_id)
             
-            if existing_thread:
-                # Update existing thread
-                existing_thread['date'] = date_str
-                existing_thread['messages'] = serialized_messages
-                existing_thread['updated_at'] = datetime.now().isoformat()
-                await storage.save_thread_history(self.sqlite_store, user_id, existing_thread)
-            else:
-                # Create new thread
-                new_thread = {
-                    'thread_id': thread_id,
-                    'date': date_str,
-                    'messages': serialized_messages,
-                    'updated_at': datetime.now().isoformat()
-                }
-                await storage.save_thread_history(self.sqlite_store, user_id, new_thread)
-                await storage.add_thread_to_index(self.sqlite_store, user_id, thread_id)
-            logger.info(f"Saved conversation history for user: {user_id}, thread: {thread_id}")
-            logger.debug(f"Conversation saved successfully")
+            # Serialize only the new messages
+            new_messages = [self._serialize_message(msg) for msg in messages[start:]]
+            await storage.append_thread_messages(self.storage_backend, user_id, thread_id, new_messages)
+            logger.info(f"Saved {len(new_messages)} new messages for user: {user_id}, thread: {thread_id}")
             
         except Exception as e:
             logger.error(f"Error saving conversation history: {e}", exc_info=True)
@@ -191,8 +191,9 @@ class MemoryMiddleware(AgentMiddleware):
             # Get messages from state if it exists
             messages = state.get('messages', []) if 'messages' in state else []
             if messages:
-                logger.debug(f"Saving conversation history with {len(messages)} messages")
-                await self._save_conversation_history(messages)
+                user_id, thread_id = self._resolve_identity(runtime)
+                logger.debug(f"Saving conversation history with {len(messages)} messages for user: {user_id}, thread: {thread_id}")
+                await self._save_conversation_history(messages, user_id, thread_id)
             
         except Exception as e:
             logger.error(f"Error in MemoryMiddleware.aafter_model: {e}", exc_info=True)
@@ -202,15 +203,13 @@ class MemoryMiddleware(AgentMiddleware):
     def before_agent(
         self, state: AgentState, runtime: Runtime
     ) -> Dict[str, Any] | None:
-        """Before agent execution - capture config from runtime."""
-        self._capture_config(runtime, "before_agent")
+        """Before agent execution."""
         return None
 
     async def abefore_agent(
         self, state: AgentState, runtime: Runtime
     ) -> Dict[str, Any] | None:
-        """Before agent execution - capture config from runtime (async)."""
-        self._capture_config(runtime, "abefore_agent")
+        """Before agent execution (async)."""
         return None
 
     def after_agent(
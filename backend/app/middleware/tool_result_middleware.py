@@ -0,0 +1,80 @@
+from typing import Any, Callable, Optional, Tuple
+from langchain.agents.middleware.types import AgentMiddleware
+from langchain_core.messages import ToolMessage
+from app.tools.result_shaping import ShapingOptions, is_shaped, shape_tool_result
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ToolResultShapingMiddleware(AgentMiddleware):
+    """Middleware that shapes known tool results before they enter the model context.
+
+    The tools keep returning their full results; only the ToolMessage content the
+    model sees is projected. Token counts before and after shaping are attached to
+    the message's response_metadata under "shaping".
+    """
+
+    def __init__(self, preferences_namespace: Tuple[str, ...]):
+        super().__init__()
+        # Store namespace of the user preferences holding the "units" setting
+        self.preferences_namespace = preferences_namespace
+
+    @staticmethod
+    def _units(preferences: Any) -> Optional[str]:
+        value = getattr(preferences, 'value', None)
+        return value.get('units') if isinstance(value, dict) else None
+
+    def _get_units(self, request: Any) -> Optional[str]:
+        """Unit system from the user preferences in the store, if set."""
+        store = getattr(getattr(request, 'runtime', None), 'store', None)
+        if store is None:
+            return None
+        try:
+            return self._units(store.get(self.preferences_namespace, 'settings'))
+        except Exception as e:
+            logger.debug(f"Failed to read unit preference: {e}")
+            return None
+
+    async def _aget_units(self, request: Any) -> Optional[str]:
+        """Unit system from the user preferences in the store, if set (async)."""
+        store = getattr(getattr(request, 'runtime', None), 'store', None)
+        if store is None:
+            return None
+        try:
+            return self._units(await store.aget(self.preferences_namespace, 'settings'))
+        except Exception as e:
+            logger.debug(f"Failed to read unit preference: {e}")
+            return None
+
+    @staticmethod
+    def _shape(result: Any, tool_name: str, units: Optional[str]) -> Any:
+        if not isinstance(result, ToolMessage) or result.status == 'error':
+            return result
+        content, report = shape_tool_result(tool_name, result.content, ShapingOptions.from_settings(units))
+        if report is None:
+            return result
+        return result.model_copy(update={
+            'content': content,
+            'response_metadata': {**result.response_metadata, 'shaping': report}
+        })
+
+    def wrap_tool_call(
+        self, request: Any, handler: Callable[[Any], Any]
+    ) -> Any:
+        """Shape the result of the tool call."""
+        result = handler(request)
+        tool_name = request.tool_call['name']
+        if not is_shaped(tool_name):
+            return result
+        return self._shape(result, tool_name, self._get_units(request))
+
+    async def awrap_tool_call(
+        self, request: Any, handler: Callable[[Any], Any]
+    ) -> Any:
+        """Shape the result of the tool call (async)."""
+        result = await handler(request)
+        tool_name = request.tool_call['name']
+        if not is_shaped(tool_name):
+            return result
+        return self._shape(result, tool_name, await self._aget_units(request))
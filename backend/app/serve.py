@@ -0,0 +1,323 @@
+"""
+生产部署：预派生(prefork)多进程服务
+
+拓扑：
+    supervisor(本进程)
+      ├─ MCP网关进程(python -m app.tools.mcp_gateway)：每个MCP服务器只启动pool_size个进程，
+      │  工作进程通过本地Unix套接字访问(不支持fork的平台上使用回环TCP端口)
+      └─ N个工作进程：从已完成导入的父进程fork，共享同一个监听套接字，
+         各自运行一个uvicorn事件循环
+
+共享的启动产物：
+- 数据库迁移和用户偏好初始化在父进程执行一次，工作进程启动时不再迁移
+- 应用模块和工具模块在fork前导入，工作进程直接复用(写时复制)，启动即可服务
+- MCP子进程只在网关中启动，工作进程退出或重启不影响MCP服务器
+
+存储由所有工作进程共享，推荐STORAGE_BACKEND=postgres。使用SQLite时关闭检查点
+分组提交，避免一个进程长时间持有写事务阻塞其他进程。只有0号工作进程执行存储维护
+和恢复上一次服务遗留的后台运行，重启的工作进程只恢复自己遗留的运行。可恢复流的事件日志和后台运行队列在各工作进程内存中，负载均衡器
+需要按会话粘滞路由，见README。
+
+用法：
+    python -m app.serve --workers 4 --port 8000
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+import httpx
+import uvicorn
+
+from app.agent import storage
+from app.config.settings import settings
+from app.tools.registry import ToolRegistry
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 工作进程异常退出后重启前的等待时间（秒），避免启动失败时快速循环
+RESTART_DELAY = 1.0
+# 网关连续重启失败时的最长等待时间（秒）
+MAX_GATEWAY_RESTART_DELAY = 60.0
+
+
+async def prepare_shared_state() -> None:
+    """执行一次迁移和初始化，并预先导入工具模块"""
+    backend = await storage.initialize_storage_backend()
+    try:
+        await storage.initialize_user_preferences(backend.store)
+    finally:
+        await backend.close()
+    # 只导入模块，工具实例在各工作进程启动时创建
+    await ToolRegistry().load_tools()
+
+
+def worker_spill_path(path: str, index: int) -> str:
+    """每个工作进程使用独立的事件溢出文件"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+class MCPGatewayProcess:
+    """MCP网关子进程"""
+
+    def __init__(self, socket_path: Optional[str] = None, port: Optional[int] = None):
+        self.socket_path = socket_path
+        self.port = port
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> None:
+        command = [sys.executable, "-m", "app.tools.mcp_gateway"]
+        if self.socket_path:
+            command += ["--socket", self.socket_path]
+        else:
+            command += ["--port", str(self.port)]
+        self.process = subprocess.Popen(command)
+        logger.info(f"MCP gateway started (pid {self.process.pid})")
+
+    def wait_ready(self, timeout: float, on_poll: Optional[Callable[[], None]] = None) -> None:
+        """等待网关启动完所有MCP服务器，网关在启动完成后才接受请求
+
+        Args:
+            timeout: 最长等待时间（秒）
+            on_poll: 每次检查之间调用，供supervisor处理退出的工作进程
+        """
+        if self.socket_path:
+            client = httpx.Client(transport=httpx.HTTPTransport(uds=self.socket_path), base_url="http://mcp-gateway")
+        else:
+            client = httpx.Client(base_url=self.url)
+        deadline = time.monotonic() + timeout
+        with client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"MCP gateway exited with code {self.process.returncode}")
+                try:
+                    response = client.get("/health", timeout=2.0)
+                    if response.status_code == 200:
+                        logger.info(f"MCP gateway is ready: {response.json()['servers']}")
+                        return
+                except httpx.TransportError:
+                    pass
+                if on_poll:
+                    on_poll()
+                time.sleep(0.2)
+        raise RuntimeError(f"MCP gateway did not become ready within {timeout}s")
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class Supervisor:
+    """fork工作进程并在其异常退出时重启"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, gateway: Optional[MCPGatewayProcess] = None):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.gateway = gateway
+        # pid -> 工作进程编号
+        self.children: Dict[int, int] = {}
+        self.stopping = False
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            logger.info(f"Worker {index} started (pid {pid})")
+            return
+        code = 1
+        try:
+            self._run_worker(index)
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+
+    def _run_worker(self, index: int) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        os.environ["SERVE_WORKER_INDEX"] = str(index)
+        settings.SERVE_WORKER_INDEX = index
+        from app.api import api
+        if api.agent.streams.spill_path:
+            api.agent.streams.spill_path = worker_spill_path(api.agent.streams.spill_path, index)
+        config = uvicorn.Config(self.app, log_level=settings.LOG_LEVEL, lifespan="on")
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def _handle_stop(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        logger.info(f"Received signal {signum}, stopping workers...")
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def restart_gateway(self) -> None:
+        """重启网关并像启动时一样等待其就绪，失败时延迟后重试，延迟逐次加倍
+
+        等待期间继续回收和重启退出的工作进程。工作进程的MCP会话按调用建立，
+        网关就绪后自动重连。
+        """
+        delay = RESTART_DELAY
+        while not self.stopping:
+            self.gateway.start()
+            try:
+                self.gateway.wait_ready(settings.MCP_GATEWAY_START_TIMEOUT, on_poll=self.reap_workers)
+                return
+            except RuntimeError as e:
+                logger.error(f"MCP gateway restart failed, retrying in {delay:.0f}s: {e}")
+                self.gateway.stop()
+            deadline = time.monotonic() + delay
+            while not self.stopping and time.monotonic() < deadline:
+                self.reap_workers()
+                time.sleep(0.2)
+            delay = min(delay * 2, MAX_GATEWAY_RESTART_DELAY)
+
+    def reap_workers(self) -> None:
+        """不阻塞地回收已退出的工作进程"""
+        for pid in list(self.children):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if done:
+                self.worker_exited(pid, status)
+
+    def worker_exited(self, pid: int, status: int) -> None:
+        index = self.children.pop(pid, None)
+        if index is None or self.stopping:
+            return
+        logger.error(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(RESTART_DELAY)
+        self.spawn(index)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            if self.gateway and self.gateway.process and pid == self.gateway.process.pid:
+                if not self.stopping:
+                    logger.error(f"MCP gateway exited with status {status}, restarting")
+                    self.restart_gateway()
+                continue
+            self.worker_exited(pid, status)
+
+        if self.gateway:
+            self.gateway.stop()
+        logger.info("All workers stopped")
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def configure_shared_storage(workers: int) -> None:
+    if workers <= 1:
+        return
+    if settings.STORAGE_BACKEND == "memory":
+        logger.warning("STORAGE_BACKEND=memory is not shared between workers, use postgres for multi-worker serving")
+    elif settings.STORAGE_BACKEND == "sqlite":
+        logger.warning("SQLite serializes writes from all workers, use STORAGE_BACKEND=postgres for multi-worker serving")
+        # 分组提交会在一个步骤内持有写事务，多进程时会阻塞其他进程的写入
+        settings.SQLITE_GROUP_COMMIT = False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the agent API with preforked workers and a shared MCP gateway")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS or os.cpu_count() or 1)
+    parser.add_argument("--gateway-port", type=int, default=8932, help="MCP gateway TCP port when Unix sockets are unavailable")
+    parser.add_argument("--no-gateway", action="store_true", help="launch MCP servers in every worker instead of a shared gateway")
+    args = parser.parse_args()
+    workers = max(args.workers, 1)
+    can_fork = hasattr(os, "fork")
+
+    configure_shared_storage(workers)
+    asyncio.run(prepare_shared_state())
+    # 工作进程不再重复执行迁移
+    settings.RUN_MIGRATIONS_ON_STARTUP = False
+    os.environ["RUN_MIGRATIONS_ON_STARTUP"] = "false"
+
+    gateway = None
+    if not args.no_gateway and not (settings.MCP_GATEWAY_SOCKET or settings.MCP_GATEWAY_URL):
+        if can_fork:
+            socket_path = os.path.join(tempfile.gettempdir(), f"opengigi-mcp-{os.getpid()}.sock")
+            gateway = MCPGatewayProcess(socket_path=socket_path)
+            settings.MCP_GATEWAY_SOCKET = socket_path
+        else:
+            gateway = MCPGatewayProcess(port=args.gateway_port)
+            settings.MCP_GATEWAY_URL = gateway.url
+            os.environ["MCP_GATEWAY_URL"] = gateway.url
+        gateway.start()
+        try:
+            gateway.wait_ready(settings.MCP_GATEWAY_START_TIMEOUT)
+        except BaseException:
+            gateway.stop()
+            raise
+
+    if not can_fork:
+        # 不支持fork的平台(Windows)：由uvicorn启动工作进程，各进程重新导入应用。
+        # 无法区分工作进程编号，存储维护和运行恢复不在任何工作进程中执行
+        logger.warning("os.fork is unavailable, falling back to uvicorn workers without storage maintenance and run recovery")
+        os.environ["SERVE_WORKER_INDEX"] = "1"
+        try:
+            uvicorn.run("app.api.api:app", host=args.host, port=args.port, workers=workers, log_level=settings.LOG_LEVEL)
+        finally:
+            if gateway:
+                gateway.stop()
+        return
+
+    # 工作进程用实例ID区分本次服务和上一次服务遗留的后台运行
+    settings.SERVE_INSTANCE = uuid.uuid4().hex
+    os.environ["SERVE_INSTANCE"] = settings.SERVE_INSTANCE
+    # 在fork前导入应用，工作进程共享已导入的模块
+    from app.api.api import app
+    sock = bind_socket(args.host, args.port, settings.SERVE_BACKLOG)
+    logger.info(f"Serving on {args.host}:{args.port} with {workers} workers")
+    Supervisor(app, sock, workers, gateway).run()
+
+
+if __name__ == "__main__":
+    main()
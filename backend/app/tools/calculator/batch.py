@@ -0,0 +1,271 @@
+"""
+Batch Expression Evaluation
+
+Evaluates one expression for many variable bindings in a single call. With
+NumPy installed the expression is compiled a second time with NumPy functions
+and evaluated over whole columns of values at once (float64). Without NumPy, or
+when an element fails (division by zero, a domain error, an overflow), every
+binding is evaluated on its own by the scalar engine, so failures are reported
+per element and the other results are kept.
+"""
+
+import ast
+import itertools
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache, reduce
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+from app.config.settings import settings
+from app.tools.calculator.expression import (
+    BINARY_OPERATORS,
+    CompiledExpression,
+    ExpressionError,
+    Evaluator,
+    Number,
+    _Compiler,
+    _factorial,
+    check_variable_names,
+    compile_expression,
+    parse_expression,
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BACKENDS = ("auto", "numpy", "python")
+# Errors listed individually in a batch result
+MAX_REPORTED_ERRORS = 10
+
+
+def _load_numpy():
+    backend = settings.CALCULATOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported CALCULATOR_BACKEND: {backend}. Supported: {', '.join(BACKENDS)}")
+    if backend == "python":
+        return None
+    try:
+        import numpy
+    except ImportError:
+        if backend == "numpy":
+            raise ImportError("numpy library is not installed. Please run 'pip install numpy'")
+        return None
+    return numpy
+
+
+np = _load_numpy()
+# Backend actually used for batches
+BACKEND = "numpy" if np is not None else "python"
+
+
+def _numpy_tables():
+    """NumPy counterparts of the scalar FUNCTIONS and BINARY_OPERATORS tables"""
+
+    def log(x, base=None):
+        return np.log(x) if base is None else np.log(x) / np.log(base)
+
+    functions = {
+        "sqrt": np.sqrt,
+        "abs": np.abs,
+        "round": np.round,
+        "min": lambda *args: reduce(np.minimum, args),
+        "max": lambda *args: reduce(np.maximum, args),
+        # float_power computes in float64, so integer constants cannot overflow or
+        # reject negative exponents
+        "pow": np.float_power,
+        "exp": np.exp,
+        "log": log,
+        "ln": np.log,
+        "log10": np.log10,
+        "log2": np.log2,
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+        "sec": lambda x: 1 / np.cos(x),
+        "csc": lambda x: 1 / np.sin(x),
+        "cot": lambda x: 1 / np.tan(x),
+        "asin": np.arcsin,
+        "acos": np.arccos,
+        "atan": np.arctan,
+        "atan2": np.arctan2,
+        "sinh": np.sinh,
+        "cosh": np.cosh,
+        "tanh": np.tanh,
+        "degrees": np.degrees,
+        "radians": np.radians,
+        "hypot": np.hypot,
+        "floor": np.floor,
+        "ceil": np.ceil,
+        "factorial": np.vectorize(lambda n: float(_factorial(n)), otypes=[float]),
+    }
+    return functions, {**BINARY_OPERATORS, ast.Pow: np.float_power}
+
+
+if np is not None:
+    NUMPY_FUNCTIONS, NUMPY_BINARY_OPERATORS = _numpy_tables()
+
+
+@lru_cache(maxsize=settings.CALCULATOR_CACHE_SIZE)
+def _compile_numpy(expression: str) -> Evaluator:
+    compiler = _Compiler(NUMPY_FUNCTIONS, NUMPY_BINARY_OPERATORS)
+    # Constant subexpressions are folded here, so they must raise like the rest
+    with np.errstate(all="raise"):
+        return compiler.compile(parse_expression(expression).body)
+
+
+@dataclass
+class BatchResult:
+    """Results of one expression evaluated for every binding"""
+    # One result per binding, None where the evaluation failed
+    results: List[Optional[Number]]
+    # Values of the variables that vary between bindings, in binding order
+    inputs: Dict[str, List[Number]]
+    # Sum, mean, min and max of the successful results
+    stats: Dict[str, Optional[Number]]
+    # Failed bindings as {"index", "message"}, at most MAX_REPORTED_ERRORS
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    error_count: int = 0
+    backend: str = "python"
+
+
+def expand_range(name: str, spec: Sequence[Number]) -> List[Number]:
+    """Values of a [start, stop] or [start, stop, step] range, stop included"""
+    if len(spec) not in (2, 3):
+        raise ExpressionError(f"Range of {name} must be [start, stop] or [start, stop, step]")
+    start, stop = spec[0], spec[1]
+    step = spec[2] if len(spec) == 3 else 1
+    if step == 0 or (stop - start) * step < 0:
+        raise ExpressionError(f"Range of {name} never reaches {stop} with step {step}")
+    # A small tolerance keeps stop included despite float rounding (e.g. 0.1 steps)
+    count = math.floor((stop - start) / step + 1e-9) + 1
+    if count > settings.CALCULATOR_BATCH_MAX_SIZE:
+        raise ExpressionError(f"Range of {name} has more than {settings.CALCULATOR_BATCH_MAX_SIZE} values")
+    return [start + i * step for i in range(count)]
+
+
+def _bindings(
+    variables: Mapping[str, Union[Number, Sequence[Number]]],
+    ranges: Mapping[str, Sequence[Number]],
+    grid: bool
+) -> tuple:
+    """Split the variables into fixed values and equally long columns of values"""
+    fixed = {}
+    columns = {}
+    for name, value in variables.items():
+        if isinstance(value, (list, tuple)):
+            columns[name] = list(value)
+        else:
+            fixed[name] = value
+    for name, spec in ranges.items():
+        if name in variables:
+            raise ExpressionError(f"{name} is given both as a variable and as a range")
+        columns[name] = expand_range(name, spec)
+
+    limit = settings.CALCULATOR_BATCH_MAX_SIZE
+    if grid:
+        count = math.prod(len(values) for values in columns.values())
+        if count > limit:
+            raise ExpressionError(f"The grid has {count} combinations, the limit is {limit}")
+        combinations = list(itertools.product(*columns.values()))
+        columns = {name: [combination[i] for combination in combinations] for i, name in enumerate(columns)}
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        sizes = ", ".join(f"{name} ({len(values)})" for name, values in columns.items())
+        raise ExpressionError(f"Value lists must have the same length, or set grid to combine them: {sizes}")
+    count = lengths.pop() if lengths else 1
+    if count > limit:
+        raise ExpressionError(f"{count} values given, the limit is {limit}")
+    return fixed, columns, count
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ZeroDivisionError):
+        return "Division by zero error"
+    return str(error) or type(error).__name__
+
+
+def _summarize(values: List[Number]) -> Dict[str, Optional[Number]]:
+    if not values:
+        return {"sum": None, "mean": None, "min": None, "max": None}
+    total = sum(values)
+    return {"sum": total, "mean": total / len(values), "min": min(values), "max": max(values)}
+
+
+def _evaluate_numpy(expression: str, fixed: Dict[str, Number], columns: Dict[str, List[Number]], count: int) -> BatchResult:
+    evaluator = _compile_numpy(expression)
+    bindings = dict(fixed)
+    bindings.update((name, np.asarray(values, dtype=float)) for name, values in columns.items())
+    with np.errstate(all="raise"):
+        values = evaluator(bindings)
+    # Expressions without varying variables give a single value
+    values = np.broadcast_to(np.asarray(values, dtype=float), (count,))
+    total = float(values.sum())
+    return BatchResult(
+        results=values.tolist(),
+        inputs=columns,
+        stats={"sum": total, "mean": total / count, "min": float(values.min()), "max": float(values.max())},
+        backend="numpy"
+    )
+
+
+def _evaluate_python(compiled: CompiledExpression, fixed: Dict[str, Number], columns: Dict[str, List[Number]], count: int) -> BatchResult:
+    results = []
+    errors = []
+    error_count = 0
+    bindings = dict(fixed)
+    for index in range(count):
+        for name, values in columns.items():
+            bindings[name] = values[index]
+        try:
+            results.append(compiled.evaluate(bindings))
+        except Exception as e:
+            results.append(None)
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"index": index, "message": _error_message(e)})
+    return BatchResult(
+        results=results,
+        inputs=columns,
+        stats=_summarize([result for result in results if result is not None]),
+        errors=errors,
+        error_count=error_count
+    )
+
+
+def evaluate_batch(
+    expression: str,
+    variables: Optional[Mapping[str, Union[Number, Sequence[Number]]]] = None,
+    ranges: Optional[Mapping[str, Sequence[Number]]] = None,
+    grid: bool = False
+) -> BatchResult:
+    """Evaluate an expression for every binding of its variables
+
+    Args:
+        expression: Expression accepted by compile_expression
+        variables: Variable values; a list gives one value per binding, a number
+            is used in every binding
+        ranges: Variables stepping through [start, stop] or [start, stop, step]
+        grid: Bind every combination of the list and range values instead of
+            pairing them up by position
+
+    Raises:
+        SyntaxError: The expression cannot be parsed
+        ExpressionError: The expression or the bindings are invalid, or a
+            variable is named like a constant or a function
+        ZeroDivisionError: A constant subexpression divides by zero
+    """
+    # The scalar compile validates the expression and tells which variables it needs
+    compiled = compile_expression(expression)
+    check_variable_names(itertools.chain(variables or {}, ranges or {}))
+    fixed, columns, count = _bindings(variables or {}, ranges or {}, grid)
+    missing = compiled.variables.difference(fixed, columns)
+    if missing:
+        raise ExpressionError(f"Missing value for variable(s): {', '.join(sorted(missing))}")
+
+    if np is not None:
+        try:
+            return _evaluate_numpy(expression, fixed, columns, count)
+        except Exception as e:
+            # Evaluate element by element to find and report the failing bindings
+            logger.debug(f"Vectorized evaluation of {expression!r} failed, evaluating per element: {e}")
+    return _evaluate_python(compiled, fixed, columns, count)
@@ -0,0 +1,287 @@
+"""
+Arithmetic Expression Engine
+
+Parses an expression with Python's ast module, rejects everything but numbers,
+arithmetic operators, known functions, constants and variables, and compiles
+the tree into nested closures. Nothing is passed to eval, and names are resolved
+as whole identifiers, so "e" in "sec(x)" or "ceil(x)" is not the constant e.
+
+Compiled expressions are cached by expression text in an LRU cache, so a
+formula evaluated repeatedly (e.g. with different variables) is parsed once.
+"""
+
+import ast
+import math
+import operator
+import sys
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Mapping, Optional, Union
+
+from app.config.settings import settings
+
+Number = Union[int, float]
+Evaluator = Callable[[Mapping[str, Number]], Number]
+
+MAX_EXPRESSION_LENGTH = 2000
+# Integer results must be convertible to str for the tool result, which Python
+# limits to sys.get_int_max_str_digits() digits (0 means no limit)
+MAX_RESULT_DIGITS = sys.get_int_max_str_digits() or 4300
+MAX_RESULT_BITS = int(MAX_RESULT_DIGITS * math.log2(10)) - 1
+
+
+class ExpressionError(ValueError):
+    """The expression is not a valid arithmetic expression or cannot be evaluated"""
+
+
+def _power(base: Number, exponent: Number) -> Number:
+    if isinstance(base, int) and isinstance(exponent, int) and abs(base) > 1 and exponent > 0:
+        if exponent * math.log2(abs(base)) > MAX_RESULT_BITS:
+            raise ExpressionError(f"Result has more than {MAX_RESULT_DIGITS} digits")
+    result = base ** exponent
+    if isinstance(result, complex):
+        raise ExpressionError("Result is not a real number")
+    return result
+
+
+def _check_result(result: Number) -> Number:
+    if isinstance(result, int) and result.bit_length() > MAX_RESULT_BITS:
+        raise ExpressionError(f"Result has more than {MAX_RESULT_DIGITS} digits")
+    return result
+
+
+def _factorial(n: Number) -> int:
+    if n > 1 and math.lgamma(n + 1) / math.log(2) > MAX_RESULT_BITS:
+        raise ExpressionError(f"factorial() result has more than {MAX_RESULT_DIGITS} digits")
+    if isinstance(n, float):
+        if not n.is_integer():
+            raise ExpressionError("factorial() only accepts integral values")
+        n = int(n)
+    return math.factorial(n)
+
+
+def _named(name: str, function: Callable[..., Number]) -> Callable[..., Number]:
+    """Name a helper after its calculator function, so argument errors read "sec() takes ..." """
+    function.__name__ = function.__qualname__ = name
+    return function
+
+
+FUNCTIONS: Dict[str, Callable[..., Number]] = {
+    "sqrt": math.sqrt,
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "pow": _named("pow", lambda base, exponent: _power(base, exponent)),
+    "exp": math.exp,
+    # log(x) is the natural logarithm, log(x, base) uses the given base
+    "log": math.log,
+    "ln": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "sec": _named("sec", lambda x: 1 / math.cos(x)),
+    "csc": _named("csc", lambda x: 1 / math.sin(x)),
+    "cot": _named("cot", lambda x: 1 / math.tan(x)),
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "atan2": math.atan2,
+    "sinh": math.sinh,
+    "cosh": math.cosh,
+    "tanh": math.tanh,
+    "degrees": math.degrees,
+    "radians": math.radians,
+    "hypot": math.hypot,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "factorial": _named("factorial", lambda n: _factorial(n)),
+}
+
+CONSTANTS: Dict[str, float] = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+    "inf": math.inf,
+}
+
+# Names that cannot be used as variables
+RESERVED_NAMES = frozenset(CONSTANTS).union(FUNCTIONS)
+
+
+def check_variable_names(names: Iterable[str]) -> None:
+    """Reject variable names that are taken by a constant or a function
+
+    Constants and functions are resolved before variables, so such a variable
+    would silently be ignored.
+
+    Raises:
+        ExpressionError: A name is a constant or a function name
+    """
+    for name in names:
+        if name in CONSTANTS:
+            raise ExpressionError(f"{name} is a constant and cannot be used as a variable name")
+        if name in FUNCTIONS:
+            raise ExpressionError(f"{name} is a function and cannot be used as a variable name")
+
+
+BINARY_OPERATORS: Dict[type, Callable[[Number, Number], Number]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _power,
+}
+
+UNARY_OPERATORS: Dict[type, Callable[[Number], Number]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+class CompiledExpression:
+    """A validated expression compiled to closures"""
+
+    def __init__(self, source: str, evaluator: Evaluator, variables: FrozenSet[str]):
+        self.source = source
+        self.variables = variables
+        self._evaluator = evaluator
+
+    def evaluate(self, variables: Optional[Mapping[str, Number]] = None) -> Number:
+        """Evaluate with the given variable values
+
+        Raises:
+            ExpressionError: A variable has no value or is named like a constant
+                or a function, or a value is out of range
+            ZeroDivisionError: The expression divides by zero
+        """
+        variables = variables or {}
+        if not RESERVED_NAMES.isdisjoint(variables):
+            check_variable_names(variables)
+        missing = self.variables.difference(variables)
+        if missing:
+            raise ExpressionError(f"Missing value for variable(s): {', '.join(sorted(missing))}")
+        return _check_result(self._evaluator(variables))
+
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.source!r})"
+
+
+class _Compiler:
+    """Compiles a validated ast.Expression into closures over a variables mapping
+
+    The function and operator tables are replaceable, so the same tree can be
+    compiled for other value types (e.g. NumPy arrays).
+    """
+
+    def __init__(
+        self,
+        functions: Mapping[str, Callable[..., Any]] = FUNCTIONS,
+        binary_operators: Mapping[type, Callable[[Any, Any], Any]] = BINARY_OPERATORS,
+        unary_operators: Mapping[type, Callable[[Any], Any]] = UNARY_OPERATORS
+    ):
+        self.functions = functions
+        self.binary_operators = binary_operators
+        self.unary_operators = unary_operators
+        self.variables = set()
+
+    def compile(self, node: ast.AST) -> Evaluator:
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+        return method(node)
+
+    @staticmethod
+    def _constant(value: Number) -> Evaluator:
+        evaluator = lambda variables: value
+        evaluator.constant = value
+        return evaluator
+
+    @staticmethod
+    def _is_constant(evaluator: Evaluator) -> bool:
+        return hasattr(evaluator, "constant")
+
+    def _compile_Constant(self, node: ast.Constant) -> Evaluator:
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ExpressionError(f"Unsupported value: {node.value!r}")
+        return self._constant(node.value)
+
+    def _compile_Name(self, node: ast.Name) -> Evaluator:
+        name = node.id
+        if name in CONSTANTS:
+            return self._constant(CONSTANTS[name])
+        if name in self.functions:
+            raise ExpressionError(f"{name} is a function, call it as {name}(...)")
+        self.variables.add(name)
+        return lambda variables: variables[name]
+
+    def _compile_BinOp(self, node: ast.BinOp) -> Evaluator:
+        op = self.binary_operators.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        left, right = self.compile(node.left), self.compile(node.right)
+        if self._is_constant(left) and self._is_constant(right):
+            # Fold constant subexpressions once at compile time
+            return self._constant(op(left.constant, right.constant))
+        return lambda variables: op(left(variables), right(variables))
+
+    def _compile_UnaryOp(self, node: ast.UnaryOp) -> Evaluator:
+        op = self.unary_operators.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        operand = self.compile(node.operand)
+        if self._is_constant(operand):
+            return self._constant(op(operand.constant))
+        return lambda variables: op(operand(variables))
+
+    def _compile_Call(self, node: ast.Call) -> Evaluator:
+        if not isinstance(node.func, ast.Name) or node.func.id not in self.functions:
+            name = node.func.id if isinstance(node.func, ast.Name) else type(node.func).__name__
+            raise ExpressionError(f"Unknown function: {name}")
+        if node.keywords:
+            raise ExpressionError("Keyword arguments are not supported")
+        function = self.functions[node.func.id]
+        args = [self.compile(arg) for arg in node.args]
+        if all(self._is_constant(arg) for arg in args):
+            return self._constant(function(*(arg.constant for arg in args)))
+        if len(args) == 1:
+            arg = args[0]
+            return lambda variables: function(arg(variables))
+        return lambda variables: function(*(arg(variables) for arg in args))
+
+
+def parse_expression(expression: str) -> ast.Expression:
+    """Parse an expression; "^" is accepted as the power operator"""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    return ast.parse(expression.strip().replace("^", "**"), mode="eval")
+
+
+@lru_cache(maxsize=settings.CALCULATOR_CACHE_SIZE)
+def compile_expression(expression: str) -> CompiledExpression:
+    """Parse, validate and compile an expression; results are cached by expression text
+
+    "^" is accepted as the power operator.
+
+    Raises:
+        SyntaxError: The expression cannot be parsed
+        ExpressionError: The expression uses unsupported syntax, names or functions
+        ZeroDivisionError: A constant subexpression divides by zero
+    """
+    tree = parse_expression(expression)
+    compiler = _Compiler()
+    evaluator = compiler.compile(tree.body)
+    return CompiledExpression(expression, evaluator, frozenset(compiler.variables))
+
+
+def evaluate(expression: str, variables: Optional[Mapping[str, Number]] = None) -> Number:
+    """Compile (or fetch from the cache) and evaluate an expression"""
+    return compile_expression(expression).evaluate(variables)
+
+
+def cache_info() -> Dict[str, Any]:
+    info = compile_expression.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
@@ -6,36 +6,33 @@ This tool performs various arithmetic operations including:
 - Basic operations: addition, subtraction, multiplication, division
 - Advanced operations: exponents, square roots, factorials
 - Order of operations with parentheses
+- Variables, so one formula can be evaluated with different inputs
+- Batches: one formula evaluated for lists or ranges of values in one call,
+  vectorized with NumPy when it is installed
+
+Expressions are compiled by app.tools.calculator.expression without eval and
+cached by expression text.
 """
 
+from typing import Dict, List, Optional, Union
 from app.tools import tool
-import math
+from app.tools.calculator.batch import evaluate_batch
+from app.tools.calculator.expression import evaluate
 
 
 @tool
-def calculator(expression: str) -> dict:
+def calculator(expression: str, variables: Optional[Dict[str, Union[int, float]]] = None) -> dict:
     """Advanced calculator that evaluates arithmetic expressions
     
     Args:
-        expression: Arithmetic expression to evaluate (e.g., "2 + 3 * 4", "sqrt(16)", "(5 + 3) ^ 2")
+        expression: Arithmetic expression to evaluate (e.g., "2 + 3 * 4", "sqrt(16)", "(5 + 3) ^ 2", "p * (1 + r) ^ n")
+        variables: Values of the variables used in the expression (e.g., {"p": 1000, "r": 0.05, "n": 10})
         
     Returns:
         Calculation result
     """
     try:
-        # Replace common math functions with Python equivalents
-        expr = expression.replace('^', '**')
-        expr = expr.replace('sqrt(', 'math.sqrt(')
-        expr = expr.replace('sin(', 'math.sin(')
-        expr = expr.replace('cos(', 'math.cos(')
-        expr = expr.replace('tan(', 'math.tan(')
-        expr = expr.replace('log(', 'math.log(')
-        expr = expr.replace('ln(', 'math.log(')
-        expr = expr.replace('pi', 'math.pi')
-        expr = expr.replace('e', 'math.e')
-        
-        # Evaluate the expression safely
-        result = eval(expr, {"math": math})
+        result = evaluate(expression, variables)
         
         return {
             "status": "success",
@@ -64,3 +61,66 @@ def calculator(expression: str) -> dict:
             "result": None,
             "message": f"Error: {str(e)}"
         }
+
+
+@tool
+def calculator_batch(
+    expression: str,
+    variables: Optional[Dict[str, Union[int, float, List[Union[int, float]]]]] = None,
+    ranges: Optional[Dict[str, List[Union[int, float]]]] = None,
+    grid: bool = False,
+    include_results: bool = True
+) -> dict:
+    """Evaluate one formula for many values at once and summarize the results
+    
+    Use this instead of calling calculator repeatedly with the same formula.
+    
+    Args:
+        expression: Arithmetic expression with variables (e.g., "p * (1 + r) ^ n", "x ^ 2 - 3 * x")
+        variables: Values of the variables; a list gives one value per evaluation, a number is used in every evaluation (e.g., {"p": 1000, "r": [0.03, 0.04, 0.05], "n": 10})
+        ranges: Variables stepping through [start, stop] or [start, stop, step], stop included, step 1 by default (e.g., {"n": [1, 30]})
+        grid: Evaluate every combination of the list and range values instead of pairing them up by position
+        include_results: Return every result; set to false when only the sum, mean, min and max are needed
+        
+    Returns:
+        The result of every evaluation, and the sum, mean, min and max of the results
+    """
+    try:
+        batch = evaluate_batch(expression, variables, ranges, grid)
+    except ZeroDivisionError:
+        return {
+            "status": "error",
+            "expression": expression,
+            "message": "Division by zero error"
+        }
+    except SyntaxError:
+        return {
+            "status": "error",
+            "expression": expression,
+            "message": "Invalid syntax in expression"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "expression": expression,
+            "message": f"Error: {str(e)}"
+        }
+    
+    count = len(batch.results)
+    result = {
+        "status": "success",
+        "expression": expression,
+        "count": count,
+        "stats": batch.stats
+    }
+    if include_results:
+        result["results"] = batch.results
+        # Values generated from ranges or combined in a grid are not known to the caller
+        if ranges or grid:
+            result["inputs"] = batch.inputs
+    if batch.error_count:
+        result["errors"] = batch.errors
+        result["message"] = f"{batch.error_count} of {count} evaluations failed; stats cover the successful ones"
+    else:
+        result["message"] = "Batch calculation successful"
+    return result
@@ -0,0 +1,154 @@
+"""
+MCP Gateway
+
+Runs the MCP servers from mcp_tools.MCP_SERVERS and exposes each one as a
+Streamable HTTP endpoint at /<server>/mcp, so that all serving workers share
+one set of MCP subprocesses instead of launching their own.
+
+Each server runs as pool_size subprocesses (mcp_servers.yaml, MCP_POOL_SIZE by
+default). Every worker session is bound to one subprocess for its whole life,
+the least used one when it connects, so a session keeps its server state
+(browser pages, open presentations) between calls. When workers hold more
+sessions than pool_size, sessions share subprocesses.
+
+The gateway listens on a Unix socket (MCP_GATEWAY_SOCKET) or on a loopback TCP
+port (MCP_GATEWAY_URL). Workers connect to it through
+mcp_tools.initialize_mcp_client() when either setting is present.
+
+Usage:
+    python -m app.tools.mcp_gateway --socket /tmp/opengigi-mcp.sock
+    python -m app.tools.mcp_gateway --port 8932
+"""
+
+import argparse
+import asyncio
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from app.config.settings import settings
+from app.tools.mcp_tools import MCP_POOL_OPTIONS, MCP_SERVERS
+from app.utils.logger import get_logger
+
+try:
+    from fastmcp import Client
+    from fastmcp.server.dependencies import get_context
+    from fastmcp.server.providers.proxy import FastMCPProxy, ProxyClient
+except ImportError:
+    raise ImportError("fastmcp is required for the MCP gateway. Install it with: pip install fastmcp")
+
+logger = get_logger(__name__)
+
+# Seconds to wait for a server to start and list its tools during warm-up
+WARMUP_TIMEOUT = 120.0
+
+
+class BackendPool:
+    """pool_size backend clients of one server, each keeping its own subprocess alive"""
+
+    def __init__(self, name: str, config: Dict[str, Any], size: int):
+        self.name = name
+        self.clients: List[ProxyClient] = [ProxyClient({"mcpServers": {name: config}}) for _ in range(max(size, 1))]
+        # Worker sessions bound to each client
+        self.sessions: List[int] = [0] * len(self.clients)
+        self._bound: Dict[Any, int] = {}
+
+    def client(self) -> Client:
+        """Client factory of the proxy: a connection to the backend of the calling session"""
+        session = get_context().session
+        index = self._bound.get(session)
+        if index is None:
+            index = min(range(len(self.clients)), key=self.sessions.__getitem__)
+            self._bound[session] = index
+            self.sessions[index] += 1
+
+            async def release() -> None:
+                self._bound.pop(session, None)
+                self.sessions[index] -= 1
+
+            session._exit_stack.push_async_callback(release)
+        return self.clients[index].new()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"backends": len(self.clients), "sessions": list(self.sessions)}
+
+
+def create_gateway_app(
+    servers: Optional[Dict[str, Dict[str, Any]]] = None,
+    pool_options: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Starlette:
+    """Build the gateway ASGI app with one proxy per MCP server
+
+    Each proxy spreads the worker sessions over the pool_size subprocesses of
+    its server; see BackendPool.
+    """
+    servers = MCP_SERVERS if servers is None else servers
+    pool_options = MCP_POOL_OPTIONS if pool_options is None else pool_options
+    pools = {
+        name: BackendPool(name, config, int(pool_options.get(name, {}).get("pool_size", settings.MCP_POOL_SIZE)))
+        for name, config in servers.items()
+    }
+    proxies = {name: FastMCPProxy(client_factory=pool.client, name=name) for name, pool in pools.items()}
+    apps = {name: proxy.http_app(path="/mcp") for name, proxy in proxies.items()}
+    status: Dict[str, Any] = {name: "starting" for name in servers}
+
+    async def warm_up(name: str) -> None:
+        # Start the subprocesses before workers connect so the first tool call
+        # does not pay for package downloads and process startup
+        async def list_tools(client: ProxyClient):
+            async with client:
+                return await client.list_tools()
+
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(list_tools(client) for client in pools[name].clients)),
+                timeout=WARMUP_TIMEOUT
+            )
+            tools = results[0]
+            status[name] = {"status": "ready", "tools": len(tools), "backends": len(results)}
+            logger.info(f"MCP server {name} is ready with {len(tools)} tools")
+        except Exception as e:
+            status[name] = {"status": "failed", "error": str(e)}
+            logger.error(f"MCP server {name} failed to start: {e}")
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        # Mounted apps do not run their own lifespans, enter them here
+        async with AsyncExitStack() as stack:
+            for sub_app in apps.values():
+                await stack.enter_async_context(sub_app.lifespan(sub_app))
+            await asyncio.gather(*(warm_up(name) for name in servers))
+            yield
+
+    async def health(request):
+        pool_status = {name: pool.to_dict() for name, pool in pools.items()}
+        return JSONResponse({"servers": status, "pools": pool_status, "pid": os.getpid()})
+
+    routes = [Route("/health", health)]
+    routes.extend(Mount(f"/{name}", app=sub_app) for name, sub_app in apps.items())
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve all MCP servers behind a single gateway")
+    parser.add_argument("--socket", help="Unix socket path to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8932)
+    args = parser.parse_args()
+
+    app = create_gateway_app()
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        uvicorn.run(app, uds=args.socket, log_level="warning")
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
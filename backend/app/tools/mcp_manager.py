@@ -0,0 +1,408 @@
+"""
+MCP Server Manager
+
+Starts the configured MCP servers concurrently, each with its own startup timeout,
+and keeps a pool of long-lived sessions per server (see mcp_pool.py) instead of
+spawning a session per call.
+
+Tool schemas are cached in a manifest file (MCP_MANIFEST_PATH). When a server's
+schemas are cached, its tools are built from the manifest so the agent does not wait
+for the server. The server is then started in the background, or only on first tool
+use, depending on MCP_STARTUP_MODE:
+
+- eager: wait for every server before building the agent (previous behavior)
+- background: use cached schemas and start all servers concurrently in the background
+- lazy: use cached schemas and start a server on the first call to one of its tools
+
+Calls made during an agent run are pinned to one session of each server until the
+run ends (release_thread), so stateful servers such as Playwright or PowerPoint
+keep their browser pages and open files between the calls of a run.
+
+Servers without cached schemas are always awaited, because their tools are needed
+to build the agent. A server whose session is lost is marked failed and restarted on
+the next tool call, with exponential backoff between attempts; a single lost session
+is replaced by the pool.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import anyio
+from langchain_core.runnables import ensure_config
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, CallToolResult
+from mcp.types import Tool as MCPTool
+
+from app.config.settings import settings
+from app.tools.mcp_pool import PooledSession, PoolTimeoutError, SessionPool
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STARTUP_MODES = ("eager", "background", "lazy")
+
+# Delay before the first restart attempt after a failure, doubled on each failure
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 60.0
+
+# Longest interval between idle session reaping passes
+REAP_INTERVAL = 30.0
+
+# Errors that mean the session itself is gone, not that one call failed
+_SESSION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, OSError)
+
+
+class MCPServerUnavailableError(Exception):
+    """The MCP server could not be started or is waiting to be restarted"""
+
+
+@dataclass
+class MCPServerState:
+    """Health, restart and timing state of one MCP server"""
+    name: str
+    # stopped, starting, ready or failed
+    status: str = "stopped"
+    # Where the exposed tool schemas came from: manifest or live
+    tools_source: Optional[str] = None
+    tools: List[MCPTool] = field(default_factory=list)
+    started_at: Optional[str] = None
+    startup_seconds: Optional[float] = None
+    restarts: int = 0
+    # Consecutive failures, reset when the server starts
+    failures: int = 0
+    last_error: Optional[str] = None
+    calls: int = 0
+    last_used_at: Optional[str] = None
+    retry_at: float = 0.0
+    # Sessions discarded after a connection error
+    sessions_lost: int = 0
+    pool: Optional[SessionPool] = None
+    # thread_id -> session pinned to the run of that thread
+    pinned: Dict[str, PooledSession] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def to_dict(self) -> Dict[str, Any]:
+        retry_in = self.retry_at - time.monotonic() if self.status == "failed" else 0.0
+        return {
+            "status": self.status,
+            "tools": len(self.tools),
+            "tools_source": self.tools_source,
+            "started_at": self.started_at,
+            "startup_seconds": self.startup_seconds,
+            "restarts": self.restarts,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "calls": self.calls,
+            "last_used_at": self.last_used_at,
+            "retry_in": round(max(retry_in, 0.0), 3),
+            "sessions_lost": self.sessions_lost,
+            "pinned": len(self.pinned),
+            "pool": self.pool.to_dict() if self.pool else None,
+        }
+
+
+class _ManagedSession:
+    """Session stand-in for converted tools that routes calls through the manager"""
+
+    def __init__(self, manager: "MCPManager", server: str):
+        self.manager = manager
+        self.server = server
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, **kwargs) -> CallToolResult:
+        # Tools run with the config of the agent run that called them
+        thread_id = ensure_config().get("configurable", {}).get("thread_id")
+        return await self.manager.call_tool(self.server, name, arguments, thread_id=thread_id, **kwargs)
+
+
+def connection_fingerprint(connection: Dict[str, Any]) -> str:
+    """Hash of the serializable part of a connection, used to invalidate cached schemas"""
+    data = {k: v for k, v in connection.items() if not callable(v)}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+async def list_all_tools(session: ClientSession) -> List[MCPTool]:
+    """List the tools of a session, following pagination cursors"""
+    tools: List[MCPTool] = []
+    cursor = None
+    while True:
+        result = await session.list_tools(cursor=cursor)
+        tools.extend(result.tools)
+        cursor = result.nextCursor
+        if not cursor:
+            return tools
+
+
+class MCPManager:
+    """Manages MCP server sessions, their health and the cached tool manifest"""
+
+    def __init__(
+        self,
+        connections: Dict[str, Dict[str, Any]],
+        startup_mode: Optional[str] = None,
+        startup_timeout: Optional[float] = None,
+        manifest_path: Optional[str] = None,
+        pool_options: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        self.connections = connections
+        self.startup_mode = (startup_mode or settings.MCP_STARTUP_MODE).lower()
+        if self.startup_mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown MCP startup mode: {self.startup_mode}, expected one of {STARTUP_MODES}")
+        self.startup_timeout = settings.MCP_STARTUP_TIMEOUT if startup_timeout is None else startup_timeout
+        self.manifest_path = settings.MCP_MANIFEST_PATH if manifest_path is None else manifest_path
+        self.checkout_timeout = settings.MCP_POOL_CHECKOUT_TIMEOUT
+        pool_options = pool_options or {}
+        self.states: Dict[str, MCPServerState] = {
+            name: MCPServerState(name, pool=self._create_pool(name, connection, pool_options.get(name, {})))
+            for name, connection in connections.items()
+        }
+        self.load_seconds: Optional[float] = None
+        self._background: List[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _create_pool(self, name: str, connection: Dict[str, Any], options: Dict[str, Any]) -> SessionPool:
+        return SessionPool(
+            name,
+            connection,
+            size=int(options.get("pool_size", settings.MCP_POOL_SIZE)),
+            min_size=int(options.get("pool_min_size", settings.MCP_POOL_MIN_SIZE)),
+            idle_timeout=float(options.get("idle_timeout", settings.MCP_POOL_IDLE_TIMEOUT)),
+            max_lifetime=float(options.get("max_lifetime", settings.MCP_POOL_MAX_LIFETIME)),
+            startup_timeout=float(options.get("startup_timeout", self.startup_timeout))
+        )
+
+    async def load_tools(self) -> List[BaseTool]:
+        """Start the servers and return their tools as LangChain tools"""
+        started = time.perf_counter()
+        manifest = self._read_manifest()
+        waiting = []
+        for name, connection in self.connections.items():
+            cached = manifest.get(name)
+            if self.startup_mode != "eager" and cached and cached.get("fingerprint") == connection_fingerprint(connection):
+                state = self.states[name]
+                state.tools = [MCPTool.model_validate(t) for t in cached["tools"]]
+                state.tools_source = "manifest"
+            else:
+                waiting.append(name)
+
+        # Servers without cached schemas are needed to build the agent
+        await asyncio.gather(*(self._start_quietly(name) for name in waiting))
+        if self.startup_mode == "background":
+            self._background = [
+                asyncio.create_task(self._start_quietly(name))
+                for name in self.connections if name not in waiting
+            ]
+        self._reaper = asyncio.create_task(self._reap_loop())
+        self.load_seconds = round(time.perf_counter() - started, 3)
+
+        tools = []
+        for name, state in self.states.items():
+            session = _ManagedSession(self, name)
+            for mcp_tool in state.tools:
+                tools.append(convert_mcp_tool_to_langchain_tool(session, mcp_tool, server_name=name))
+        logger.info(f"Loaded {len(tools)} MCP tools in {self.load_seconds}s ({self.startup_mode} startup)")
+        return tools
+
+    async def _start_quietly(self, name: str) -> None:
+        try:
+            await self.start(name)
+        except MCPServerUnavailableError as e:
+            logger.error(str(e))
+
+    async def start(self, name: str) -> SessionPool:
+        """Start the server's session pool if it has no open sessions"""
+        state = self.states[name]
+        async with state.lock:
+            if state.status == "ready":
+                # The pool opens more sessions on demand
+                return state.pool
+            if state.status == "failed" and time.monotonic() < state.retry_at:
+                raise MCPServerUnavailableError(
+                    f"MCP server {name} is unavailable, retrying in {state.retry_at - time.monotonic():.1f}s: {state.last_error}"
+                )
+            if state.started_at is not None:
+                state.restarts += 1
+
+            state.status = "starting"
+            started = time.perf_counter()
+            try:
+                await state.pool.fill()
+                async with state.pool.session() as pooled:
+                    tools = await list_all_tools(pooled.session)
+            except asyncio.CancelledError:
+                state.status = "stopped"
+                raise
+            except Exception as e:
+                self._mark_failed(state, e)
+                raise MCPServerUnavailableError(f"MCP server {name} failed to start: {state.last_error}") from e
+
+            state.status = "ready"
+            state.failures = 0
+            state.started_at = datetime.now().isoformat()
+            state.startup_seconds = round(time.perf_counter() - started, 3)
+            self._update_tools(state, tools)
+            logger.info(f"MCP server {name} started in {state.startup_seconds}s with {len(tools)} tools")
+            return state.pool
+
+    def _update_tools(self, state: MCPServerState, tools: List[MCPTool]) -> None:
+        if state.tools_source == "manifest":
+            cached = {t.name for t in state.tools}
+            live = {t.name for t in tools}
+            if cached != live:
+                # Tools already given to the agent keep the cached schemas until restart
+                logger.warning(
+                    f"MCP server {state.name} tools changed since the manifest was written "
+                    f"(added {sorted(live - cached)}, removed {sorted(cached - live)}), restart to apply"
+                )
+        else:
+            state.tools = tools
+            state.tools_source = "live"
+        self._write_manifest(state.name, tools)
+
+    def _mark_failed(self, state: MCPServerState, error: BaseException) -> None:
+        state.status = "failed"
+        state.failures += 1
+        state.last_error = str(error) or type(error).__name__
+        state.retry_at = time.monotonic() + min(RESTART_BACKOFF * 2 ** (state.failures - 1), MAX_RESTART_BACKOFF)
+
+    async def call_tool(
+        self,
+        name: str,
+        tool_name: str,
+        arguments: Optional[Dict[str, Any]] = None,
+        thread_id: Optional[str] = None,
+        **kwargs
+    ) -> CallToolResult:
+        """Call a tool on a pooled session, starting or restarting the server if needed
+
+        With a thread_id the session stays checked out for that thread until
+        release_thread is called, and later calls of the thread reuse it.
+        """
+        pool = await self.start(name)
+        state = self.states[name]
+        state.calls += 1
+        state.last_used_at = datetime.now().isoformat()
+        pooled = state.pinned.get(thread_id) if thread_id else None
+        if pooled is None:
+            pooled = await self._checkout(state, pool)
+            if thread_id:
+                pinned = state.pinned.setdefault(thread_id, pooled)
+                if pinned is not pooled:
+                    # A concurrent call of the same run pinned a session first
+                    await pool.checkin(pooled)
+                    pooled = pinned
+        try:
+            return await pooled.session.call_tool(tool_name, arguments, **kwargs)
+        except McpError as e:
+            if e.error.code == CONNECTION_CLOSED:
+                self._session_lost(state, pooled, e)
+            raise
+        except _SESSION_ERRORS as e:
+            self._session_lost(state, pooled, e)
+            raise
+        finally:
+            if not thread_id:
+                await pool.checkin(pooled)
+            elif pooled.broken and state.pinned.get(thread_id) is pooled:
+                # The next call of the run pins a new session
+                del state.pinned[thread_id]
+                await pool.checkin(pooled)
+
+    async def _checkout(self, state: MCPServerState, pool: SessionPool) -> PooledSession:
+        try:
+            return await pool.checkout(self.checkout_timeout)
+        except PoolTimeoutError as e:
+            raise MCPServerUnavailableError(f"MCP server {state.name} is busy: {e}") from e
+        except Exception as e:
+            # Opening a session failed; without any open session the server is down
+            if not pool.open_count:
+                self._mark_failed(state, e)
+            raise MCPServerUnavailableError(f"MCP server {state.name} failed to open a session: {e}") from e
+
+    async def release_thread(self, thread_id: str) -> None:
+        """Return the sessions pinned to a thread's run to their pools"""
+        for state in self.states.values():
+            pooled = state.pinned.pop(thread_id, None)
+            if pooled is not None:
+                await state.pool.checkin(pooled)
+
+    def _session_lost(self, state: MCPServerState, pooled: PooledSession, error: BaseException) -> None:
+        # The session is closed when it is returned; the next call opens a new one
+        logger.error(f"MCP server {state.name} session was lost, replacing it: {error}")
+        pooled.broken = True
+        state.sessions_lost += 1
+        state.last_error = str(error) or type(error).__name__
+        if state.pool.open_count <= 1:
+            state.status = "stopped"
+
+    async def _reap_loop(self) -> None:
+        interval = min([s.pool.idle_timeout for s in self.states.values()] + [REAP_INTERVAL])
+        while True:
+            await asyncio.sleep(max(interval, 1.0))
+            for state in self.states.values():
+                try:
+                    await state.pool.reap()
+                    # Keep warm servers at pool_min_size after reaping or recycling
+                    if state.status == "ready" and state.pool.open_count < state.pool.min_size:
+                        await state.pool.fill()
+                except Exception as e:
+                    logger.warning(f"Failed to maintain MCP session pool {state.name}: {e}")
+
+    async def close(self) -> None:
+        """Stop all background startups and sessions"""
+        tasks = self._background + ([self._reaper] if self._reaper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._background = []
+        self._reaper = None
+        for state in self.states.values():
+            state.pinned.clear()
+            await state.pool.close()
+            state.status = "stopped"
+
+    def status(self) -> Dict[str, Any]:
+        """Per-server health, restart state and startup timings"""
+        return {
+            "startup_mode": self.startup_mode,
+            "startup_timeout": self.startup_timeout,
+            "load_seconds": self.load_seconds,
+            "servers": {name: state.to_dict() for name, state in self.states.items()},
+        }
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("servers", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable MCP manifest {self.manifest_path}: {e}")
+            return {}
+
+    def _write_manifest(self, name: str, tools: List[MCPTool]) -> None:
+        if not self.manifest_path:
+            return
+        servers = self._read_manifest()
+        servers[name] = {
+            "fingerprint": connection_fingerprint(self.connections[name]),
+            "updated_at": datetime.now().isoformat(),
+            "tools": [t.model_dump(mode="json", by_alias=True, exclude_none=True) for t in tools],
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"servers": servers}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            logger.warning(f"Failed to write MCP manifest {self.manifest_path}: {e}")
@@ -0,0 +1,259 @@
+"""
+MCP Session Pool
+
+Keeps up to pool_size open sessions to one MCP server. A tool call checks a session
+out, uses it exclusively and returns it, so concurrent agent runs use separate
+sessions (separate processes for stdio servers) instead of queueing behind one.
+
+- Idle sessions above pool_min_size are closed after idle_timeout seconds
+- Sessions older than max_lifetime are recycled when returned or found idle
+- A session that failed with a connection error is discarded instead of returned
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set
+
+from langchain_mcp_adapters.sessions import create_session
+from mcp import ClientSession
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """No session became available within the checkout timeout"""
+
+
+@dataclass(eq=False)
+class PooledSession:
+    """An open session and the task that owns its context"""
+    session: ClientSession
+    task: asyncio.Task
+    stop: asyncio.Event
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    # Set when the session failed with a connection error
+    broken: bool = False
+
+
+@dataclass
+class PoolStats:
+    """Cumulative pool counters"""
+    checkouts: int = 0
+    # Checkouts that had to wait for a session to be returned
+    waits: int = 0
+    opened: int = 0
+    # Closed because they exceeded max_lifetime
+    recycled: int = 0
+    # Closed because they were idle for idle_timeout
+    reaped: int = 0
+    # Discarded after a connection error
+    discarded: int = 0
+
+
+async def open_session(connection: Dict[str, Any], timeout: float) -> PooledSession:
+    """Open and initialize a session in its own task
+
+    The session context must be entered and exited in the same task, so the task
+    holds it open until stop is set or the task is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    ready: asyncio.Future = loop.create_future()
+    stop = asyncio.Event()
+
+    async def run() -> None:
+        try:
+            async with create_session(connection) as session:
+                await session.initialize()
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.debug(f"MCP session closed with error: {e}")
+
+    task = asyncio.create_task(run())
+    try:
+        session = await asyncio.wait_for(asyncio.shield(ready), timeout=timeout)
+    except BaseException as e:
+        ready.cancel()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if isinstance(e, asyncio.TimeoutError):
+            raise TimeoutError(f"startup timed out after {timeout}s") from None
+        raise
+    return PooledSession(session=session, task=task, stop=stop)
+
+
+async def close_session(pooled: PooledSession) -> None:
+    pooled.stop.set()
+    try:
+        await asyncio.wait_for(asyncio.shield(pooled.task), timeout=5.0)
+    except (asyncio.TimeoutError, Exception):
+        pooled.task.cancel()
+        await asyncio.gather(pooled.task, return_exceptions=True)
+
+
+class SessionPool:
+    """A bounded pool of sessions to one MCP server"""
+
+    def __init__(
+        self,
+        name: str,
+        connection: Dict[str, Any],
+        size: int = 1,
+        min_size: int = 1,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 3600.0,
+        startup_timeout: float = 60.0
+    ):
+        self.name = name
+        self.connection = connection
+        self.size = max(size, 1)
+        self.min_size = min(max(min_size, 0), self.size)
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.startup_timeout = startup_timeout
+        self.stats = PoolStats()
+        # Most recently returned last, checkouts take from the end so that
+        # rarely needed sessions stay idle and get reaped
+        self._idle: Deque[PooledSession] = deque()
+        self._sessions: Set[PooledSession] = set()
+        self._opening = 0
+        self._returned = asyncio.Condition()
+        self._closed = False
+
+    @property
+    def open_count(self) -> int:
+        return len(self._sessions)
+
+    def _expired(self, pooled: PooledSession, now: float) -> bool:
+        return self.max_lifetime > 0 and now - pooled.created_at >= self.max_lifetime
+
+    async def _open(self) -> PooledSession:
+        self._opening += 1
+        try:
+            pooled = await open_session(self.connection, self.startup_timeout)
+        finally:
+            self._opening -= 1
+        if self._closed:
+            await close_session(pooled)
+            raise RuntimeError(f"MCP session pool {self.name} is closed")
+        self._sessions.add(pooled)
+        self.stats.opened += 1
+        return pooled
+
+    async def _discard(self, pooled: PooledSession) -> None:
+        self._sessions.discard(pooled)
+        await close_session(pooled)
+        # A slot was freed, a waiter may open a new session
+        async with self._returned:
+            self._returned.notify()
+
+    async def fill(self) -> None:
+        """Open sessions until pool_min_size (at least one) are open"""
+        while not self._closed and self.open_count + self._opening < max(self.min_size, 1):
+            pooled = await self._open()
+            await self.checkin(pooled)
+
+    async def checkout(self, timeout: Optional[float] = None) -> PooledSession:
+        """Take an idle session, open a new one below pool_size, or wait for one"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        waited = False
+        while True:
+            if self._closed:
+                raise RuntimeError(f"MCP session pool {self.name} is closed")
+            now = time.monotonic()
+            while self._idle:
+                pooled = self._idle.pop()
+                if self._expired(pooled, now):
+                    self.stats.recycled += 1
+                    await self._discard(pooled)
+                    continue
+                self.stats.checkouts += 1
+                self.stats.waits += waited
+                return pooled
+
+            if self.open_count + self._opening < self.size:
+                pooled = await self._open()
+                self.stats.checkouts += 1
+                self.stats.waits += waited
+                return pooled
+
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                raise PoolTimeoutError(f"No MCP session of {self.name} available within {timeout}s")
+            waited = True
+            async with self._returned:
+                try:
+                    await asyncio.wait_for(self._returned.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def checkin(self, pooled: PooledSession) -> None:
+        """Return a session; broken or expired sessions are closed instead"""
+        if pooled.broken or self._closed:
+            self.stats.discarded += pooled.broken
+            await self._discard(pooled)
+            return
+        if self._expired(pooled, time.monotonic()):
+            self.stats.recycled += 1
+            await self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        self._idle.append(pooled)
+        async with self._returned:
+            self._returned.notify()
+
+    @asynccontextmanager
+    async def session(self, timeout: Optional[float] = None) -> AsyncIterator[PooledSession]:
+        pooled = await self.checkout(timeout)
+        try:
+            yield pooled
+        finally:
+            await self.checkin(pooled)
+
+    async def reap(self) -> None:
+        """Close idle sessions past idle_timeout (above pool_min_size) or max_lifetime"""
+        now = time.monotonic()
+        for pooled in list(self._idle):
+            if self._expired(pooled, now):
+                self.stats.recycled += 1
+            elif self.open_count > self.min_size and now - pooled.last_used >= self.idle_timeout:
+                self.stats.reaped += 1
+            else:
+                continue
+            self._idle.remove(pooled)
+            await self._discard(pooled)
+
+    async def close(self) -> None:
+        self._closed = True
+        sessions = list(self._sessions)
+        self._idle.clear()
+        self._sessions.clear()
+        await asyncio.gather(*(close_session(pooled) for pooled in sessions))
+        async with self._returned:
+            self._returned.notify_all()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "min_size": self.min_size,
+            "open": self.open_count,
+            "idle": len(self._idle),
+            "in_use": self.open_count - len(self._idle),
+            "opening": self._opening,
+            "checkouts": self.stats.checkouts,
+            "waits": self.stats.waits,
+            "opened": self.stats.opened,
+            "recycled": self.stats.recycled,
+            "reaped": self.stats.reaped,
+            "discarded": self.stats.discarded,
+        }
@@ -1,4 +1,8 @@
 
+from typing import Any, Dict, Optional
+
+import httpx
+from app.config.settings import settings
 from app.utils.logger import get_logger
 from langchain_mcp_adapters.client import MultiServerMCPClient
 """
@@ -6,49 +10,92 @@ MCP Tools Integration
 
 This module integrates MCP (Model Context Protocol) tools into the LangChain tool system
 using langchain-mcp-adapters.
+
+When MCP_GATEWAY_SOCKET or MCP_GATEWAY_URL is set, the servers are not launched
+in this process; tools are loaded from the shared gateway (see mcp_gateway.py).
 """
 
 logger = get_logger(__name__)
 
+# Session pool settings that may appear next to a server's connection in mcp_servers.yaml
+POOL_OPTIONS = ("pool_size", "pool_min_size", "idle_timeout", "max_lifetime", "startup_timeout")
+
+
+def server_connection(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip pool settings from a server definition, leaving the adapter connection"""
+    return {k: v for k, v in config.items() if k not in POOL_OPTIONS}
+
+
+def server_pool_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Pool settings of a server definition"""
+    return {k: v for k, v in config.items() if k in POOL_OPTIONS}
+
+
+# MCP servers are defined in app/config/mcp_servers.yaml (MCP_CONFIG_PATH)
+MCP_SERVERS: Dict[str, Dict[str, Any]] = {
+    name: server_connection(config) for name, config in settings.MCP_SERVERS.items()
+}
+MCP_POOL_OPTIONS: Dict[str, Dict[str, Any]] = {
+    name: server_pool_options(config) for name, config in settings.MCP_SERVERS.items()
+}
+
+# Host used in gateway URLs when connecting over a Unix socket
+GATEWAY_SOCKET_BASE_URL = "http://mcp-gateway"
+
+
+def unix_socket_client_factory(path: str):
+    """Create an httpx client factory that connects through a Unix socket"""
+    def factory(
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[httpx.Timeout] = None,
+        auth: Optional[httpx.Auth] = None
+    ) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=path),
+            headers=headers,
+            timeout=timeout or httpx.Timeout(30.0, read=300.0),
+            auth=auth,
+            follow_redirects=True
+        )
+    return factory
+
+
+def gateway_connections(servers: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Build one Streamable HTTP connection per server behind the gateway
+
+    Server names are kept, so tool names are the same as with stdio servers.
+    """
+    servers = MCP_SERVERS if servers is None else servers
+    socket_path = settings.MCP_GATEWAY_SOCKET
+    base_url = (GATEWAY_SOCKET_BASE_URL if socket_path else settings.MCP_GATEWAY_URL).rstrip("/")
+    connections = {}
+    for name in servers:
+        connection = {"transport": "streamable_http", "url": f"{base_url}/{name}/mcp"}
+        if socket_path:
+            connection["httpx_client_factory"] = unix_socket_client_factory(socket_path)
+        connections[name] = connection
+    return connections
+
+
+def mcp_connections() -> Dict[str, Dict[str, Any]]:
+    """Connections to the configured servers, through the gateway when one is set"""
+    if settings.MCP_GATEWAY_SOCKET or settings.MCP_GATEWAY_URL:
+        logger.info(f"Loading MCP tools from gateway {settings.MCP_GATEWAY_SOCKET or settings.MCP_GATEWAY_URL}")
+        return gateway_connections()
+    return MCP_SERVERS
+
+
 def initialize_mcp_client():
-    mcp_client = MultiServerMCPClient(
-        {
-            # Add MCP servers here
-            # Example configuration:
-            # "math": {
-            #     "command": "python",
-            #     "args": ["/path/to/math_server.py"],
-            #     "transport": "stdio",
-            # },
-            "ppt": {
-                "command": "uvx",
-                "args": [
-                    "--from", "office-powerpoint-mcp-server", "ppt_mcp_server"
-                ],
-                "env": {},
-                "transport": "stdio",
-            },
-            "playwright": {
-                "command": "npx",
-                "args": [
-                    "-y", "@playwright/mcp@latest"
-                ],
-                "transport": "stdio",
-            }
-        }
-    )
+    mcp_client = MultiServerMCPClient(mcp_connections())
     return mcp_client
 
 if __name__ == "__main__":
     import asyncio
-    
+
     async def main():
         mcp_client = initialize_mcp_client()
         mcp_tools = await mcp_client.get_tools()
         for tool in mcp_tools:
             print(tool)
-    
-    asyncio.run(main())
-
-
 
+    asyncio.run(main())
@@ -18,6 +18,7 @@ class ToolRegistry:
     
     def __init__(self):
         self.tools: Dict[str, Callable] = {}
+        self.mcp_manager = None
         self.logger = get_logger(__name__)
 
     def register_tool(self, tool_func, is_mcp: bool = False) -> None:
@@ -82,7 +83,7 @@ class ToolRegistry:
         tools_dir = os.path.dirname(__file__)
         
         for filename in os.listdir(tools_dir):
-            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'registry.py']:
+            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'registry.py', 'mcp_gateway.py', 'mcp_manager.py', 'mcp_pool.py']:
                 module_name = filename[:-3]
                 try:
                     module = importlib.import_module(f'app.tools.{module_name}')
@@ -107,12 +108,17 @@ class ToolRegistry:
 
     
     async def load_mcp_tools(self) -> None:
-        """Load MCP tools from the mcp_tools module"""
+        """Load MCP tools from the mcp_tools module
+
+        Servers are started concurrently by MCPManager; tools of servers with
+        cached schemas are available before the servers are up.
+        """
         try:
-            from app.tools.mcp_tools import initialize_mcp_client
+            from app.tools.mcp_manager import MCPManager
+            from app.tools.mcp_tools import MCP_POOL_OPTIONS, mcp_connections
             # Create MCP tool instances
-            mcp_client = initialize_mcp_client()
-            mcp_tools = await mcp_client.get_tools()
+            self.mcp_manager = MCPManager(mcp_connections(), pool_options=MCP_POOL_OPTIONS)
+            mcp_tools = await self.mcp_manager.load_tools()
             # Register MCP tools
             for mcp_tool in mcp_tools:
                 try:
@@ -124,3 +130,19 @@ class ToolRegistry:
         # Filter and list only MCP tools
         mcp_tool_names = [tool["func"].name for tool in self.tools.values() if tool['is_mcp']]
         self.logger.info(f"Registered MCP tools: {mcp_tool_names}")
+
+    async def close(self) -> None:
+        """Stop MCP server sessions"""
+        if self.mcp_manager is not None:
+            await self.mcp_manager.close()
+
+    async def release_mcp_sessions(self, thread_id: str) -> None:
+        """Return the MCP sessions pinned to a finished run"""
+        if self.mcp_manager is not None:
+            await self.mcp_manager.release_thread(thread_id)
+
+    def get_mcp_status(self) -> Dict[str, Any]:
+        """Health, restart state and startup timings of MCP servers"""
+        if self.mcp_manager is None:
+            return {"servers": {}}
+        return self.mcp_manager.status()
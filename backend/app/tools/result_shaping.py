@@ -0,0 +1,398 @@
+"""
+Tool Result Shaping
+
+Tool results are added to the model context and resent on every following step.
+This module projects the results of known tools to the fields the model needs
+before they enter the context:
+
+- Weather results keep one unit system (from the user's preferences) and drop
+  icons, duplicate units and rarely useful fields
+- Search results get shorter snippets and collapsed whitespace
+- Every shaped result is fitted to a character budget by dropping whole entries
+  (forecast days, table rows, search results), never by cutting serialized JSON.
+  Batch results share the budget across all of their queries or cities, and the
+  model is told how many entries were omitted.
+
+Token counts before and after shaping are recorded per tool.
+"""
+
+import json
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+UNIT_SYSTEMS = ("metric", "imperial")
+TRUNCATION_MARK = "…"
+
+
+@dataclass
+class ShapingOptions:
+    """How results are shaped for the current run"""
+    # "metric" or "imperial"
+    units: str = "metric"
+    # Character budget of a whole result
+    max_chars: int = 4000
+    # Character budget of a single search snippet or alert description
+    snippet_chars: int = 300
+
+    @classmethod
+    def from_settings(cls, units: Optional[str] = None) -> "ShapingOptions":
+        units = (units or settings.TOOL_RESULT_UNITS).lower()
+        return cls(
+            units=units if units in UNIT_SYSTEMS else "metric",
+            max_chars=settings.TOOL_RESULT_MAX_CHARS,
+            snippet_chars=settings.TOOL_RESULT_SNIPPET_CHARS
+        )
+
+
+@dataclass
+class ShapingStats:
+    """Cumulative token counts of shaped results of one tool"""
+    calls: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+
+_encoding = None
+_encoding_loader: Optional[threading.Thread] = None
+
+
+def load_token_encoding() -> None:
+    """Load the tiktoken encoding; may download it, so never call this on the event loop"""
+    global _encoding
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("o200k_base")
+        logger.info("Loaded tiktoken encoding for tool result token counts")
+    except Exception as e:
+        # tiktoken is not installed or its encoding file cannot be downloaded
+        logger.info(f"Using estimated token counts for tool results: {e}")
+
+
+def start_loading_token_encoding() -> None:
+    """Load the encoding once in the background
+
+    tiktoken downloads missing encodings without a timeout. A daemon thread keeps
+    an offline deployment from blocking requests or shutdown; token counts are
+    estimated until the encoding is loaded.
+    """
+    global _encoding_loader
+    if _encoding_loader is None:
+        _encoding_loader = threading.Thread(target=load_token_encoding, name="tiktoken-loader", daemon=True)
+        _encoding_loader.start()
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken once loaded, otherwise estimate 4 characters per token"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Shorten text to max_chars, cutting at a word boundary when possible"""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0] or text[:max_chars]
+    return cut + TRUNCATION_MARK
+
+
+def _dumps(result: Any) -> str:
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+
+
+def _fit_list(result: Dict[str, Any], key: str, max_chars: int, label: str) -> Dict[str, Any]:
+    """Drop trailing entries of result[key] until the serialized result fits max_chars"""
+    entries = result.get(key) or []
+    total = len(entries)
+    if len(_dumps(result)) <= max_chars:
+        return result
+
+    def fitted(keep: int) -> Dict[str, Any]:
+        return {**result, key: entries[:keep], "note": f"{total - keep} of {total} {label} omitted to fit the result size limit"}
+
+    # Largest number of leading entries that fits, at least one
+    low, high = 1, max(total - 1, 1)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if len(_dumps(fitted(middle))) <= max_chars:
+            low = middle
+        else:
+            high = middle - 1
+    return fitted(low)
+
+
+def _share_budget(sizes: List[int], budget: int) -> List[int]:
+    """Split budget across entries: small entries keep their size, the rest share equally"""
+    shares = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for position, i in enumerate(order):
+        shares[i] = min(sizes[i], max(remaining, 0) // (len(order) - position))
+        remaining -= shares[i]
+    return shares
+
+
+def _fit_blocks(blocks: List[str], max_chars: int, label: str, separator: str = "\n\n") -> List[str]:
+    """Keep the leading blocks that fit max_chars (at least one) and note how many were dropped"""
+    kept = []
+    size = 0
+    for block in blocks:
+        size += len(block) + (len(separator) if kept else 0)
+        if kept and size > max_chars:
+            break
+        kept.append(block)
+    if len(kept) < len(blocks):
+        kept.append(f"({len(blocks) - len(kept)} more {label} omitted to fit the result size limit)")
+    return kept
+
+
+def _pick(data: Dict[str, Any], fields: Dict[str, str]) -> Dict[str, Any]:
+    """Copy fields (output name -> source name) that are present and not None"""
+    return {name: data[source] for name, source in fields.items() if data.get(source) is not None}
+
+
+def _unit_fields(options: ShapingOptions, **fields: str) -> Dict[str, str]:
+    """Output name -> source name in the chosen unit system
+
+    Each value names metric and imperial sources as "metric|imperial"; the output
+    name gets the unit of the chosen source as suffix.
+    """
+    picked = {}
+    for name, sources in fields.items():
+        metric, imperial = sources.split("|")
+        source = metric if options.units == "metric" else imperial
+        picked[f"{name}_{source.rsplit('_', 1)[1]}"] = source
+    return picked
+
+
+def _shape_location(location: Dict[str, Any]) -> Dict[str, Any]:
+    return _pick(location, {"name": "name", "region": "region", "country": "country", "local_time": "local_time"})
+
+
+def _shape_alerts(alerts: list, options: ShapingOptions) -> list:
+    shaped = []
+    for alert in alerts:
+        item = _pick(alert, {"event": "event", "severity": "severity", "headline": "headline",
+                             "effective": "effective", "expires": "expires"})
+        if alert.get("desc"):
+            item["desc"] = truncate(alert["desc"], options.snippet_chars)
+        shaped.append(item)
+    return shaped
+
+
+def shape_current_weather(result: Dict[str, Any], options: ShapingOptions) -> Dict[str, Any]:
+    current = result.get("current", {})
+    shaped_current = _pick(current, {"condition": "condition", "humidity": "humidity", "cloud": "cloud",
+                                     "uv": "uv", "wind_dir": "wind_dir", "last_updated": "last_updated"})
+    shaped_current.update(_pick(current, _unit_fields(
+        options,
+        temp="temperature_c|temperature_f",
+        feelslike="feelslike_c|feelslike_f",
+        wind="wind_kph|wind_mph",
+        gust="gust_kph|gust_mph",
+        precip="precip_mm|precip_in"
+    )))
+    shaped = {
+        "status": "success",
+        "location": _shape_location(result.get("location", {})),
+        "current": shaped_current
+    }
+    air_quality = _pick(result.get("air_quality", {}), {"us_epa_index": "us_epa_index", "pm2_5": "pm2_5"})
+    if air_quality:
+        shaped["air_quality"] = air_quality
+    return shaped
+
+
+def shape_weather_forecast(result: Dict[str, Any], options: ShapingOptions) -> Dict[str, Any]:
+    days = []
+    for day in result.get("forecast", []):
+        shaped_day = _pick(day, {"date": "date", "condition": "condition", "humidity": "avg_humidity",
+                                 "chance_of_rain": "daily_chance_of_rain", "uv": "uv"})
+        if day.get("daily_chance_of_snow"):
+            shaped_day["chance_of_snow"] = day["daily_chance_of_snow"]
+        shaped_day.update(_pick(day, _unit_fields(
+            options,
+            min="min_temp_c|min_temp_f",
+            max="max_temp_c|max_temp_f",
+            precip="total_precip_mm|total_precip_in",
+            max_wind="max_wind_kph|max_wind_mph"
+        )))
+        days.append(shaped_day)
+    shaped = {
+        "status": "success",
+        "location": _shape_location(result.get("location", {})),
+        "forecast": days
+    }
+    if result.get("alerts"):
+        shaped["alerts"] = _shape_alerts(result["alerts"], options)
+    return _fit_list(shaped, "forecast", options.max_chars, "forecast days")
+
+
+def _fit_weather_batch(result: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    """Keep the same number of leading days for every city so that all cities fit"""
+    rows = result.get("rows", [])
+    if len(_dumps(result)) <= max_chars:
+        return result
+    # Position of every row among the rows of its city (first column)
+    day_index = []
+    seen: Dict[Any, int] = {}
+    for row in rows:
+        city = row[0] if row else None
+        day_index.append(seen.get(city, 0))
+        seen[city] = day_index[-1] + 1
+    for days in range(max(seen.values(), default=0) - 1, 0, -1):
+        fitted = {
+            **result,
+            "rows": [row for row, index in zip(rows, day_index) if index < days],
+            "note": f"Only the first {days} days per city are shown to fit the result size limit"
+        }
+        if len(_dumps(fitted)) <= max_chars:
+            return fitted
+    # Even one day per city is too long; keep the leading cities
+    return _fit_list({**result, "rows": [row for row, index in zip(rows, day_index) if index == 0]},
+                     "rows", max_chars, "rows (one day per city)")
+
+
+def shape_weather_batch(result: Dict[str, Any], options: ShapingOptions) -> Dict[str, Any]:
+    if options.units == "metric":
+        return _fit_weather_batch(result, options.max_chars)
+    # The batch table is metric; convert its columns
+    conversions = {
+        "min_c": ("min_f", lambda c: round(c * 9 / 5 + 32, 1)),
+        "max_c": ("max_f", lambda c: round(c * 9 / 5 + 32, 1)),
+        "precip_mm": ("precip_in", lambda mm: round(mm / 25.4, 2)),
+        "max_wind_kph": ("max_wind_mph", lambda kph: round(kph / 1.609344, 1)),
+    }
+    columns = result.get("columns", [])
+    converters = [conversions.get(column) for column in columns]
+    rows = [
+        [value if converter is None or value is None else converter[1](value) for value, converter in zip(row, converters)]
+        for row in result.get("rows", [])
+    ]
+    return _fit_weather_batch({
+        **result,
+        "columns": [converter[0] if converter else column for column, converter in zip(columns, converters)],
+        "rows": rows
+    }, options.max_chars)
+
+
+def shape_search_results(text: str, options: ShapingOptions) -> str:
+    """Shorten the snippet of every "n. title / url / snippet" block"""
+    blocks = []
+    # Snippets may contain blank lines, so blocks are split only before "n. "
+    for block in re.split(r"\n\s*\n(?=\d+\. )", text.strip()):
+        lines = block.split("\n")
+        if len(lines) >= 3:
+            snippet = truncate(" ".join(lines[2:]).removesuffix("..."), options.snippet_chars)
+            blocks.append("\n".join(lines[:2] + [snippet]))
+        else:
+            blocks.append(block)
+    return "\n\n".join(_fit_blocks(blocks, options.max_chars, "results"))
+
+
+def _split_search_section(section: str, options: ShapingOptions) -> List[str]:
+    """Header and results of one "[i] query" section of a batch search, with shortened snippets"""
+    header, *lines = section.split("\n")
+    # Each result is a "- title | url" line followed by an indented snippet line
+    results = []
+    for line in lines:
+        if line.startswith("  ") and results:
+            results[-1] += "\n  " + truncate(line, options.snippet_chars)
+        else:
+            results.append(line)
+    return [header] + results
+
+
+def shape_search_batch(text: str, options: ShapingOptions) -> str:
+    """Share the budget across the queries of a batch search
+
+    Every query keeps at least its first result, so a very small budget can be
+    exceeded; omitted results are noted per query.
+    """
+    sections = text.strip().split("\n\n")
+    queries = [_split_search_section(section, options) for section in sections if section.startswith("[")]
+    # Notes such as skipped queries are always kept
+    notes = [section for section in sections if not section.startswith("[")]
+    budget = options.max_chars - sum(len(note) + 2 for note in notes) - 2 * len(queries)
+    shares = _share_budget([len("\n".join(lines)) for lines in queries], budget)
+    shaped = [
+        "\n".join([header] + _fit_blocks(results, share - len(header) - 1, "results", "\n"))
+        for (header, *results), share in zip(queries, shares)
+    ]
+    return "\n\n".join(shaped + notes)
+
+
+# Tool name -> projection of its result. Each projection fits its result to the
+# budget; dict results are decoded from JSON first
+PROJECTIONS: Dict[str, Callable[[Any, ShapingOptions], Any]] = {
+    "get_current_weather": shape_current_weather,
+    "get_weather_forecast": shape_weather_forecast,
+    "get_weather_batch": shape_weather_batch,
+    "websearch": shape_search_results,
+    "websearch_batch": shape_search_batch,
+}
+# Tools whose results are text rather than JSON
+TEXT_TOOLS = ("websearch", "websearch_batch")
+
+shaping_stats: Dict[str, ShapingStats] = {}
+
+
+def is_shaped(tool_name: str) -> bool:
+    return tool_name in PROJECTIONS
+
+
+def shape_tool_result(tool_name: str, content: str, options: ShapingOptions) -> Tuple[str, Optional[Dict[str, int]]]:
+    """Shape the content of a tool result message and record its token counts
+
+    Args:
+        tool_name: Name of the tool that produced the result
+        content: Result content as sent to the model (JSON for dict results)
+        options: Units and budgets of the current run
+
+    Returns:
+        The shaped content and its token counts before and after shaping. The content
+        is returned unchanged with no counts if the tool has no projection or the
+        result is an error.
+    """
+    if not is_shaped(tool_name) or not isinstance(content, str):
+        return content, None
+
+    projection = PROJECTIONS[tool_name]
+    if tool_name in TEXT_TOOLS:
+        shaped = projection(content, options)
+    else:
+        try:
+            result = json.loads(content)
+        except ValueError:
+            return content, None
+        # Error results are short and their message must reach the model unchanged
+        if not isinstance(result, dict) or result.get("status") != "success":
+            return content, None
+        shaped = _dumps(projection(result, options))
+
+    report = {"tokens_before": count_tokens(content), "tokens_after": count_tokens(shaped)}
+    stats = shaping_stats.setdefault(tool_name, ShapingStats())
+    stats.calls += 1
+    stats.tokens_before += report["tokens_before"]
+    stats.tokens_after += report["tokens_after"]
+    logger.debug(f"Shaped {tool_name} result: {report['tokens_before']} -> {report['tokens_after']} tokens")
+    return shaped, report
+
+
+def get_shaping_stats() -> Dict[str, Any]:
+    """Cumulative token counts before and after shaping, per tool"""
+    return {
+        tool_name: {
+            **asdict(stats),
+            "saved_ratio": round(1 - stats.tokens_after / stats.tokens_before, 3) if stats.tokens_before else 0.0
+        }
+        for tool_name, stats in shaping_stats.items()
+    }
@@ -0,0 +1,243 @@
+"""
+多提供商组合搜索
+
+同时配置多个搜索提供商时，按各提供商的延迟直方图排序后并发查询：
+- 先查询排名靠前的fanout个提供商
+- 对冲：一定时间(首选提供商的p95延迟)内未完成时，再向下一个提供商发送备用请求
+- 提供商失败时立即改用下一个提供商
+- 收到fanout个提供商的结果后取消其余请求，按URL去重并用倒数排名融合(RRF)合并结果
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.tools.search.search_base import SearchEngine, SearchResult, format_results
+from app.utils.latency import LatencyHistogram
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 倒数排名融合的平滑常数
+RRF_K = 60
+# 对冲延迟的下限(秒)，避免直方图偏低时几乎总是发送备用请求
+MIN_HEDGE_DELAY = 0.05
+# 以该概率把随机一个非首选提供商排到最前，使其延迟统计保持更新
+EXPLORE_RATE = 0.05
+# 合并结果时忽略的跟踪参数前缀
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid")
+
+
+def normalize_url(url: str) -> str:
+    """规范化URL用于去重：忽略协议、www前缀、片段、跟踪参数和末尾斜杠"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    ))
+    return urlunsplit(("", host, parts.path.rstrip("/"), query, ""))
+
+
+def fuse_results(ranked_lists: List[List[SearchResult]], k: int = RRF_K) -> List[SearchResult]:
+    """按URL去重并用倒数排名融合合并多个提供商的结果
+
+    每个结果的得分为它在各提供商结果中排名r的1/(k+r)之和，多个提供商都返回的结果排名靠前。
+
+    Args:
+        ranked_lists: 各提供商按相关性排序的结果，靠前的列表在同分时优先
+        k: 平滑常数
+
+    Returns:
+        合并后按得分排序的结果
+    """
+    scores: Dict[str, float] = {}
+    merged: Dict[str, SearchResult] = {}
+    for results in ranked_lists:
+        for rank, result in enumerate(results, 1):
+            key = normalize_url(result.url) if result.url else result.title
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = SearchResult(result.title, result.url, result.snippet, result.provider)
+            else:
+                if result.provider and result.provider not in existing.provider.split(","):
+                    existing.provider = f"{existing.provider},{result.provider}"
+                if not existing.snippet:
+                    existing.snippet = result.snippet
+    # sorted是稳定排序，同分时保持先出现的顺序
+    return [merged[key] for key in sorted(merged, key=lambda key: -scores[key])]
+
+
+class CompositeSearch(SearchEngine):
+    """并发查询多个提供商并合并结果的搜索引擎"""
+
+    provider = "composite"
+
+    def __init__(
+        self,
+        engines: Dict[str, SearchEngine],
+        fanout: int = 1,
+        hedge: bool = True,
+        hedge_quantile: float = 0.95,
+        hedge_delay: float = 1.0,
+        min_samples: int = 20,
+        max_results: int = 5
+    ):
+        """
+        Args:
+            engines: 提供商名称到搜索引擎的映射，顺序为没有延迟统计时的优先顺序
+            fanout: 同时查询并合并结果的提供商数
+            hedge: 是否发送对冲请求
+            hedge_quantile: 按提供商延迟的该分位数决定何时发送对冲请求
+            hedge_delay: 样本不足min_samples时使用的对冲延迟(秒)
+            min_samples: 使用延迟统计排序和计算对冲延迟所需的最少样本数
+            max_results: 格式化输出的最多结果条数
+        """
+        if not engines:
+            raise ValueError("CompositeSearch needs at least one search engine")
+        self.engines = dict(engines)
+        self.fanout = max(1, min(fanout, len(self.engines)))
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.max_results = max_results
+        self.latency = {name: LatencyHistogram() for name in self.engines}
+        self.counters = {"searches": 0, "hedges": 0, "failovers": 0, "cancelled": 0, "failures": 0}
+
+    def _score(self, name: str) -> float:
+        """提供商的排序得分，越小越优先；样本不足的提供商排在最前以收集统计"""
+        histogram = self.latency[name]
+        if histogram.count < self.min_samples:
+            return 0.0
+        # 失败的请求需要再请求其他提供商，按成功率折算延迟
+        return histogram.quantile(self.hedge_quantile) / max(1.0 - histogram.error_rate, 0.05)
+
+    def ranked(self) -> List[str]:
+        """按延迟统计排序的提供商名称"""
+        names = sorted(self.engines, key=self._score)
+        if len(names) > 1 and random.random() < EXPLORE_RATE:
+            names.insert(0, names.pop(random.randrange(1, len(names))))
+        return names
+
+    def hedge_delay_for(self, name: str) -> float:
+        """等待提供商多久后发送对冲请求"""
+        histogram = self.latency[name]
+        if histogram.count < self.min_samples:
+            return self.hedge_delay
+        return max(histogram.quantile(self.hedge_quantile), MIN_HEDGE_DELAY)
+
+    async def _query(self, name: str, query: str) -> List[SearchResult]:
+        """查询一个提供商并记录延迟"""
+        start = time.monotonic()
+        try:
+            results = await self.engines[name].aresults(query)
+        except asyncio.CancelledError:
+            # 被取消的请求只知道延迟的下限，仍然记录，否则慢的提供商总被取消而显得很快
+            self.latency[name].record(time.monotonic() - start)
+            self.counters["cancelled"] += 1
+            raise
+        except Exception:
+            self.latency[name].record(time.monotonic() - start, error=True)
+            raise
+        self.latency[name].record(time.monotonic() - start)
+        return results
+
+    def search(self, query: str) -> str:
+        """同步搜索：按排序依次尝试提供商，直到成功(不并发、不合并)
+
+        Args:
+            query: 搜索查询字符串
+
+        Returns:
+            格式化的搜索结果字符串
+        """
+        error: Optional[Exception] = None
+        for name in self.ranked():
+            try:
+                return self.engines[name].search(query)
+            except Exception as e:
+                logger.warning(f"Search provider {name} failed: {e}")
+                error = e
+        raise error
+
+    async def asearch(self, query: str) -> str:
+        """异步执行搜索并返回合并后的结果
+
+        Args:
+            query: 搜索查询字符串
+
+        Returns:
+            格式化的搜索结果字符串
+        """
+        return format_results(await self.aresults(query), limit=self.max_results)
+
+    async def aresults(self, query: str) -> List[SearchResult]:
+        """并发查询提供商，对冲慢请求并合并结果
+
+        Args:
+            query: 搜索查询字符串
+
+        Returns:
+            按URL去重、融合排序后的结果列表
+        """
+        self.counters["searches"] += 1
+        loop = asyncio.get_running_loop()
+        order = self.ranked()
+        waiting = list(order)
+        pending: Dict[asyncio.Task, str] = {}
+        results: Dict[str, List[SearchResult]] = {}
+        errors: Dict[str, Exception] = {}
+        hedge_at: Optional[float] = None
+
+        def launch() -> None:
+            nonlocal hedge_at
+            name = waiting.pop(0)
+            pending[asyncio.create_task(self._query(name, query))] = name
+            if self.hedge:
+                hedge_at = loop.time() + self.hedge_delay_for(name)
+
+        for _ in range(self.fanout):
+            launch()
+        try:
+            while pending and len(results) < self.fanout:
+                timeout = None
+                if self.hedge and waiting:
+                    timeout = max(hedge_at - loop.time(), 0.0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 对冲：请求仍未完成，向下一个提供商发送备用请求
+                    self.counters["hedges"] += 1
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        results[name] = task.result()
+                    except Exception as e:
+                        logger.warning(f"Search provider {name} failed: {e}")
+                        errors[name] = e
+                        if waiting:
+                            self.counters["failovers"] += 1
+                            launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if not results:
+            self.counters["failures"] += 1
+            raise next(iter(errors.values()))
+        return fuse_results([results[name] for name in order if name in results])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "ranking": sorted(self.engines, key=self._score),
+            "providers": {name: histogram.to_dict() for name, histogram in self.latency.items()},
+        }
@@ -1,10 +1,50 @@
+import asyncio
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import List, Dict, Any
 
+# 格式化输出时每条结果摘要的最大长度
+SNIPPET_LENGTH = 500
+
+
+@dataclass
+class SearchResult:
+    """一条结构化的搜索结果"""
+    title: str
+    url: str
+    snippet: str
+    # 返回该结果的提供商
+    provider: str = ""
+
+
+def format_results(results: List[SearchResult], limit: int = 3) -> str:
+    """将结构化结果格式化为工具输出的字符串
+    
+    Args:
+        results: 按相关性排序的结果
+        limit: 最多输出的结果条数
+        
+    Returns:
+        格式化的搜索结果字符串
+    """
+    formatted_results = [
+        f"{i}. {result.title}\n{result.url}\n{result.snippet[:SNIPPET_LENGTH]}...\n"
+        for i, result in enumerate(results[:limit], 1)
+    ]
+    
+    # 如果没有结果，返回提示
+    if not formatted_results:
+        return "No search results found."
+    
+    return "\n".join(formatted_results)
+
 
 class SearchEngine(ABC):
     """搜索引擎抽象基类"""
     
+    # 提供商名称，用于标记结果来源
+    provider = ""
+    
     @abstractmethod
     def search(self, query: str) -> str:
         """执行搜索并返回结果
@@ -16,3 +56,27 @@ class SearchEngine(ABC):
             格式化的搜索结果字符串
         """
         pass
+    
+    async def asearch(self, query: str) -> str:
+        """异步执行搜索并返回结果，默认在线程池中执行search，避免阻塞事件循环
+        
+        Args:
+            query: 搜索查询字符串
+            
+        Returns:
+            格式化的搜索结果字符串
+        """
+        return await asyncio.to_thread(self.search, query)
+    
+    async def aresults(self, query: str) -> List[SearchResult]:
+        """异步执行搜索并返回结构化结果，供多提供商合并使用
+        
+        与asearch不同，请求失败时抛出异常而不是返回错误信息。
+        
+        Args:
+            query: 搜索查询字符串
+            
+        Returns:
+            按相关性排序的结果列表
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not return structured results")
@@ -0,0 +1,174 @@
+"""
+搜索服务
+
+在搜索引擎之上提供缓存和并发合并：
+- 每个提供商只创建一个搜索引擎实例，复用其连接
+- 结果按(提供商, 规范化查询)缓存，TTL过期、超出容量按LRU淘汰
+- 相同查询的并发请求合并为一次上游调用
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Union
+
+from app.config.settings import settings
+from app.tools.search.search_base import SearchEngine, SearchResult
+from app.utils.cache import MISSING, AsyncTTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def create_search_engine(provider: str) -> SearchEngine:
+    """根据提供商名称创建搜索引擎实例
+
+    Args:
+        provider: 搜索提供商(tavily、serpapi或serper)，逗号分隔的多个提供商创建组合搜索引擎
+
+    Returns:
+        搜索引擎实例
+    """
+    if "," in provider:
+        return create_composite_engine([name.strip() for name in provider.split(",") if name.strip()])
+    elif provider == "tavily":
+        from app.tools.search.tavily_search import TavilySearch
+        return TavilySearch()
+    elif provider == "serpapi":
+        from app.tools.search.serpapi_search import SerpAPISearch
+        return SerpAPISearch()
+    elif provider == "serper":
+        from app.tools.search.serper_search import SerperSearch
+        return SerperSearch()
+    else:
+        raise ValueError(f"Unsupported search provider: {provider}")
+
+
+def create_composite_engine(providers: List[str]) -> SearchEngine:
+    """创建并发查询多个提供商的组合搜索引擎，跳过无法创建(如未配置API密钥)的提供商"""
+    from app.tools.search.composite_search import CompositeSearch
+    engines: Dict[str, SearchEngine] = {}
+    for provider in providers:
+        try:
+            engines[provider] = create_search_engine(provider)
+        except (ValueError, ImportError) as e:
+            logger.warning(f"Search provider {provider} is not available: {e}")
+    if not engines:
+        raise ValueError(f"None of the search providers {providers} is available")
+    return CompositeSearch(
+        engines,
+        fanout=settings.SEARCH_FANOUT,
+        hedge=settings.SEARCH_HEDGE,
+        hedge_quantile=settings.SEARCH_HEDGE_QUANTILE,
+        hedge_delay=settings.SEARCH_HEDGE_DELAY
+    )
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询作为缓存键：合并空白并忽略大小写"""
+    return " ".join(query.split()).casefold()
+
+
+class SearchService:
+    """带缓存和并发合并的搜索服务"""
+
+    def __init__(self, cache_size: Optional[int] = None, cache_ttl: Optional[float] = None):
+        self.cache = AsyncTTLCache(
+            maxsize=settings.SEARCH_CACHE_SIZE if cache_size is None else cache_size,
+            ttl=settings.SEARCH_CACHE_TTL if cache_ttl is None else cache_ttl
+        )
+        self._engines: Dict[str, SearchEngine] = {}
+
+    def get_engine(self, provider: Optional[str] = None) -> SearchEngine:
+        """获取提供商的搜索引擎实例，首次使用时创建"""
+        provider = (provider or settings.SEARCH_PROVIDER).lower()
+        engine = self._engines.get(provider)
+        if engine is None:
+            engine = create_search_engine(provider)
+            self._engines[provider] = engine
+        return engine
+
+    async def search(self, query: str, provider: Optional[str] = None) -> str:
+        """异步搜索，优先返回缓存结果
+
+        Args:
+            query: 搜索查询字符串
+            provider: 搜索提供商，默认使用配置的提供商
+
+        Returns:
+            格式化的搜索结果字符串
+        """
+        provider = (provider or settings.SEARCH_PROVIDER).lower()
+        engine = self.get_engine(provider)
+        return await self.cache.get_or_load(
+            (provider, normalize_query(query)),
+            lambda: asyncio.wait_for(engine.asearch(query), timeout=settings.SEARCH_TIMEOUT)
+        )
+
+    async def results(self, query: str, provider: Optional[str] = None) -> List[SearchResult]:
+        """异步搜索并返回结构化结果，优先返回缓存结果
+
+        Args:
+            query: 搜索查询字符串
+            provider: 搜索提供商，默认使用配置的提供商
+
+        Returns:
+            按相关性排序的结果列表
+        """
+        provider = (provider or settings.SEARCH_PROVIDER).lower()
+        engine = self.get_engine(provider)
+        return await self.cache.get_or_load(
+            (provider, "results", normalize_query(query)),
+            lambda: asyncio.wait_for(engine.aresults(query), timeout=settings.SEARCH_TIMEOUT)
+        )
+
+    async def search_many(
+        self,
+        queries: List[str],
+        provider: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ) -> List[Union[List[SearchResult], Exception]]:
+        """并发搜索多个查询，同时进行的搜索不超过concurrency个
+
+        Args:
+            queries: 搜索查询列表
+            provider: 搜索提供商，默认使用配置的提供商
+            concurrency: 最大并发数，默认使用SEARCH_BATCH_CONCURRENCY
+
+        Returns:
+            与queries一一对应的结果列表，失败的查询对应其异常
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.SEARCH_BATCH_CONCURRENCY)
+
+        async def search_one(query: str) -> List[SearchResult]:
+            async with semaphore:
+                return await self.results(query, provider)
+
+        return await asyncio.gather(*(search_one(query) for query in queries), return_exceptions=True)
+
+    def search_sync(self, query: str, provider: Optional[str] = None) -> str:
+        """同步搜索，与异步搜索共用缓存(不合并并发请求)"""
+        provider = (provider or settings.SEARCH_PROVIDER).lower()
+        key = (provider, normalize_query(query))
+        result = self.cache.get(key)
+        if result is not MISSING:
+            self.cache.stats.hits += 1
+            return result
+        self.cache.stats.misses += 1
+        result = self.get_engine(provider).search(query)
+        self.cache.set(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计，以及组合搜索引擎的对冲次数和各提供商延迟"""
+        stats = self.cache.stats_dict()
+        engines = {
+            provider: engine.stats()
+            for provider, engine in self._engines.items()
+            if hasattr(engine, "stats")
+        }
+        if engines:
+            stats["engines"] = engines
+        return stats
+
+
+# 全局搜索服务实例
+search_service = SearchService()
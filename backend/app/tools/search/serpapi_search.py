@@ -1,10 +1,17 @@
-from app.tools.search.search_base import SearchEngine
+from typing import List
+from app.tools.search.search_base import SearchEngine, SearchResult, format_results
 from app.config.settings import settings
+from app.utils.http_client import get_http_client
+
+# SerpAPI的JSON接口，异步搜索通过共享连接池直接调用
+SERPAPI_SEARCH_URL = "https://serpapi.com/search.json"
 
 
 class SerpAPISearch(SearchEngine):
     """SerpAPI搜索引擎实现"""
     
+    provider = "serpapi"
+    
     def __init__(self):
         """初始化SerpAPI客户端"""
         self.api_key = settings.SERPAPI_API_KEY
@@ -27,41 +34,66 @@ class SerpAPISearch(SearchEngine):
         Returns:
             格式化的搜索结果字符串
         """
-        try:
-            # 构建搜索参数
-            params = {
-                "q": query,
-                "api_key": self.api_key
-            }
-            
-            # 执行搜索
-            search = self.GoogleSearch(params)
-            results = search.get_dict()
-            
-            # 格式化结果
-            formatted_results = []
-            
-            # 处理有机搜索结果
-            if "organic_results" in results:
-                for i, result in enumerate(results["organic_results"][:3], 1):
-                    title = result.get("title", "")
-                    url = result.get("link", "")
-                    snippet = result.get("snippet", "")
-                    formatted_results.append(f"{i}. {title}\n{url}\n{snippet[:500]}...\n")
-            
-            # 如果没有有机结果，尝试获取其他类型的结果
-            elif "answer_box" in results:
-                answer_box = results["answer_box"]
-                title = answer_box.get("title", "")
-                url = answer_box.get("link", "")
-                snippet = answer_box.get("snippet", "") or answer_box.get("answer", "")
-                formatted_results.append(f"1. {title}\n{url}\n{snippet[:500]}...\n")
+        # 构建搜索参数
+        params = {
+            "q": query,
+            "api_key": self.api_key
+        }
+        
+        # 执行搜索，失败时抛出异常，避免错误信息被当作结果缓存
+        search = self.GoogleSearch(params)
+        results = search.get_dict()
+        return format_results(self._parse_results(results))
+    
+    async def asearch(self, query: str) -> str:
+        """异步执行搜索并返回结果
+        
+        Args:
+            query: 搜索查询字符串
             
-            # 如果没有结果，返回提示
-            if not formatted_results:
-                return "No search results found."
+        Returns:
+            格式化的搜索结果字符串
+        """
+        return format_results(await self.aresults(query))
+    
+    async def aresults(self, query: str) -> List[SearchResult]:
+        """异步执行搜索并返回结构化结果
+        
+        Args:
+            query: 搜索查询字符串
             
-            return "\n".join(formatted_results)
-        except Exception as e:
-            # 捕获所有异常并返回错误信息
-            return f"Error during search: {str(e)}"
+        Returns:
+            按相关性排序的结果列表
+        """
+        response = await get_http_client().get(
+            SERPAPI_SEARCH_URL,
+            params={"engine": "google", "q": query, "api_key": self.api_key}
+        )
+        response.raise_for_status()
+        return self._parse_results(response.json())
+    
+    def _parse_results(self, results: dict) -> List[SearchResult]:
+        """解析结果"""
+        parsed_results = []
+        
+        # 处理有机搜索结果
+        if "organic_results" in results:
+            for result in results["organic_results"]:
+                parsed_results.append(SearchResult(
+                    title=result.get("title", ""),
+                    url=result.get("link", ""),
+                    snippet=result.get("snippet", ""),
+                    provider=self.provider
+                ))
+        
+        # 如果没有有机结果，尝试获取其他类型的结果
+        elif "answer_box" in results:
+            answer_box = results["answer_box"]
+            parsed_results.append(SearchResult(
+                title=answer_box.get("title", ""),
+                url=answer_box.get("link", ""),
+                snippet=answer_box.get("snippet", "") or answer_box.get("answer", ""),
+                provider=self.provider
+            ))
+        
+        return parsed_results
@@ -1,17 +1,27 @@
-from app.tools.search.search_base import SearchEngine
+from typing import List
+from app.tools.search.search_base import SearchEngine, SearchResult, format_results
 from app.config.settings import settings
+from app.utils.http_client import get_http_client
 import requests
 
 
 class SerperSearch(SearchEngine):
     """Serper搜索引擎实现"""
     
+    provider = "serper"
+    
     def __init__(self):
         """初始化Serper客户端"""
         self.api_key = settings.SERPER_API_KEY
         if not self.api_key:
             raise ValueError("SERPER_API_KEY is not set in settings")
         self.base_url = "https://google.serper.dev/search"
+        self.headers = {
+            "X-API-KEY": self.api_key,
+            "Content-Type": "application/json"
+        }
+        # 同步搜索复用连接
+        self.session = requests.Session()
     
     def search(self, query: str) -> str:
         """执行搜索并返回结果
@@ -22,41 +32,57 @@ class SerperSearch(SearchEngine):
         Returns:
             格式化的搜索结果字符串
         """
-        # 构建请求参数
-        headers = {
-            "X-API-KEY": self.api_key,
-            "Content-Type": "application/json"
-        }
-        data = {
-            "q": query
-        }
-        
         # 执行搜索
-        response = requests.post(self.base_url, headers=headers, json=data)
+        response = self.session.post(self.base_url, headers=self.headers, json={"q": query}, timeout=settings.HTTP_TIMEOUT)
         response.raise_for_status()  # 检查请求是否成功
-        results = response.json()
+        return format_results(self._parse_results(response.json()))
+    
+    async def asearch(self, query: str) -> str:
+        """异步执行搜索并返回结果
         
-        # 格式化结果
-        formatted_results = []
+        Args:
+            query: 搜索查询字符串
+            
+        Returns:
+            格式化的搜索结果字符串
+        """
+        return format_results(await self.aresults(query))
+    
+    async def aresults(self, query: str) -> List[SearchResult]:
+        """异步执行搜索并返回结构化结果
+        
+        Args:
+            query: 搜索查询字符串
+            
+        Returns:
+            按相关性排序的结果列表
+        """
+        response = await get_http_client().post(self.base_url, headers=self.headers, json={"q": query})
+        response.raise_for_status()
+        return self._parse_results(response.json())
+    
+    def _parse_results(self, results: dict) -> List[SearchResult]:
+        """解析结果"""
+        parsed_results = []
         
         # 处理有机搜索结果
         if "organic" in results:
-            for i, result in enumerate(results["organic"][:3], 1):
-                title = result.get("title", "")
-                url = result.get("link", "")
-                snippet = result.get("snippet", "")
-                formatted_results.append(f"{i}. {title}\n{url}\n{snippet[:500]}...\n")
+            for result in results["organic"]:
+                parsed_results.append(SearchResult(
+                    title=result.get("title", ""),
+                    url=result.get("link", ""),
+                    snippet=result.get("snippet", ""),
+                    provider=self.provider
+                ))
         
         # 如果没有有机结果，尝试获取其他类型的结果
         elif "answerBox" in results:
             answer_box = results["answerBox"]
-            title = answer_box.get("title", "")
-            url = answer_box.get("link", "")
-            snippet = answer_box.get("snippet", "") or answer_box.get("answer", "")
-            formatted_results.append(f"1. {title}\n{url}\n{snippet[:500]}...\n")
-        
-        # 如果没有结果，返回提示
-        if not formatted_results:
-            return "No search results found."
+            parsed_results.append(SearchResult(
+                title=answer_box.get("title", ""),
+                url=answer_box.get("link", ""),
+                snippet=answer_box.get("snippet", "") or answer_box.get("answer", ""),
+                provider=self.provider
+            ))
         
-        return "\n".join(formatted_results)
+        return parsed_results
@@ -1,11 +1,18 @@
-from app.tools.search.search_base import SearchEngine
+from typing import List
+from app.tools.search.search_base import SearchEngine, SearchResult, format_results
 from tavily import TavilyClient
 from app.config.settings import settings
+from app.utils.http_client import get_http_client
+
+# Tavily搜索接口，异步搜索通过共享连接池直接调用
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
 
 
 class TavilySearch(SearchEngine):
     """Tavily搜索引擎实现"""
     
+    provider = "tavily"
+    
     def __init__(self):
         """初始化Tavily客户端"""
         self.api_key = settings.TAVILY_API_KEY
@@ -24,10 +31,39 @@ class TavilySearch(SearchEngine):
         """
         # 搜索并获取结果
         results = self.client.search(query=query, search_depth='basic', topic='general')
+        return format_results(self._parse_results(results))
+    
+    async def asearch(self, query: str) -> str:
+        """异步执行搜索并返回结果
         
-        # 格式化结果
-        formatted_results = []
-        for i, result in enumerate(results['results'][:3], 1):
-            formatted_results.append(f"{i}. {result['title']}\n{result['url']}\n{result['content'][:500]}...\n")
+        Args:
+            query: 搜索查询字符串
+            
+        Returns:
+            格式化的搜索结果字符串
+        """
+        return format_results(await self.aresults(query))
+    
+    async def aresults(self, query: str) -> List[SearchResult]:
+        """异步执行搜索并返回结构化结果
         
-        return "\n".join(formatted_results)
+        Args:
+            query: 搜索查询字符串
+            
+        Returns:
+            按相关性排序的结果列表
+        """
+        response = await get_http_client().post(
+            TAVILY_SEARCH_URL,
+            json={"query": query, "search_depth": "basic", "topic": "general"},
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+        response.raise_for_status()
+        return self._parse_results(response.json())
+    
+    def _parse_results(self, results: dict) -> List[SearchResult]:
+        """解析结果"""
+        return [
+            SearchResult(title=result['title'], url=result['url'], snippet=result['content'], provider=self.provider)
+            for result in results['results']
+        ]
@@ -3,18 +3,263 @@
 Weather API Tool
 
 This tool provides weather information using WeatherAPI (https://www.weatherapi.com).
+
+Requests go through the shared keep-alive HTTP client and never block the event loop.
+Responses are cached per city: forecasts for WEATHER_FORECAST_TTL seconds, while current
+conditions are answered from a forecast response at most WEATHER_CURRENT_TTL seconds old.
+Current conditions are read from forecast.json, so asking for the current weather and
+the forecast of a city in the same run costs one request.
 """
 
-from app.tools import tool
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+import httpx
+from langchain_core.tools import StructuredTool
+
 from app.config.settings import settings
+from app.utils.cache import MISSING, AsyncTTLCache
+from app.utils.http_client import get_http_client, run_sync
 from app.utils.logger import get_logger
-import requests
-from typing import Dict, Any
+from app.utils.rate_limit import AsyncRateLimiter
 
 logger = get_logger(__name__)
 
+FORECAST_URL = "http://api.weatherapi.com/v1/forecast.json"
+MAX_FORECAST_DAYS = 14
+# Days fetched for current weather requests, so a following default forecast is a cache hit
+CURRENT_FORECAST_DAYS = 3
+
+
+def normalize_city(city: str) -> str:
+    """Cache key of a city: collapsed whitespace, case-insensitive"""
+    return " ".join(city.split()).casefold()
+
+
+@dataclass
+class ForecastResponse:
+    """A raw forecast.json response and when it was fetched"""
+    data: Dict[str, Any]
+    days: int
+    fetched_at: float
+
+
+class WeatherClient:
+    """WeatherAPI client with a per-city response cache"""
+    
+    def __init__(
+        self,
+        current_ttl: Optional[float] = None,
+        forecast_ttl: Optional[float] = None,
+        cache_size: Optional[int] = None
+    ):
+        self.current_ttl = settings.WEATHER_CURRENT_TTL if current_ttl is None else current_ttl
+        self.forecast_ttl = settings.WEATHER_FORECAST_TTL if forecast_ttl is None else forecast_ttl
+        # (city, days) -> ForecastResponse; concurrent requests for the same key share one fetch
+        self.cache = AsyncTTLCache(
+            maxsize=settings.WEATHER_CACHE_SIZE if cache_size is None else cache_size,
+            ttl=self.forecast_ttl
+        )
+        # Limits requests sent to WeatherAPI; cache hits are not limited
+        self.limiter = AsyncRateLimiter(settings.WEATHER_RATE_LIMIT, burst=settings.WEATHER_BATCH_CONCURRENCY)
+    
+    async def _fetch(self, city: str, days: int) -> ForecastResponse:
+        params = {
+            "key": settings.WEATHER_API_KEY,
+            "q": city,
+            "days": days,
+            "aqi": "yes",
+            "alerts": "yes"
+        }
+        await self.limiter.acquire()
+        response = await get_http_client().get(FORECAST_URL, params=params, timeout=settings.WEATHER_TIMEOUT)
+        response.raise_for_status()
+        return ForecastResponse(data=response.json(), days=days, fetched_at=time.monotonic())
+    
+    def _cached(self, key: str, days: int, max_age: float) -> Optional[ForecastResponse]:
+        """A cached response covering at least days and at most max_age seconds old"""
+        now = time.monotonic()
+        for cached_days in range(days, MAX_FORECAST_DAYS + 1):
+            entry = self.cache.get((key, cached_days))
+            if entry is not MISSING and now - entry.fetched_at <= max_age:
+                return entry
+        return None
+    
+    def _inflight(self, key: str, days: int) -> Optional[asyncio.Task]:
+        """A running fetch covering at least days"""
+        for fetching_days in range(days, MAX_FORECAST_DAYS + 1):
+            task = self.cache.inflight((key, fetching_days))
+            if task is not None:
+                return task
+        return None
+    
+    async def forecast(self, city: str, days: int) -> ForecastResponse:
+        """Forecast response covering at least days, from the cache or a running fetch when possible"""
+        key = normalize_city(city)
+        entry = self._cached(key, days, self.forecast_ttl)
+        if entry is not None:
+            self.cache.stats.hits += 1
+            return entry
+        task = self._inflight(key, days)
+        if task is not None:
+            self.cache.stats.coalesced += 1
+            return await asyncio.shield(task)
+        return await self.cache.get_or_load((key, days), lambda: self._fetch(city, days))
+    
+    async def current(self, city: str) -> ForecastResponse:
+        """Forecast response whose current conditions are at most current_ttl seconds old
+        
+        Reuses a fresh enough cached or in-flight forecast of the city, otherwise fetches
+        a CURRENT_FORECAST_DAYS forecast.
+        """
+        key = normalize_city(city)
+        entry = self._cached(key, 1, self.current_ttl)
+        if entry is not None:
+            self.cache.stats.hits += 1
+            return entry
+        task = self._inflight(key, 1)
+        if task is not None:
+            self.cache.stats.coalesced += 1
+            return await asyncio.shield(task)
+        # The cached response is too old for current conditions but may still serve forecasts
+        days = CURRENT_FORECAST_DAYS
+        self.cache.delete((key, days))
+        return await self.cache.get_or_load((key, days), lambda: self._fetch(city, days))
+    
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats_dict()
+
+
+# Shared client instance
+weather_client = WeatherClient()
+
 
-def _get_current_weather(city: str) -> Dict[str, Any]:
+def _parse_current_weather(data: Dict[str, Any], city: str) -> Dict[str, Any]:
+    """Build the current weather result from a WeatherAPI response"""
+    location = data.get("location", {})
+    current = data.get("current", {})
+    condition = current.get("condition", {})
+    air_quality = current.get("air_quality", {})
+    
+    return {
+        "status": "success",
+        "location": {
+            "name": location.get("name"),
+            "region": location.get("region"),
+            "country": location.get("country"),
+            "lat": location.get("lat"),
+            "lon": location.get("lon"),
+            "timezone": location.get("tz_id"),
+            "local_time": location.get("localtime")
+        },
+        "current": {
+            "temperature_c": current.get("temp_c"),
+            "temperature_f": current.get("temp_f"),
+            "condition": condition.get("text"),
+            "condition_icon": condition.get("icon"),
+            "wind_mph": current.get("wind_mph"),
+            "wind_kph": current.get("wind_kph"),
+            "wind_degree": current.get("wind_degree"),
+            "wind_dir": current.get("wind_dir"),
+            "pressure_mb": current.get("pressure_mb"),
+            "pressure_in": current.get("pressure_in"),
+            "precip_mm": current.get("precip_mm"),
+            "precip_in": current.get("precip_in"),
+            "humidity": current.get("humidity"),
+            "cloud": current.get("cloud"),
+            "feelslike_c": current.get("feelslike_c"),
+            "feelslike_f": current.get("feelslike_f"),
+            "vis_km": current.get("vis_km"),
+            "vis_miles": current.get("vis_miles"),
+            "uv": current.get("uv"),
+            "gust_mph": current.get("gust_mph"),
+            "gust_kph": current.get("gust_kph"),
+            "last_updated": current.get("last_updated")
+        },
+        "air_quality": {
+            "co": air_quality.get("co"),
+            "no2": air_quality.get("no2"),
+            "o3": air_quality.get("o3"),
+            "so2": air_quality.get("so2"),
+            "pm2_5": air_quality.get("pm2_5"),
+            "pm10": air_quality.get("pm10"),
+            "us_epa_index": air_quality.get("us-epa-index"),
+            "gb_defra_index": air_quality.get("gb-defra-index")
+        },
+        "message": f"Successfully retrieved weather data for {city}"
+    }
+
+
+def _parse_weather_forecast(data: Dict[str, Any], city: str, days: int) -> Dict[str, Any]:
+    """Build the forecast result for the first days of a WeatherAPI response"""
+    location = data.get("location", {})
+    forecast = data.get("forecast", {}).get("forecastday", [])[:days]
+    alerts = data.get("alerts", {}).get("alert", [])
+    
+    forecast_days = []
+    for day in forecast:
+        day_data = day.get("day", {})
+        condition = day_data.get("condition", {})
+        forecast_days.append({
+            "date": day.get("date"),
+            "max_temp_c": day_data.get("maxtemp_c"),
+            "max_temp_f": day_data.get("maxtemp_f"),
+            "min_temp_c": day_data.get("mintemp_c"),
+            "min_temp_f": day_data.get("mintemp_f"),
+            "avg_temp_c": day_data.get("avgtemp_c"),
+            "avg_temp_f": day_data.get("avgtemp_f"),
+            "max_wind_mph": day_data.get("maxwind_mph"),
+            "max_wind_kph": day_data.get("maxwind_kph"),
+            "total_precip_mm": day_data.get("totalprecip_mm"),
+            "total_precip_in": day_data.get("totalprecip_in"),
+            "avg_visibility_km": day_data.get("avgvis_km"),
+            "avg_visibility_miles": day_data.get("avgvis_miles"),
+            "avg_humidity": day_data.get("avghumidity"),
+            "daily_will_it_rain": day_data.get("daily_will_it_rain"),
+            "daily_chance_of_rain": day_data.get("daily_chance_of_rain"),
+            "daily_will_it_snow": day_data.get("daily_will_it_snow"),
+            "daily_chance_of_snow": day_data.get("daily_chance_of_snow"),
+            "condition": condition.get("text"),
+            "condition_icon": condition.get("icon"),
+            "uv": day_data.get("uv")
+        })
+    
+    alert_list = []
+    for alert in alerts:
+        alert_list.append({
+            "headline": alert.get("headline"),
+            "msgtype": alert.get("msgtype"),
+            "severity": alert.get("severity"),
+            "urgency": alert.get("urgency"),
+            "areas": alert.get("areas"),
+            "category": alert.get("category"),
+            "certainty": alert.get("certainty"),
+            "event": alert.get("event"),
+            "note": alert.get("note"),
+            "effective": alert.get("effective"),
+            "expires": alert.get("expires"),
+            "desc": alert.get("desc"),
+            "instruction": alert.get("instruction")
+        })
+    
+    return {
+        "status": "success",
+        "location": {
+            "name": location.get("name"),
+            "region": location.get("region"),
+            "country": location.get("country"),
+            "timezone": location.get("tz_id"),
+            "local_time": location.get("localtime")
+        },
+        "forecast": forecast_days,
+        "alerts": alert_list,
+        "message": f"Successfully retrieved {days}-day weather forecast for {city}"
+    }
+
+
+async def _get_current_weather(city: str) -> Dict[str, Any]:
     """Get current weather for a city
     
     Args:
@@ -29,73 +274,11 @@ def _get_current_weather(city: str) -> Dict[str, Any]:
             "message": "WEATHER_API_KEY not configured. Please set it in your .env file."
         }
     
-    base_url = "http://api.weatherapi.com/v1/current.json"
-    params = {
-        "key": settings.WEATHER_API_KEY,
-        "q": city,
-        "aqi": "yes"
-    }
-    
     try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        location = data.get("location", {})
-        current = data.get("current", {})
-        condition = current.get("condition", {})
-        air_quality = current.get("air_quality", {})
-        
-        return {
-            "status": "success",
-            "location": {
-                "name": location.get("name"),
-                "region": location.get("region"),
-                "country": location.get("country"),
-                "lat": location.get("lat"),
-                "lon": location.get("lon"),
-                "timezone": location.get("tz_id"),
-                "local_time": location.get("localtime")
-            },
-            "current": {
-                "temperature_c": current.get("temp_c"),
-                "temperature_f": current.get("temp_f"),
-                "condition": condition.get("text"),
-                "condition_icon": condition.get("icon"),
-                "wind_mph": current.get("wind_mph"),
-                "wind_kph": current.get("wind_kph"),
-                "wind_degree": current.get("wind_degree"),
-                "wind_dir": current.get("wind_dir"),
-                "pressure_mb": current.get("pressure_mb"),
-                "pressure_in": current.get("pressure_in"),
-                "precip_mm": current.get("precip_mm"),
-                "precip_in": current.get("precip_in"),
-                "humidity": current.get("humidity"),
-                "cloud": current.get("cloud"),
-                "feelslike_c": current.get("feelslike_c"),
-                "feelslike_f": current.get("feelslike_f"),
-                "vis_km": current.get("vis_km"),
-                "vis_miles": current.get("vis_miles"),
-                "uv": current.get("uv"),
-                "gust_mph": current.get("gust_mph"),
-                "gust_kph": current.get("gust_kph"),
-                "last_updated": current.get("last_updated")
-            },
-            "air_quality": {
-                "co": air_quality.get("co"),
-                "no2": air_quality.get("no2"),
-                "o3": air_quality.get("o3"),
-                "so2": air_quality.get("so2"),
-                "pm2_5": air_quality.get("pm2_5"),
-                "pm10": air_quality.get("pm10"),
-                "us_epa_index": air_quality.get("us-epa-index"),
-                "gb_defra_index": air_quality.get("gb-defra-index")
-            },
-            "message": f"Successfully retrieved weather data for {city}"
-        }
+        response = await weather_client.current(city)
+        return _parse_current_weather(response.data, city)
     
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Weather API request error: {e}")
         return {
             "status": "error",
@@ -109,7 +292,7 @@ def _get_current_weather(city: str) -> Dict[str, Any]:
         }
 
 
-def _get_weather_forecast(city: str, days: int = 3) -> Dict[str, Any]:
+async def _get_weather_forecast(city: str, days: int = 3) -> Dict[str, Any]:
     """Get weather forecast for a city
     
     Args:
@@ -125,89 +308,13 @@ def _get_weather_forecast(city: str, days: int = 3) -> Dict[str, Any]:
             "message": "WEATHER_API_KEY not configured. Please set it in your .env file."
         }
     
-    days = max(1, min(14, days))
-    
-    base_url = "http://api.weatherapi.com/v1/forecast.json"
-    params = {
-        "key": settings.WEATHER_API_KEY,
-        "q": city,
-        "days": days,
-        "aqi": "yes",
-        "alerts": "yes"
-    }
+    days = max(1, min(MAX_FORECAST_DAYS, days))
     
     try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        location = data.get("location", {})
-        current = data.get("current", {})
-        forecast = data.get("forecast", {}).get("forecastday", [])
-        alerts = data.get("alerts", {}).get("alert", [])
-        
-        forecast_days = []
-        for day in forecast:
-            day_data = day.get("day", {})
-            condition = day_data.get("condition", {})
-            forecast_days.append({
-                "date": day.get("date"),
-                "max_temp_c": day_data.get("maxtemp_c"),
-                "max_temp_f": day_data.get("maxtemp_f"),
-                "min_temp_c": day_data.get("mintemp_c"),
-                "min_temp_f": day_data.get("mintemp_f"),
-                "avg_temp_c": day_data.get("avgtemp_c"),
-                "avg_temp_f": day_data.get("avgtemp_f"),
-                "max_wind_mph": day_data.get("maxwind_mph"),
-                "max_wind_kph": day_data.get("maxwind_kph"),
-                "total_precip_mm": day_data.get("totalprecip_mm"),
-                "total_precip_in": day_data.get("totalprecip_in"),
-                "avg_visibility_km": day_data.get("avgvis_km"),
-                "avg_visibility_miles": day_data.get("avgvis_miles"),
-                "avg_humidity": day_data.get("avghumidity"),
-                "daily_will_it_rain": day_data.get("daily_will_it_rain"),
-                "daily_chance_of_rain": day_data.get("daily_chance_of_rain"),
-                "daily_will_it_snow": day_data.get("daily_will_it_snow"),
-                "daily_chance_of_snow": day_data.get("daily_chance_of_snow"),
-                "condition": condition.get("text"),
-                "condition_icon": condition.get("icon"),
-                "uv": day_data.get("uv")
-            })
-        
-        alert_list = []
-        for alert in alerts:
-            alert_list.append({
-                "headline": alert.get("headline"),
-                "msgtype": alert.get("msgtype"),
-                "severity": alert.get("severity"),
-                "urgency": alert.get("urgency"),
-                "areas": alert.get("areas"),
-                "category": alert.get("category"),
-                "certainty": alert.get("certainty"),
-                "event": alert.get("event"),
-                "note": alert.get("note"),
-                "effective": alert.get("effective"),
-                "expires": alert.get("expires"),
-                "desc": alert.get("desc"),
-                "instruction": alert.get("instruction")
-            })
-        
-        return {
-            "status": "success",
-            "location": {
-                "name": location.get("name"),
-                "region": location.get("region"),
-                "country": location.get("country"),
-                "timezone": location.get("tz_id"),
-                "local_time": location.get("localtime")
-            },
-            "forecast": forecast_days,
-            "alerts": alert_list,
-            "message": f"Successfully retrieved {days}-day weather forecast for {city}"
-        }
+        response = await weather_client.forecast(city, days)
+        return _parse_weather_forecast(response.data, city, days)
     
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Weather API forecast request error: {e}")
         return {
             "status": "error",
@@ -221,8 +328,72 @@ def _get_weather_forecast(city: str, days: int = 3) -> Dict[str, Any]:
         }
 
 
-@tool
-def get_current_weather(city: str) -> dict:
+# Columns of the get_weather_batch summary, one row per city per day
+BATCH_COLUMNS = ["city", "date", "condition", "min_c", "max_c", "chance_of_rain", "precip_mm", "max_wind_kph"]
+
+
+async def _get_weather_batch(cities: List[str], days: int = 3) -> Dict[str, Any]:
+    """Get weather forecasts for several cities at once
+    
+    Args:
+        cities: Names of the cities to compare (e.g., ["Paris", "Rome", "Madrid"])
+        days: Number of days to forecast for each city (1-14, default: 3)
+        
+    Returns:
+        A table with one row per city per day (date, condition, temperatures, rain, wind)
+    """
+    if not settings.WEATHER_API_KEY:
+        return {
+            "status": "error",
+            "message": "WEATHER_API_KEY not configured. Please set it in your .env file."
+        }
+    
+    days = max(1, min(MAX_FORECAST_DAYS, days))
+    # Each city is fetched once even if it is listed several times
+    unique_cities = {}
+    for city in cities:
+        if city.strip():
+            unique_cities.setdefault(normalize_city(city), city.strip())
+    unique_cities = list(unique_cities.values())
+    semaphore = asyncio.Semaphore(settings.WEATHER_BATCH_CONCURRENCY)
+    
+    async def fetch(city: str) -> ForecastResponse:
+        async with semaphore:
+            return await weather_client.forecast(city, days)
+    
+    responses = await asyncio.gather(*(fetch(city) for city in unique_cities), return_exceptions=True)
+    
+    rows = []
+    errors = []
+    for city, response in zip(unique_cities, responses):
+        if isinstance(response, BaseException):
+            logger.error(f"Weather API forecast request error for {city}: {response}")
+            errors.append({"city": city, "message": f"Failed to fetch weather forecast: {str(response)}"})
+            continue
+        name = response.data.get("location", {}).get("name") or city
+        for day in response.data.get("forecast", {}).get("forecastday", [])[:days]:
+            day_data = day.get("day", {})
+            rows.append([
+                name,
+                day.get("date"),
+                day_data.get("condition", {}).get("text"),
+                day_data.get("mintemp_c"),
+                day_data.get("maxtemp_c"),
+                day_data.get("daily_chance_of_rain"),
+                day_data.get("totalprecip_mm"),
+                day_data.get("maxwind_kph")
+            ])
+    
+    return {
+        "status": "success" if rows or not errors else "error",
+        "columns": BATCH_COLUMNS,
+        "rows": rows,
+        "errors": errors,
+        "message": f"Retrieved {days}-day weather forecast for {len(unique_cities) - len(errors)} of {len(unique_cities)} cities"
+    }
+
+
+def _current_weather(city: str) -> dict:
     """Get current weather conditions for a city
     
     Args:
@@ -231,11 +402,10 @@ def get_current_weather(city: str) -> dict:
     Returns:
         Current weather data including temperature, conditions, wind, humidity, etc.
     """
-    return _get_current_weather(city)
+    return run_sync(_get_current_weather(city))
 
 
-@tool
-def get_weather_forecast(city: str, days: int = 3) -> dict:
+def _weather_forecast(city: str, days: int = 3) -> dict:
     """Get weather forecast for a city
     
     Args:
@@ -245,4 +415,43 @@ def get_weather_forecast(city: str, days: int = 3) -> dict:
     Returns:
         Weather forecast data including daily temperatures, conditions, and alerts if any
     """
-    return _get_weather_forecast(city, days)
+    return run_sync(_get_weather_forecast(city, days))
+
+
+# Async implementations run on the agent's event loop; the sync ones are for direct calls
+get_current_weather = StructuredTool.from_function(
+    func=_current_weather,
+    coroutine=_get_current_weather,
+    name="get_current_weather",
+    description=_current_weather.__doc__
+)
+
+get_weather_forecast = StructuredTool.from_function(
+    func=_weather_forecast,
+    coroutine=_get_weather_forecast,
+    name="get_weather_forecast",
+    description=_weather_forecast.__doc__
+)
+
+
+def _weather_batch(cities: List[str], days: int = 3) -> dict:
+    """Get weather forecasts for several cities at once, e.g. to compare travel destinations
+    
+    Prefer this over calling get_weather_forecast once per city.
+    
+    Args:
+        cities: Names of the cities to compare (e.g., ["Paris", "Rome", "Madrid"])
+        days: Number of days to forecast for each city (1-14, default: 3)
+        
+    Returns:
+        A table with columns city, date, condition, min_c, max_c, chance_of_rain, precip_mm, max_wind_kph and one row per city per day
+    """
+    return run_sync(_get_weather_batch(cities, days))
+
+
+get_weather_batch = StructuredTool.from_function(
+    func=_weather_batch,
+    coroutine=_get_weather_batch,
+    name="get_weather_batch",
+    description=_weather_batch.__doc__
+)
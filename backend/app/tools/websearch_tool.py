@@ -2,8 +2,12 @@
 import sys
 import os
 import dotenv
-from app.tools import tool
+from typing import List, Union
+from langchain_core.tools import StructuredTool
 from app.config.settings import settings
+from app.tools.search.search_base import SearchResult
+from app.tools.search.search_service import create_search_engine, search_service
+from app.utils.http_client import run_sync
 
 dotenv.load_dotenv()
 
@@ -13,56 +17,135 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 
 class SearchEngineFactory:
     """搜索引擎工厂类"""
-    
+
     @staticmethod
     def create_search_engine() -> object:
         """根据配置创建搜索引擎实例
-        
+
         Returns:
             搜索引擎实例
         """
-        provider = settings.SEARCH_PROVIDER.lower()
-        
-        if provider == "tavily":
-            from app.tools.search.tavily_search import TavilySearch
-            return TavilySearch()
-        elif provider == "serpapi":
-            from app.tools.search.serpapi_search import SerpAPISearch
-            return SerpAPISearch()
-        elif provider == "serper":
-            from app.tools.search.serper_search import SerperSearch
-            return SerperSearch()
-        else:
-            raise ValueError(f"Unsupported search provider: {provider}")
+        return create_search_engine(settings.SEARCH_PROVIDER.lower())
+
+
+def _websearch(query: str) -> str:
+    """Search the web for information using the configured search provider.
+
+    Args:
+        query: The search query string
+
+    Returns:
+        Search results as a string
+    """
+    # 同步调用：使用缓存，未命中时直接请求
+    try:
+        return search_service.search_sync(query)
+    except Exception as e:
+        # 失败不写入缓存，下次调用重新请求
+        return f"Error during search: {e or type(e).__name__}"
 
 
-@tool
-def websearch(query: str) -> str:
+async def _awebsearch(query: str) -> str:
     """Search the web for information using the configured search provider.
-    
+
     Args:
         query: The search query string
-        
+
     Returns:
         Search results as a string
     """
-    # 创建搜索引擎实例
-    search_engine = SearchEngineFactory.create_search_engine()
-    
-    # 执行搜索并返回结果
-    return search_engine.search(query)
+    # 异步调用：使用缓存和共享连接池，合并相同查询的并发请求
+    try:
+        return await search_service.search(query)
+    except Exception as e:
+        # 失败不写入缓存，下次调用重新请求
+        return f"Error during search: {e or type(e).__name__}"
+
+
+# 同时提供同步和异步实现，智能体以异步方式调用时不占用线程
+websearch = StructuredTool.from_function(
+    func=_websearch,
+    coroutine=_awebsearch,
+    name="websearch",
+    parse_docstring=True
+)
+
+
+# 批量搜索每个查询输出的结果条数和摘要长度，保持输出紧凑
+BATCH_RESULTS_PER_QUERY = 3
+BATCH_SNIPPET_LENGTH = 200
+
+
+def format_batch_results(queries: List[str], outcomes: List[Union[List[SearchResult], BaseException]], skipped: int = 0) -> str:
+    """按查询分组输出批量搜索结果"""
+    sections = []
+    for i, (query, outcome) in enumerate(zip(queries, outcomes), 1):
+        lines = [f"[{i}] {query}"]
+        if isinstance(outcome, BaseException):
+            lines.append(f"- Error during search: {outcome or type(outcome).__name__}")
+        elif not outcome:
+            lines.append("- No search results found.")
+        else:
+            for result in outcome[:BATCH_RESULTS_PER_QUERY]:
+                snippet = " ".join(result.snippet.split())[:BATCH_SNIPPET_LENGTH]
+                lines.append(f"- {result.title} | {result.url}\n  {snippet}")
+        sections.append("\n".join(lines))
+    if skipped:
+        sections.append(f"({skipped} more queries were not searched, at most {settings.SEARCH_BATCH_MAX_QUERIES} per call)")
+    return "\n\n".join(sections)
+
+
+async def _awebsearch_batch(queries: List[str]) -> str:
+    """Search the web for several queries at once and return the results grouped per query.
+
+    Use this instead of repeated websearch calls when a plan needs evidence for several questions.
+
+    Args:
+        queries: The search query strings, one per question
+
+    Returns:
+        Search results grouped per query
+    """
+    # 去掉空查询，超出上限的查询不执行
+    queries = [query for query in queries if query.strip()]
+    limit = settings.SEARCH_BATCH_MAX_QUERIES
+    batch, skipped = queries[:limit], len(queries[limit:])
+    outcomes = await search_service.search_many(batch)
+    return format_batch_results(batch, outcomes, skipped)
+
+
+def _websearch_batch(queries: List[str]) -> str:
+    """Search the web for several queries at once and return the results grouped per query.
+
+    Use this instead of repeated websearch calls when a plan needs evidence for several questions.
+
+    Args:
+        queries: The search query strings, one per question
+
+    Returns:
+        Search results grouped per query
+    """
+    return run_sync(_awebsearch_batch(queries))
+
+
+websearch_batch = StructuredTool.from_function(
+    func=_websearch_batch,
+    coroutine=_awebsearch_batch,
+    name="websearch_batch",
+    parse_docstring=True
+)
 
 
 if __name__ == "__main__":
     import asyncio
-    
+
     async def test_websearch():
         # Test the websearch tool directly (bypassing the decorator)
         search_engine = SearchEngineFactory.create_search_engine()
-        
+
         # Search and get results
-        results = search_engine.search("What is the capital of France?")
-        
+        results = await search_engine.asearch("What is the capital of France?")
+
         print(results)
-    
+
     asyncio.run(test_websearch())
@@ -0,0 +1,119 @@
+"""
+异步TTL缓存
+
+按TTL过期、超出容量时按LRU淘汰，并合并相同键的并发加载：同一个键正在加载时，
+后来的调用等待同一个加载任务，而不是重复请求。加载在独立任务中执行，
+某个调用方被取消不影响其他等待者；加载失败不缓存。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# get()未命中时返回
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    """缓存的累计统计"""
+    hits: int = 0
+    misses: int = 0
+    # 等待同一个键正在进行的加载的次数
+    coalesced: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class AsyncTTLCache:
+    """带TTL和LRU淘汰、合并并发加载的异步缓存"""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600.0):
+        """
+        Args:
+            maxsize: 最多缓存的条目数，0表示不缓存(仍合并并发加载)
+            ttl: 条目的有效期(秒)，0表示不缓存
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        # key -> (过期时间, 值)，最近使用的在末尾
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        """返回缓存的值，未命中或已过期时返回MISSING"""
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.stats.expirations += 1
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def inflight(self, key: Hashable) -> Optional[asyncio.Task]:
+        """返回该键正在进行的加载任务，没有时返回None"""
+        return self._inflight.get(key)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """返回缓存的值，未命中时调用loader加载并缓存"""
+        value = self.get(key)
+        if value is not MISSING:
+            self.stats.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats.coalesced += 1
+        else:
+            self.stats.misses += 1
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._loaded(key, t, ttl))
+        # 调用方被取消时不取消共享的加载任务
+        return await asyncio.shield(task)
+
+    def _loaded(self, key: Hashable, task: asyncio.Task, ttl: Optional[float]) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.stats.errors += 1
+            return
+        self.set(key, task.result(), ttl)
+
+    def stats_dict(self) -> Dict[str, Any]:
+        return {**self.stats.to_dict(), "size": len(self._data), "inflight": len(self._inflight)}
@@ -0,0 +1,53 @@
+"""
+共享的异步HTTP连接池
+
+工具的网络请求复用同一个httpx.AsyncClient，保持长连接，避免每次调用都新建连接和TLS握手。
+客户端与创建它的事件循环绑定，事件循环变化时(如脚本中多次asyncio.run)重新创建。
+"""
+
+import asyncio
+from typing import Any, Awaitable, Optional
+
+import httpx
+
+from app.config.settings import settings
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环的共享HTTP客户端"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT),
+            follow_redirects=True
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    """关闭共享HTTP客户端，释放连接"""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """在临时事件循环中执行协程，供工具的同步调用使用，结束后关闭该循环的HTTP客户端"""
+    async def run() -> Any:
+        try:
+            return await coro
+        finally:
+            await close_http_client()
+
+    return asyncio.run(run())
@@ -0,0 +1,74 @@
+"""
+延迟直方图
+
+按对数分桶统计请求延迟，用于估计分位数(如p95)。样本数达到上限时所有计数减半，
+使统计逐渐偏向最近的请求，延迟变化后分位数随之更新。
+"""
+
+import bisect
+from typing import Any, Dict, List
+
+# 分桶上界(秒)：5ms起每档乘以1.25，到约60秒，超出的计入最后一个溢出桶
+BUCKET_BOUNDS: List[float] = []
+_bound = 0.005
+while _bound < 60.0:
+    BUCKET_BOUNDS.append(round(_bound, 6))
+    _bound *= 1.25
+
+
+class LatencyHistogram:
+    """请求延迟和错误率的衰减直方图"""
+
+    def __init__(self, max_samples: int = 1000):
+        """
+        Args:
+            max_samples: 计数达到该值时所有计数减半
+        """
+        self.max_samples = max_samples
+        self.buckets = [0.0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0.0
+        self.errors = 0.0
+        # 累计值，不衰减
+        self.total = 0
+        self.total_errors = 0
+
+    def record(self, seconds: float, error: bool = False) -> None:
+        """记录一次请求的耗时，失败的请求同时计入错误率"""
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += 1
+        if error:
+            self.errors += 1
+            self.total_errors += 1
+        if self.count >= self.max_samples:
+            self.buckets = [n / 2 for n in self.buckets]
+            self.count /= 2
+            self.errors /= 2
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """估计分位数(秒)，在所在桶内线性插值；没有样本时返回0"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0.0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= target:
+                lower = BUCKET_BOUNDS[i - 1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else BUCKET_BOUNDS[-1]
+                return lower + (upper - lower) * (target - seen) / n
+            seen += n
+        return BUCKET_BOUNDS[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.total,
+            "errors": self.total_errors,
+            "error_rate": round(self.error_rate, 4),
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "p99": round(self.quantile(0.99), 4),
+        }
@@ -0,0 +1,46 @@
+"""
+异步速率限制
+
+令牌桶：每秒补充rate个令牌，最多积累burst个，每次请求消耗一个，
+令牌不足时等待，使请求速率不超过上游API的限额。
+"""
+
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """令牌桶速率限制器"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: 每秒允许的请求数，0表示不限制
+            burst: 空闲后允许连续发出的请求数
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._loop = None
+
+    async def acquire(self) -> None:
+        """等待直到可以发出一个请求"""
+        if self.rate <= 0:
+            return
+        # 锁与事件循环绑定，事件循环变化时(如同步调用的临时事件循环)重新创建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        # 按到达顺序排队，等待中的请求不会被后来者插队
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 1.0
+                self._updated = time.monotonic()
+            self._tokens -= 1
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Calculator expression micro-benchmark
+
+before: the str.replace rewriting followed by eval on every call, as the
+        calculator tool did before the expression engine
+after:  app.tools.calculator.expression, compiled once per expression text
+        (LRU cache) and evaluated as closures
+
+Three workloads are timed:
+- distinct: every expression seen for the first time (cold compile)
+- repeated: a small set of expressions evaluated over and over (cache hits)
+- formula:  one formula with variables evaluated over many inputs; the old
+            path has no variables, so the values are substituted into the text
+
+The batch section evaluates the formula over --batch-size inputs one call at a
+time, with the per-element batch fallback and vectorized with NumPy (when
+installed), and checks that all three agree.
+
+Expressions the old rewriting gets right are checked to give the same results.
+Expressions it breaks (names containing "e", such as sec, ceil or exp) are listed.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_calculator [--calls 20000] [--batch-size 10000]
+"""
+
+import argparse
+import math
+import random
+import time
+
+from app.tools.calculator import batch as batch_engine
+from app.tools.calculator import expression as engine
+
+EXPRESSIONS = [
+    "2 + 3 * 4",
+    "sqrt(16) + 2 ^ 10",
+    "(5 + 3) ^ 2 / 7",
+    "sin(pi / 6) + cos(pi / 3)",
+    "log(1000) / ln(10)",
+    "tan(0.5) * 3 - 1",
+    "((1 + 2) * (3 + 4)) / (5 - 6 * 7)",
+    "1.5e3 * 2 - 17 % 5",
+    "e ^ 2",
+    "sec(0.3) + ceil(2.4)",
+    "exp(1) * factorial(5)",
+]
+FORMULA = "p * (1 + r / 12) ^ (12 * n)"
+
+
+def legacy_calculate(expression):
+    """calculator before the expression engine"""
+    expr = expression.replace('^', '**')
+    expr = expr.replace('sqrt(', 'math.sqrt(')
+    expr = expr.replace('sin(', 'math.sin(')
+    expr = expr.replace('cos(', 'math.cos(')
+    expr = expr.replace('tan(', 'math.tan(')
+    expr = expr.replace('log(', 'math.log(')
+    expr = expr.replace('ln(', 'math.log(')
+    expr = expr.replace('pi', 'math.pi')
+    expr = expr.replace('e', 'math.e')
+    return eval(expr, {"math": math})
+
+
+def legacy_or_error(expression):
+    try:
+        return legacy_calculate(expression)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+def distinct_workload(expressions, calls):
+    # Vary a constant so every expression text is new
+    return [f"{random.choice(expressions)} + {i}" for i in range(calls)]
+
+
+def timed(fn, items, repeat):
+    best = None
+    for _ in range(repeat):
+        engine.compile_expression.cache_clear()
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_batch(args) -> None:
+    size = args.batch_size
+    columns = {
+        "p": [random.uniform(1000, 100000) for _ in range(size)],
+        "r": [random.uniform(0.01, 0.1) for _ in range(size)],
+        "n": [float(random.randint(1, 30)) for _ in range(size)],
+    }
+    compiled = engine.compile_expression(FORMULA)
+    fixed, columns, count = batch_engine._bindings(columns, {}, False)
+
+    def per_call():
+        return [engine.evaluate(FORMULA, {name: values[i] for name, values in columns.items()}) for i in range(count)]
+
+    runs = [
+        ("per call", per_call),
+        ("python", lambda: batch_engine._evaluate_python(compiled, fixed, columns, count).results),
+    ]
+    if batch_engine.np is not None:
+        runs.append(("numpy", lambda: batch_engine._evaluate_numpy(FORMULA, fixed, columns, count).results))
+
+    print(f"\nbatch of {size} bindings (best of {args.repeat}, backend: {batch_engine.BACKEND})")
+    print(f"{'':10}{'total ms':>12}{'speedup':>10}")
+    baseline = None
+    expected = None
+    for label, fn in runs:
+        elapsed, results = best_of(fn, args.repeat)
+        if expected is None:
+            baseline, expected = elapsed, results
+        assert all(math.isclose(a, b, rel_tol=1e-9) for a, b in zip(results, expected)), label
+        print(f"{label:10}{elapsed * 1e3:>12.2f}{baseline / elapsed:>9.1f}x")
+
+
+def main(args) -> None:
+    random.seed(7)
+    correct = [expr for expr in EXPRESSIONS if "e" not in expr.replace("pi", "").replace("sqrt", "")]
+    for expr in correct:
+        assert math.isclose(legacy_calculate(expr), engine.evaluate(expr)), expr
+    broken = [expr for expr in EXPRESSIONS if expr not in correct]
+
+    inputs = [
+        {"p": random.uniform(1000, 100000), "r": random.uniform(0.01, 0.1), "n": random.randint(1, 30)}
+        for _ in range(args.calls)
+    ]
+    substituted = [
+        FORMULA.replace("p", repr(v["p"])).replace("r", repr(v["r"])).replace("n", repr(v["n"]))
+        for v in inputs
+    ]
+    for text, values in zip(substituted[:100], inputs):
+        assert math.isclose(legacy_calculate(text), engine.evaluate(FORMULA, values))
+
+    distinct = distinct_workload(correct, args.calls)
+    repeated = [random.choice(correct) for _ in range(args.calls)]
+    formula = engine.compile_expression(FORMULA)
+
+    workloads = [
+        ("distinct", distinct, legacy_calculate, engine.evaluate),
+        ("repeated", repeated, legacy_calculate, engine.evaluate),
+        ("formula", list(zip(substituted, inputs)),
+         lambda item: legacy_calculate(item[0]), lambda item: engine.evaluate(FORMULA, item[1])),
+        ("compiled", inputs, None, formula.evaluate),
+    ]
+
+    print(f"{args.calls} calls per workload (best of {args.repeat})")
+    print(f"{'':10}{'before us':>12}{'after us':>12}{'speedup':>10}")
+    for label, items, before, after in workloads:
+        new_time = timed(after, items, args.repeat)
+        if before is None:
+            print(f"{label:10}{'':>12}{new_time / len(items) * 1e6:>12.2f}")
+            continue
+        old_time = timed(before, items, args.repeat)
+        print(f"{label:10}{old_time / len(items) * 1e6:>12.2f}{new_time / len(items) * 1e6:>12.2f}"
+              f"{old_time / new_time:>9.1f}x")
+
+    print("\nexpressions the old rewriting gets wrong:")
+    for expr in broken:
+        print(f"  {expr!r}: before={legacy_or_error(expr)!r} after={engine.evaluate(expr)!r}")
+
+    bench_batch(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Checkpoint size and resume latency benchmark for long threads
+
+Simulates a long write_todos loop on one thread: every step appends a
+message, rewrites the todo list and leaves a large files channel unchanged,
+then stores the step checkpoint. Measures the checkpoints.db size, the time
+to load the latest checkpoint (resume) and write throughput.
+
+Compares the plain tuned saver (full checkpoint per step, no compression,
+all checkpoints kept) with the compact saver (delta-encoded channels,
+zlib/zstd compression, keep latest N), and checks that both return the same
+latest state.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_checkpoint_size [--steps 300] [--keep 20] [--prune-interval 10] [--compression zlib]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from app.agent.compact_checkpoint import CompactSqliteSaver, CompressedSerializer
+from app.agent.sqlite_connection import SqliteConfig, TunedSqliteSaver, connect
+
+
+def step_values(step: int, messages: list, files: dict) -> dict:
+    messages.append(
+        HumanMessage(content=f"continue with step {step}") if step % 2 == 0
+        else AIMessage(content=f"step {step} done. " + "Observed output line. " * 40)
+    )
+    todos = [
+        {"content": f"task {i}", "status": "completed" if i < step % 10 else "pending"}
+        for i in range(10)
+    ]
+    return {"messages": list(messages), "todos": todos, "files": files}
+
+
+async def run_thread(saver, steps: int) -> float:
+    """Write one checkpoint per step and return writes per second"""
+    config = {"configurable": {"thread_id": "long-thread", "checkpoint_ns": ""}}
+    files = {f"/notes/file-{i}.md": {"content": ["line of notes " * 8] * 40} for i in range(5)}
+    messages = []
+    versions = {}
+    start = time.perf_counter()
+    for step in range(steps):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = step_values(step, messages, files)
+        changed = ["messages", "todos"] if step else ["messages", "todos", "files"]
+        new_versions = {channel: saver.get_next_version(versions.get(channel), None) for channel in changed}
+        versions.update(new_versions)
+        checkpoint["channel_versions"] = dict(versions)
+        config = await saver.aput(config, checkpoint, {"step": step, "source": "loop"}, new_versions)
+    await saver.aflush()
+    return steps / (time.perf_counter() - start)
+
+
+async def resume_latency(saver, repeat: int = 50):
+    config = {"configurable": {"thread_id": "long-thread", "checkpoint_ns": ""}}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await saver.aget_tuple(config)
+    return (time.perf_counter() - start) / repeat * 1000, result.checkpoint["channel_values"]
+
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+async def measure(path: str, saver_factory, steps: int):
+    conn = await connect(path, SqliteConfig.from_settings(), isolation_level="DEFERRED")
+    saver = saver_factory(conn)
+    await saver.setup()
+    try:
+        throughput = await run_thread(saver, steps)
+        latency, values = await resume_latency(saver)
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return throughput, latency, file_size(path), values
+    finally:
+        await saver.aclose()
+
+
+async def main(args) -> None:
+    directory = tempfile.mkdtemp(prefix="opengigi-bench-")
+    config = SqliteConfig.from_settings()
+    before = await measure(
+        os.path.join(directory, "before.db"),
+        lambda conn: TunedSqliteSaver(conn, config=config),
+        args.steps
+    )
+    after = await measure(
+        os.path.join(directory, "after.db"),
+        lambda conn: CompactSqliteSaver(
+            conn, config=config, delta_encoding=True, keep_last=args.keep, prune_interval=args.prune_interval,
+            serde=CompressedSerializer(algorithm=args.compression)
+        ),
+        args.steps
+    )
+    assert before[3] == after[3], "compact saver returned a different latest state"
+
+    print(f"{args.steps} steps on one thread (keep latest {args.keep}, prune every {args.prune_interval} writes, "
+          f"{args.compression} compression)")
+    print(f"{'':8}{'db size':>14}{'resume ms':>12}{'steps/s':>10}")
+    for label, (throughput, latency, size, _) in (("before", before), ("after", after)):
+        print(f"{label:8}{size / 1024:>11.0f} KiB{latency:>12.2f}{throughput:>10.0f}")
+    print(f"size: {before[2] / after[2]:.1f}x smaller, resume: {before[1] / after[1]:.2f}x faster, "
+          f"writes: {after[0] / before[0]:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--keep", type=int, default=20)
+    parser.add_argument("--prune-interval", type=int, default=10)
+    parser.add_argument("--compression", choices=["zlib", "zstd"], default="zlib")
+    asyncio.run(main(parser.parse_args()))
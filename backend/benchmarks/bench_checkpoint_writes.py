@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Checkpoint write throughput benchmark
+
+Simulates agent steps against checkpoints.db: every step stores the pending
+writes of a few tasks (aput_writes) and then the step checkpoint (aput) with
+a message list that grows along the thread. Several threads run
+concurrently on one saver, as they do in the API process.
+
+Compares the previous setup (default aiosqlite connection + AsyncSqliteSaver,
+one commit per aput_writes and per aput) with the tuned connection layer
+(WAL, synchronous=NORMAL, mmap/cache/busy_timeout, commits grouped per step).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_checkpoint_writes [--threads 8] [--steps 50] [--tasks 2]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import aiosqlite
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from app.agent.sqlite_connection import SqliteConfig, TunedSqliteSaver, connect
+
+
+async def run_steps(saver, thread_id: str, steps: int, tasks: int) -> int:
+    """Write steps * (tasks + 1) checkpoint rows for one thread"""
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    config = await saver.aput(config, empty_checkpoint(), {"step": -1, "source": "input"}, {})
+    messages = []
+    writes = 0
+    for step in range(steps):
+        messages.append({"role": "ai", "content": f"step {step} " + "x" * 400})
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": list(messages), "todos": [{"content": "t", "status": "pending"}]}
+        checkpoint["channel_versions"] = {"messages": step + 1, "todos": step + 1}
+        for task in range(tasks):
+            await saver.aput_writes(config, [("messages", messages[-1])], task_id=f"task-{step}-{task}")
+            writes += 1
+        config = await saver.aput(config, checkpoint, {"step": step, "source": "loop"}, {"messages": step + 1})
+        writes += 1
+    return writes
+
+
+async def measure(saver, threads: int, steps: int, tasks: int) -> float:
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(run_steps(saver, f"thread-{i}", steps, tasks) for i in range(threads)))
+    if hasattr(saver, "aflush"):
+        await saver.aflush()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed
+
+
+async def baseline(path: str, args) -> float:
+    conn = await aiosqlite.connect(path, check_same_thread=False)
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    try:
+        return await measure(saver, args.threads, args.steps, args.tasks)
+    finally:
+        await conn.close()
+
+
+async def tuned(path: str, args) -> float:
+    config = SqliteConfig.from_settings()
+    conn = await connect(path, config, isolation_level="DEFERRED")
+    saver = TunedSqliteSaver(conn, config=config)
+    await saver.setup()
+    try:
+        return await measure(saver, args.threads, args.steps, args.tasks)
+    finally:
+        await saver.aclose()
+
+
+async def main(args) -> None:
+    directory = tempfile.mkdtemp(prefix="opengigi-bench-")
+    before = await baseline(os.path.join(directory, "before.db"), args)
+    after = await tuned(os.path.join(directory, "after.db"), args)
+    total = args.threads * args.steps * (args.tasks + 1)
+    print(f"{args.threads} threads x {args.steps} steps x ({args.tasks} task writes + 1 checkpoint) = {total} writes")
+    print(f"before (default connection, commit per write): {before:10.1f} writes/s")
+    print(f"after  (tuned connection, commit per step):    {after:10.1f} writes/s")
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Stream chunk serialization micro-benchmark
+
+Replays chunks shaped like the ones astream produces for a deep agent run
+(stream_mode="messages" token tuples with LangGraph metadata, and
+stream_mode="updates" node outputs with AI messages, tool calls, tool results
+and todo lists) through the legacy encoder path and reports microseconds per
+chunk.
+
+before: the recursive hasattr-probing ensure_serializable followed by
+        json.dumps
+after:  serialization.to_jsonable with cached type dispatch and a single dump
+        (orjson when installed)
+
+Both paths are checked to produce the same JSON values.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_serialization [--chunks 20000]
+    STREAM_JSON_BACKEND=json python -m benchmarks.bench_serialization
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+from app.agent import serialization, stream_processor
+
+
+def legacy_ensure_serializable(obj):
+    """ensure_serializable as it was before the type-dispatch encoder"""
+    if obj is None:
+        return None
+    elif isinstance(obj, (str, int, float, bool)):
+        return obj
+    elif isinstance(obj, dict):
+        return {k: legacy_ensure_serializable(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_ensure_serializable(item) for item in obj]
+    elif hasattr(obj, '__dict__'):
+        try:
+            return legacy_ensure_serializable(obj.__dict__)
+        except Exception:
+            return str(obj)
+    elif hasattr(obj, 'dict'):
+        try:
+            return legacy_ensure_serializable(obj.dict())
+        except Exception:
+            return str(obj)
+    elif hasattr(obj, 'asdict'):
+        try:
+            return legacy_ensure_serializable(obj.asdict())
+        except Exception:
+            return str(obj)
+    else:
+        return str(obj)
+
+
+METADATA = {
+    "lc_agent_name": "autonomous-agent",
+    "thread_id": "bench-thread",
+    "user_id": "user1",
+    "langgraph_step": 3,
+    "langgraph_node": "model",
+    "langgraph_triggers": ("branch:to:model",),
+    "langgraph_path": ("__pregel_pull", "model"),
+    "langgraph_checkpoint_ns": "model:1f0b7c6e-0000-0000-0000-000000000000",
+    "checkpoint_ns": "model:1f0b7c6e-0000-0000-0000-000000000000",
+    "ls_provider": "openai",
+    "ls_model_name": "doubao-seed",
+    "ls_model_type": "chat",
+    "ls_temperature": 0.3,
+}
+WORDS = ["the", " agent", " searched", " for", " weather", " in", " Beijing", ",", " 天气", "晴朗", "，", " 25", "°C", "."]
+
+
+def make_chunks(count: int):
+    """Mix of 90% message tokens and 10% node updates, as in a typical run"""
+    rng = random.Random(7)
+    todos = [{"content": f"task {i}", "status": "pending"} for i in range(8)]
+    history = [HumanMessage(content="北京明天天气怎么样？", id="h-1")]
+    chunks = []
+    for i in range(count):
+        namespace = () if i % 3 else ("task:5c1f2a",)
+        if i % 10:
+            token = AIMessageChunk(content=rng.choice(WORDS), id="run--bench-message")
+            chunks.append(("messages", namespace, (token, METADATA)))
+        elif i % 20:
+            call = AIMessage(
+                content="",
+                id=f"ai-{i}",
+                tool_calls=[{"name": "get_weather", "args": {"city": "Beijing", "days": 3}, "id": f"call-{i}"}],
+                response_metadata={"model_name": "doubao-seed", "finish_reason": "tool_calls"},
+                usage_metadata={"input_tokens": 1200, "output_tokens": 40, "total_tokens": 1240},
+            )
+            chunks.append(("updates", namespace, {"model": {"messages": history + [call], "todos": todos}}))
+        else:
+            result = ToolMessage(content='{"city": "Beijing", "forecast": ["晴", "多云", "小雨"]}' * 4,
+                                 tool_call_id=f"call-{i}", name="get_weather", id=f"tool-{i}")
+            chunks.append(("updates", namespace, {"tools": {"messages": [result]}}))
+    return chunks
+
+
+async def results_for(chunks):
+    """Run the message processors once so both paths serialize the same results"""
+    results = []
+    for mode, namespace, chunk in chunks:
+        if mode == "messages":
+            async for result in stream_processor.process_message_chunk(namespace, chunk):
+                results.append(result)
+        else:
+            results.append(stream_processor.process_update_chunk(namespace, chunk))
+    return results
+
+
+def before(results):
+    events = []
+    for result in results:
+        result = legacy_ensure_serializable(result)
+        events.append(f"data: {json.dumps(result)}\n\n")
+    return events
+
+
+def after(results):
+    return [f"data: {serialization.encode(result)}\n\n" for result in results]
+
+
+def timed(fn, results, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = fn(results)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, events
+
+
+async def main(args) -> None:
+    results = await results_for(make_chunks(args.chunks))
+    old_time, old_events = timed(before, results, args.repeat)
+    new_time, new_events = timed(after, results, args.repeat)
+    for old, new in zip(old_events, new_events):
+        assert json.loads(old[6:]) == json.loads(new[6:]), "encoders disagree"
+
+    print(f"{len(results)} chunks ({serialization.JSON_BACKEND} backend, best of {args.repeat})")
+    print(f"{'':8}{'us/chunk':>10}{'bytes':>14}")
+    for label, elapsed, events in (("before", old_time, old_events), ("after", new_time, new_events)):
+        size = sum(len(event.encode("utf-8")) for event in events)
+        print(f"{label:8}{elapsed / len(results) * 1e6:>10.1f}{size:>14,}")
+    print(f"{old_time / new_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+SSE protocol benchmark: bytes and CPU per streamed answer
+
+Feeds a synthetic answer of N tokens (default 10k, mixed English and Chinese
+text) through the stream encoders exactly as run_async does in
+stream_mode="messages", with LangGraph-style metadata on every token, and
+reports the bytes put on the wire and the CPU time spent encoding.
+
+legacy:  every token as a full "data:" chunk plus a message_delta event
+         carrying accumulated_content (quadratic in answer length)
+compact: protocol v2 delta events with sequence numbers and periodic
+         snapshots
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_stream_protocol [--tokens 10000] [--snapshot-interval 1000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from langchain_core.messages import AIMessageChunk
+
+from app.agent.stream_protocol import CompactStreamEncoder, LegacyStreamEncoder
+
+WORDS = ["the", " agent", " searched", " for", " weather", " in", " Beijing", ",", " 天气", "晴朗", "，", "温度",
+         " 25", "°C", ".", "\n", " 结果", "显示", " tool", " calls", " returned", " data"]
+
+
+def make_tokens(count: int):
+    rng = random.Random(42)
+    metadata = {
+        "lc_agent_name": "autonomous-agent",
+        "thread_id": "bench-thread",
+        "user_id": "user1",
+        "langgraph_step": 3,
+        "langgraph_node": "model",
+        "langgraph_triggers": ("branch:to:model",),
+        "langgraph_path": ("__pregel_pull", "model"),
+        "langgraph_checkpoint_ns": "model:1f0b7c6e-0000-0000-0000-000000000000",
+        "checkpoint_ns": "model:1f0b7c6e-0000-0000-0000-000000000000",
+        "ls_provider": "openai",
+        "ls_model_name": "doubao-seed",
+        "ls_model_type": "chat",
+        "ls_temperature": 0.3,
+    }
+    return [(AIMessageChunk(content=rng.choice(WORDS), id="run--bench-message"), metadata) for _ in range(count)]
+
+
+async def measure(encoder, tokens) -> tuple:
+    start = time.process_time()
+    total = 0
+    events = 0
+    for event in encoder.start("bench-thread"):
+        total += len(event.encode("utf-8"))
+        events += 1
+    for chunk in tokens:
+        for event in await encoder.encode("messages", (), chunk):
+            total += len(event.encode("utf-8"))
+            events += 1
+    for event in encoder.finish():
+        total += len(event.encode("utf-8"))
+        events += 1
+    return total, time.process_time() - start, events
+
+
+async def main(args) -> None:
+    tokens = make_tokens(args.tokens)
+    legacy = await measure(LegacyStreamEncoder(), tokens)
+    compact = await measure(CompactStreamEncoder(snapshot_interval=args.snapshot_interval), tokens)
+
+    print(f"{args.tokens} token answer (snapshot every {args.snapshot_interval} deltas)")
+    print(f"{'':9}{'events':>8}{'bytes':>14}{'bytes/token':>13}{'CPU s':>9}")
+    for label, (size, cpu, events) in (("legacy", legacy), ("compact", compact)):
+        print(f"{label:9}{events:>8}{size:>14,}{size / args.tokens:>13.1f}{cpu:>9.3f}")
+    print(f"bytes: {legacy[0] / compact[0]:.1f}x fewer, CPU: {legacy[1] / compact[1]:.1f}x less")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=10000)
+    parser.add_argument("--snapshot-interval", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Check MemoryMiddleware isolation under concurrent runs
+
+Runs N parallel run_async calls against a single AutonomousAgent, each on its
+own user and thread, and verifies that no saved history crosses threads.
+The LLM is replaced by a local echo model and MCP servers are not started,
+so the check runs offline against a temporary database directory.
+
+Usage:
+    python check_memory_isolation.py [N]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class EchoModel(GenericFakeChatModel):
+    """Fake chat model that echoes the last human message after a random delay"""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        last = [m for m in messages if m.type == "human"][-1].content
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"echo:{last}"))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(random.uniform(0, 0.05))
+        return self._generate(messages, stop=stop)
+
+
+async def main(n: int) -> int:
+    from app.agent.agent import AutonomousAgent
+    from app.tools.registry import ToolRegistry
+
+    async def skip_mcp(self):
+        pass
+
+    ToolRegistry.load_mcp_tools = skip_mcp
+
+    agent = AutonomousAgent()
+    agent.llm = EchoModel(messages=iter([]))
+    await agent.start_up()
+
+    async def run_one(i: int) -> None:
+        async for _ in agent.run_async(f"goal-{i}", session_id=f"thread-{i}", user_id=f"user-{i}"):
+            pass
+
+    try:
+        await asyncio.gather(*(run_one(i) for i in range(n)))
+
+        failures = []
+        for i in range(n):
+            thread = await agent.get_thread_history(f"user-{i}", f"thread-{i}")
+            contents = [m["content"] for m in thread["messages"]] if thread else []
+            if contents != [f"goal-{i}", f"echo:goal-{i}"]:
+                failures.append((i, contents))
+    finally:
+        await agent.shutdown()
+
+    if failures:
+        for i, contents in failures:
+            print(f"FAIL thread-{i}: {contents}")
+        print(f"{len(failures)}/{n} threads have crossed or missing history")
+        return 1
+    print(f"OK: {n} concurrent threads saved with isolated history")
+    return 0
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="opengigi-check-"))
+    sys.exit(asyncio.run(main(count)))
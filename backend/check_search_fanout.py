@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Check multi-provider search fan-out against local stub providers
+
+Runs CompositeSearch over in-process stub providers with configurable latency
+and failure rates, and verifies that:
+- hedged requests cut the tail latency of a provider with a slow tail
+- a failing provider falls over to the next one
+- results of several providers are deduplicated by URL and rank-fused
+- latency histograms move a slow provider to the back of the routing order
+
+No API keys or network access are needed.
+
+Usage:
+    python check_search_fanout.py [N]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+
+def make_stub(name, latency, slow_rate=0.0, slow_latency=0.0, fail_rate=0.0, urls=None):
+    from app.tools.search.search_base import SearchEngine, SearchResult, format_results
+
+    class StubSearch(SearchEngine):
+        """Stub provider that sleeps for a random latency before answering"""
+
+        provider = name
+
+        def search(self, query):
+            return format_results(asyncio.run(self.aresults(query)))
+
+        async def aresults(self, query):
+            delay = slow_latency if random.random() < slow_rate else latency * random.uniform(0.8, 1.2)
+            await asyncio.sleep(delay)
+            if random.random() < fail_rate:
+                raise RuntimeError(f"{name} failed")
+            return [
+                SearchResult(title=f"{name} {url}", url=url, snippet=query, provider=name)
+                for url in (urls or [f"https://{name}.example/{query}"])
+            ]
+
+    return StubSearch()
+
+
+async def timed(engine, query):
+    start = time.monotonic()
+    await engine.aresults(query)
+    return time.monotonic() - start
+
+
+def p99(samples):
+    return statistics.quantiles(samples, n=100)[98]
+
+
+async def check_hedging(n):
+    from app.tools.search.composite_search import CompositeSearch
+
+    def tail():
+        return make_stub("tail", 0.02, slow_rate=0.1, slow_latency=0.5)
+
+    single = CompositeSearch({"tail": tail()}, hedge=False)
+    hedged = CompositeSearch({"tail": tail(), "backup": make_stub("backup", 0.04)}, hedge_delay=0.1)
+    single_samples = [await timed(single, f"q{i}") for i in range(n)]
+    hedged_samples = [await timed(hedged, f"q{i}") for i in range(n)]
+    print(f"  single p99={p99(single_samples):.3f}s  hedged p99={p99(hedged_samples):.3f}s  "
+          f"hedges={hedged.counters['hedges']}")
+    return p99(hedged_samples) < p99(single_samples) / 2
+
+
+async def check_failover():
+    from app.tools.search.composite_search import CompositeSearch
+
+    engine = CompositeSearch({"broken": make_stub("broken", 0.01, fail_rate=1.0), "ok": make_stub("ok", 0.01)})
+    results = await engine.aresults("failover")
+    print(f"  providers={[r.provider for r in results]}  failovers={engine.counters['failovers']}")
+    return [r.provider for r in results] == ["ok"] and engine.counters["failovers"] == 1
+
+
+async def check_fusion():
+    from app.tools.search.composite_search import CompositeSearch
+
+    engine = CompositeSearch({
+        "a": make_stub("a", 0.01, urls=["https://a.example/only", "https://www.shared.example/page/?utm_source=a"]),
+        "b": make_stub("b", 0.01, urls=["http://shared.example/page", "https://b.example/only"]),
+    }, fanout=2)
+    results = await engine.aresults("fusion")
+    print(f"  {[(r.url, r.provider) for r in results]}")
+    return len(results) == 3 and results[0].provider == "a,b"
+
+
+async def check_routing(n):
+    from app.tools.search.composite_search import CompositeSearch
+
+    engine = CompositeSearch({"slow": make_stub("slow", 0.08), "fast": make_stub("fast", 0.01)},
+                             hedge_delay=0.02, min_samples=10)
+    for i in range(n):
+        await engine.aresults(f"q{i}")
+    ranking = engine.stats()["ranking"]
+    print(f"  ranking={ranking}  p95={ {k: v['p95'] for k, v in engine.stats()['providers'].items()} }")
+    return ranking[0] == "fast"
+
+
+async def main(n: int) -> int:
+    checks = [
+        ("hedging", check_hedging(n)),
+        ("failover", check_failover()),
+        ("fusion", check_fusion()),
+        ("routing", check_routing(n)),
+    ]
+    failures = 0
+    for name, check in checks:
+        print(f"{name}:")
+        ok = await check
+        print(f"  {'OK' if ok else 'FAIL'}")
+        failures += not ok
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(asyncio.run(main(count)))